@@ -8,6 +8,7 @@ import os
 import sys
 from config import Config
 from ad_inserter import AdInserter
+from ffmpeg_progress import print_progress
 from utils import generate_timestamped_filename
 
 def safe_input(prompt):
@@ -32,6 +33,7 @@ class AdInserterCLI(object):
     def __init__(self):
         self.config = Config()
         self.ad_inserter = AdInserter(self.config)
+        self.ad_inserter.progress_callback = print_progress
     
     def print_banner(self):
         """打印程序横幅"""
@@ -120,18 +122,20 @@ class AdInserterCLI(object):
         print(u"3. 右下角")
         print(u"4. 左下角")
         print(u"5. 中心位置")
+        print(u"6. 自动选择 (分析画面，避开运动、文字区域)")
         
         positions = {
             1: 'top-right',
             2: 'top-left', 
             3: 'bottom-right',
             4: 'bottom-left',
-            5: 'center'
+            5: 'center',
+            6: 'auto'
         }
         
         while True:
             try:
-                choice = int(safe_input(u"请选择位置 (1-5，默认1): ").strip() or "1")
+                choice = int(safe_input(u"请选择位置 (1-6，默认1): ").strip() or "1")
                 if choice in positions:
                     position = positions[choice]
                     position_names = {
@@ -139,11 +143,12 @@ class AdInserterCLI(object):
                         'top-left': u'左上角',
                         'bottom-right': u'右下角', 
                         'bottom-left': u'左下角',
-                        'center': u'中心位置'
+                        'center': u'中心位置',
+                        'auto': u'自动选择'
                     }
                     print(u"✓ 选择位置: {}".format(position_names[position]))
                     return position
-                print(u"请输入1-5之间的数字")
+                print(u"请输入1-6之间的数字")
             except ValueError:
                 print(u"请输入有效的数字")
     
@@ -215,7 +220,8 @@ class AdInserterCLI(object):
             'top-left': u'左上角',
             'bottom-right': u'右下角',
             'bottom-left': u'左下角',
-            'center': u'中心位置'
+            'center': u'中心位置',
+            'auto': u'自动选择'
         }[config['position']]))
         print(u"广告大小: {:.0%}".format(config['scale']))
         print(u"输出文件: {}".format(config['output_path']))
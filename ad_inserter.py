@@ -8,6 +8,8 @@ import os
 import subprocess
 import json
 from config import Config
+from region_detector import AdPlacementAnalyzer
+from ffmpeg_progress import run_ffmpeg
 
 class AdInserter(object):
     """广告插入器"""
@@ -15,6 +17,9 @@ class AdInserter(object):
     def __init__(self, config=None):
         self.config = config or Config()
         self.ffmpeg_path = 'ffmpeg'  # 使用系统PATH中的ffmpeg
+        # 进度回调：编码过程中每次进度更新时调用 progress_callback(快照)
+        self.progress_callback = None
+        self.stall_timeout = self.config.get('ffmpeg', 'stall_timeout') or 0
     
     def validate_ad_video(self, ad_path):
         """验证广告视频文件"""
@@ -195,6 +200,49 @@ class AdInserter(object):
             'original_height': ad_original_height
         }
     
+    def get_position_coordinates(self, position, main_video_info, ad_dims, margin=20):
+        """根据位置名称计算广告左上角坐标"""
+        main_width = main_video_info['width']
+        main_height = main_video_info['height']
+        if position == 'top-left':
+            return margin, margin
+        elif position == 'bottom-right':
+            return main_width - ad_dims['width'] - margin, main_height - ad_dims['height'] - margin
+        elif position == 'bottom-left':
+            return margin, main_height - ad_dims['height'] - margin
+        elif position == 'center':
+            return (main_width - ad_dims['width']) // 2, (main_height - ad_dims['height']) // 2
+        # 默认右上角
+        return main_width - ad_dims['width'] - margin, margin
+    
+    def choose_auto_position(self, main_video_path, main_video_info, ad_dims, start_time, duration):
+        """
+        分析广告时间窗口内的画面，自动选择干扰最小的角落
+        
+        依据运动强度、边缘密度和文字/台标检测结果打分，无法分析时回退到右上角
+        """
+        candidates = {}
+        for position in ['top-right', 'top-left', 'bottom-right', 'bottom-left']:
+            x, y = self.get_position_coordinates(position, main_video_info, ad_dims)
+            candidates[position] = {'x': x, 'y': y, 'width': ad_dims['width'], 'height': ad_dims['height']}
+        
+        print(u"分析画面，自动选择广告位置...")
+        analyzer = AdPlacementAnalyzer(self.config)
+        best, scores = analyzer.choose_position(
+            main_video_path, main_video_info, candidates, start_time, duration
+        )
+        if not best:
+            print(u"画面分析失败，使用默认位置: top-right")
+            return 'top-right'
+        
+        for position in sorted(scores, key=lambda name: scores[name]['score']):
+            item = scores[position]
+            print(u"  {}: 得分 {:.3f} (运动 {:.3f}, 边缘 {:.3f}, 文字 {:.3f})".format(
+                position, item['score'], item['motion'], item['edges'], item['text']
+            ))
+        print(u"自动选择位置: {}".format(best))
+        return best
+    
     def insert_ad_overlay(self, main_video_path, ad_video_path, output_path, 
                          start_time, duration, position='top-right', scale=0.25):
         """
@@ -206,7 +254,7 @@ class AdInserter(object):
         - output_path: 输出视频路径
         - start_time: 广告开始时间（秒）
         - duration: 广告显示时长（秒）
-        - position: 广告位置 ('top-right', 'top-left', 'bottom-right', 'bottom-left', 'center')
+        - position: 广告位置 ('top-right', 'top-left', 'bottom-right', 'bottom-left', 'center', 'auto')
         - scale: 广告缩放比例（0.1-0.5）
         """
         
@@ -248,19 +296,9 @@ class AdInserter(object):
         ad_dims = self.calculate_ad_dimensions(main_info, ad_info, scale)
         
         # 根据位置参数调整坐标
-        if position == 'top-left':
-            ad_dims['x'] = 20
-            ad_dims['y'] = 20
-        elif position == 'bottom-right':
-            ad_dims['x'] = main_info['width'] - ad_dims['width'] - 20
-            ad_dims['y'] = main_info['height'] - ad_dims['height'] - 20
-        elif position == 'bottom-left':
-            ad_dims['x'] = 20
-            ad_dims['y'] = main_info['height'] - ad_dims['height'] - 20
-        elif position == 'center':
-            ad_dims['x'] = (main_info['width'] - ad_dims['width']) / 2
-            ad_dims['y'] = (main_info['height'] - ad_dims['height']) / 2
-        # top-right 已经是默认位置
+        if position == 'auto':
+            position = self.choose_auto_position(main_video_path, main_info, ad_dims, start_time, duration)
+        ad_dims['x'], ad_dims['y'] = self.get_position_coordinates(position, main_info, ad_dims)
         
         print(u"广告尺寸: {}x{} 位置: ({}, {})".format(
             ad_dims['width'], ad_dims['height'], ad_dims['x'], ad_dims['y']
@@ -325,16 +363,10 @@ class AdInserter(object):
         
         print(u"执行FFmpeg命令...")
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            
-            stdout, stderr = process.communicate()
+            returncode, stderr = run_ffmpeg(cmd, main_info['duration'], self.progress_callback,
+                                            os.path.basename(output_path), stall_timeout=self.stall_timeout)
             
-            if process.returncode == 0:
+            if returncode == 0:
                 print(u"广告插入成功！")
                 return True, output_path
             else:
@@ -411,18 +443,9 @@ class AdInserter(object):
             ad_dims = self.calculate_ad_dimensions(main_info, ad_info, scale)
             
             # 调整位置
-            if position == 'top-left':
-                ad_dims['x'] = 20
-                ad_dims['y'] = 20
-            elif position == 'bottom-right':
-                ad_dims['x'] = main_info['width'] - ad_dims['width'] - 20
-                ad_dims['y'] = main_info['height'] - ad_dims['height'] - 20
-            elif position == 'bottom-left':
-                ad_dims['x'] = 20
-                ad_dims['y'] = main_info['height'] - ad_dims['height'] - 20
-            elif position == 'center':
-                ad_dims['x'] = (main_info['width'] - ad_dims['width']) / 2
-                ad_dims['y'] = (main_info['height'] - ad_dims['height']) / 2
+            if position == 'auto':
+                position = self.choose_auto_position(main_video_path, main_info, ad_dims, start_time, duration)
+            ad_dims['x'], ad_dims['y'] = self.get_position_coordinates(position, main_info, ad_dims)
             
             # 缩放广告（保持原始比例）
             scale_filter = "[{}:v]scale={}:{}:force_original_aspect_ratio=decrease,setpts=PTS-STARTPTS+{}/TB[ad{}_scaled]".format(
@@ -469,16 +492,10 @@ class AdInserter(object):
         
         print(u"执行复杂广告插入...")
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            
-            stdout, stderr = process.communicate()
+            returncode, stderr = run_ffmpeg(cmd, main_info['duration'], self.progress_callback,
+                                            os.path.basename(output_path), stall_timeout=self.stall_timeout)
             
-            if process.returncode == 0:
+            if returncode == 0:
                 print(u"多广告插入成功！")
                 return True, output_path
             else:
@@ -9,6 +9,7 @@ import sys
 import subprocess
 import json
 from config import Config
+from ffmpeg_progress import run_ffmpeg
 
 def safe_print(text):
     """安全的打印函数，处理编码问题"""
@@ -31,6 +32,9 @@ class BackgroundMusicProcessor(object):
         self.config = config or Config()
         self.ffmpeg_path = self.config.get('ffmpeg', 'path') or 'ffmpeg'
         self.ffprobe_path = self.config.get('ffmpeg', 'ffprobe_path') or 'ffprobe'
+        # 进度回调：编码过程中每次进度更新时调用 progress_callback(快照)
+        self.progress_callback = None
+        self.stall_timeout = self.config.get('ffmpeg', 'stall_timeout') or 0
         
     def get_video_info(self, video_path):
         """获取视频信息"""
@@ -305,16 +309,10 @@ class BackgroundMusicProcessor(object):
         
         print(u"执行FFmpeg命令...")
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
+            returncode, stderr = run_ffmpeg(cmd, video_info.get('duration'), self.progress_callback,
+                                            os.path.basename(output_path), stall_timeout=self.stall_timeout)
             
-            stdout, stderr = process.communicate()
-            
-            if process.returncode == 0:
+            if returncode == 0:
                 if os.path.exists(output_path):
                     print(u"背景音乐添加成功！")
                     print(u"输出文件: {}".format(output_path))
@@ -328,7 +326,7 @@ class BackgroundMusicProcessor(object):
                     return False, u"输出文件未生成"
             else:
                 print(u"FFmpeg执行失败:")
-                print(u"返回码: {}".format(process.returncode))
+                print(u"返回码: {}".format(returncode))
                 if stderr:
                     print(u"错误信息: {}".format(stderr[-500:]))  # 只显示最后500字符
                 return False, stderr
@@ -10,7 +10,11 @@ from config import Config, create_default_config
 from video_processor import VideoProcessor
 from ffmpeg_renderer import FFmpegRenderer
 from background_music import BackgroundMusicProcessor
-from utils import generate_timestamped_filename
+from utils import generate_timestamped_filename, format_duration, Timer
+from plan_io import save_plan, load_plan, save_edl
+from cost_model import RenderCostModel, schedule_jobs
+from ffmpeg_progress import print_progress
+from proxy_media import ProxyManager
 
 def safe_print(text):
     """安全的打印函数，处理编码问题"""
@@ -58,7 +62,10 @@ class CLI(object):
         self.config = Config()
         self.processor = VideoProcessor(self.config)
         self.renderer = FFmpegRenderer(self.config)
+        self.cost_model = RenderCostModel(self.config)
         self.music_processor = BackgroundMusicProcessor(self.config)
+        self.renderer.progress_callback = print_progress
+        self.music_processor.progress_callback = print_progress
     
     def print_banner(self):
         """打印程序横幅"""
@@ -196,20 +203,68 @@ class CLI(object):
         print(u"1. 随机混剪 (推荐) - 随机选择片段和时间点")
         print(u"2. 顺序混剪 - 按顺序从每个视频中提取片段")
         print(u"3. 平衡混剪 - 尽量让每个视频贡献相同时长")
+        print(u"4. 约束混剪 - 限制每个视频的片段数，不重复使用画面，时长精确到帧")
+        print(u"5. 字幕对齐混剪 - 按文案每句字幕切换画面，字幕与画面一次编码完成")
+        print(u"6. 精彩集锦 - 选取声音最响、动作最多、镜头切换最密集的片段")
         
-        strategies = {1: 'random', 2: 'sequential', 3: 'balanced'}
+        strategies = {1: 'random', 2: 'sequential', 3: 'balanced', 4: 'constrained', 5: 'subtitle',
+                      6: 'highlights'}
         
         while True:
             try:
-                choice = int(safe_input(u"请选择 (1-3，默认1): ").strip() or "1")
+                choice = int(safe_input(u"请选择 (1-6，默认1): ").strip() or "1")
                 if choice in strategies:
                     return strategies[choice]
                 print(u"请输入有效选择")
             except ValueError:
                 print(u"请输入数字")
     
-    def get_output_settings(self, input_path=None):
-        """获取输出设置"""
+    def get_variant_count(self):
+        """获取生成版本数量（多个版本之间尽量不重复使用相同画面）"""
+        while True:
+            try:
+                count = int(safe_input(u"\n请输入生成版本数量 (默认1): ").strip() or "1")
+                if count > 0:
+                    return count
+                print(u"请输入大于0的整数")
+            except ValueError:
+                print(u"请输入数字")
+    
+    def get_keyframe_alignment(self):
+        """询问是否按关键帧对齐片段"""
+        default = self.config.get('processing', 'keyframe_aligned')
+        hint = u"Y/n" if default else u"y/N"
+        print(u"\n按关键帧对齐片段后，编码参数一致的素材可直接流复制，无需重新编码")
+        choice = safe_input(u"是否按关键帧对齐片段？({}): ".format(hint)).strip().lower()
+        if not choice:
+            return bool(default)
+        return choice in ['y', 'yes']
+    
+    def get_script_subtitles(self, target_duration):
+        """读取文案或SRT字幕，返回字幕时间轴（用于字幕对齐混剪）"""
+        from subtitle_generator import SubtitleGenerator
+        
+        while True:
+            script_path = safe_input(u"\n请输入文案文档或SRT字幕路径: ").strip().strip('"')
+            if script_path and os.path.exists(script_path):
+                break
+            print(u"文件不存在，请重新输入")
+        
+        try:
+            generator = SubtitleGenerator()
+            subtitles = generator.read_text_document(script_path, video_duration=target_duration)
+            subtitles = generator.split_long_subtitles(subtitles)
+        except Exception as e:
+            print(u"读取字幕失败: {}".format(str(e)))
+            return []
+        
+        if subtitles:
+            print(u"读取到 {} 条字幕，字幕总时长 {:.2f}秒".format(
+                len(subtitles), max(sub['end'] for sub in subtitles)))
+        return subtitles
+    
+    def get_output_settings(self, input_path=None, ask_subtitle=True):
+        """获取输出设置（ask_subtitle为False时不询问字幕设置）"""
         print(u"\n输出设置:")
         
         # 生成默认文件名（使用文件夹名和时间戳）
@@ -283,6 +338,10 @@ class CLI(object):
             except ValueError:
                 print(u"输入参数有误，使用默认设置")
         
+        if not ask_subtitle:
+            settings['add_subtitle'] = False
+            return output_path, settings
+        
         # 字幕设置
         print(u"\n字幕设置:")
         add_subtitle = safe_input(u"是否添加字幕？(Y/n): ").strip().lower()
@@ -392,15 +451,84 @@ class CLI(object):
             print(u"  ... 还有 {} 个片段".format(len(segments) - 10))
         
         print(u"\n实际总时长: {:.2f}秒".format(total_duration))
+        if segments and segments[0].get('copy_eligible'):
+            print(u"渲染方式: 可流复制（片段已按关键帧对齐，编码参数一致）")
+        
+        estimate = self.cost_model.predict(segments, output_settings)
+        basis = u"基于{}次渲染记录".format(estimate['runs']) if estimate['calibrated'] else u"经验估算"
+        print(u"预计渲染耗时: {}（{}）".format(format_duration(estimate['time']), basis))
+        print(u"预计文件大小: {:.1f} MB".format(estimate['size_mb']))
         
         # 确认继续
         confirm = safe_input(u"\n确认开始处理？(Y/n): ").strip().lower()
         return confirm != 'n'
     
-    def process_video(self, segments, output_path, output_settings, first_video_info=None):
-        """处理视频，支持保持第一个视频的原始比例"""
+    def save_plan_files(self, segments, output_path, strategy, target_duration, output_settings):
+        """在输出文件旁保存片段计划（JSON）和EDL，便于修改后重新渲染"""
+        if not self.config.get('processing', 'save_plan'):
+            return None
+        base_name = os.path.splitext(output_path)[0]
+        plan_path = base_name + ".plan.json"
+        try:
+            save_plan(plan_path, segments, self.processor.last_plan_seed, strategy,
+                      target_duration, output_settings)
+            save_edl(base_name + ".edl", segments, output_settings.get('fps') or 30)
+            print(u"片段计划已保存: {}".format(plan_path))
+            return plan_path
+        except Exception as e:
+            print(u"保存片段计划失败: {}".format(str(e)))
+            return None
+    
+    def _write_temp_srt(self, subtitles, output_path):
+        """把字幕时间轴写入输出文件旁的SRT文件"""
+        from subtitle_generator import SubtitleGenerator
+        srt_path = os.path.splitext(output_path)[0] + ".srt"
+        return SubtitleGenerator().generate_srt_file(subtitles, srt_path)
+    
+    def preview_plan(self, segments, output_path, render_settings, first_video_info=None):
+        """
+        用代理文件渲染预览并确认是否继续正式渲染
+
+        返回: 是否继续
+        """
+        preview_path = os.path.splitext(output_path)[0] + "_preview.mp4"
+        success, result = self.renderer.render_preview(segments, preview_path, first_video_info, **render_settings)
+        if not success:
+            print(u"预览渲染失败: {}".format(result))
+            return True
+        print(u"预览文件: {}".format(preview_path))
+        confirm = safe_input(u"确认预览后继续正式渲染？(Y/n): ").strip().lower()
+        return confirm not in ['n', 'no']
+    
+    def process_video(self, segments, output_path, output_settings, first_video_info=None, incremental=None):
+        """
+        处理视频，支持保持第一个视频的原始比例
+        
+        incremental为True时分组编码并复用未变化的组（为None时使用配置processing.incremental_render）
+        """
         print(u"\n开始处理视频...")
         
+        if incremental is None:
+            incremental = self.config.get('processing', 'incremental_render')
+        
+        # 已有字幕时间轴时，字幕在渲染时一次烧录（分组增量渲染无法烧录整条时间轴）
+        render_settings = dict(output_settings)
+        subtitles = render_settings.pop('subtitles', None)
+        if subtitles:
+            render_settings['subtitle_path'] = self._write_temp_srt(subtitles, output_path)
+            incremental = False
+        if self.config.get('proxy', 'enabled'):
+            if not self.preview_plan(segments, output_path, render_settings, first_video_info):
+                print(u"操作已取消")
+                return False
+        render = self.renderer.render_incremental if incremental else self.renderer.render_video
+        # 配置了多个输出规格时一次解码同时编码全部规格（第一个规格写到output_path）
+        profile_settings = dict(render_settings)
+        if not incremental and self.config.get('video', 'output_profiles'):
+            profile_settings['profiles'] = self.config.get('video', 'output_profiles')
+        timer = Timer()
+        timer.start()
+        
         # 先渲染基础视频（无字幕）
         temp_output = None
         if output_settings.get('add_subtitle', False):
@@ -408,15 +536,22 @@ class CLI(object):
             base_name = os.path.splitext(output_path)[0]
             temp_output = base_name + "_temp.mp4"
             
-            success, result = self.renderer.render_video(
+            success, result = render(
                 segments, temp_output, first_video_info, **{k: v for k, v in output_settings.items() 
                                         if k not in ['add_subtitle', 'subtitle_source', 'subtitle_style', 'split_mode', 'start_time']}
             )
         else:
-            success, result = self.renderer.render_video(
-                segments, output_path, first_video_info, **output_settings
+            success, result = render(
+                segments, output_path, first_video_info, **profile_settings
             )
         
+        timer.stop()
+        # 只有计时的首选渲染完整编码出最终文件时，耗时和大小才能作为成本模型的样本：
+        # 备用方法、增量渲染、流复制、复用缓存片段、多规格输出和二次编码字幕都不计入
+        timed_sample = (success and not incremental and not temp_output
+                        and 'profiles' not in profile_settings
+                        and not self.renderer.last_stream_copy and not self.renderer.last_cache_hits)
+        
         if not success:
             print(u"\n处理失败:")
             print(result)
@@ -426,7 +561,7 @@ class CLI(object):
             if use_backup not in ['n', 'no']:
                 print(u"尝试备用渲染方法...")
                 success, result = self.renderer.render_with_concat(
-                    segments, temp_output if temp_output else output_path, first_video_info, **output_settings
+                    segments, temp_output if temp_output else output_path, first_video_info, **render_settings
                 )
                 
                 if not success:
@@ -441,6 +576,7 @@ class CLI(object):
             try:
                 from subtitle_inserter import SubtitleInserter
                 inserter = SubtitleInserter()
+                inserter.progress_callback = print_progress
                 
                 final_output = inserter.insert_subtitles_to_video(
                     video_path=temp_output,
@@ -473,6 +609,9 @@ class CLI(object):
             print(u"=" * 50)
             print(u"输出文件: {}".format(output_path))
             
+            # 记录素材使用历史，之后的混剪优先使用较久未用的素材
+            self.processor.record_usage(segments, output_path)
+            
             # 获取输出文件信息
             output_info = self.renderer.get_output_info(output_path)
             if output_info:
@@ -481,6 +620,8 @@ class CLI(object):
                 print(u"实际时长: {:.2f}秒".format(output_info['duration']))
                 print(u"分辨率: {}x{}".format(output_info['width'], output_info['height']))
                 print(u"帧率: {:.2f}fps".format(output_info['fps']))
+                if timed_sample:
+                    self.cost_model.record_render(segments, output_settings, timer.elapsed(), output_info)
             
             subtitle_note = u"（已添加字幕）" if output_settings.get('add_subtitle', False) else u"（已去除音频，方便后续添加自定义音频和字幕）"
             print(u"\n注意：输出视频{}".format(subtitle_note))
@@ -504,11 +645,12 @@ class CLI(object):
             print(u"4. 视频字幕添加")
             print(u"5. 视频音频/字幕提取")
             print(u"6. 背景音乐添加")
-            print(u"7. 退出程序")
+            print(u"7. 从计划文件重新渲染")
+            print(u"8. 退出程序")
             print()
             
             try:
-                choice = safe_input(u"请输入选择 (1-7): ").strip()
+                choice = safe_input(u"请输入选择 (1-8): ").strip()
                 
                 if choice == '1':
                     self.auto_scan_mode()
@@ -523,6 +665,8 @@ class CLI(object):
                 elif choice == '6':
                     self.background_music_mode()
                 elif choice == '7':
+                    self.replan_mode()
+                elif choice == '8':
                     print(u"谢谢使用，再见！")
                     break
                 else:
@@ -530,7 +674,7 @@ class CLI(object):
                     continue
                     
                 # 询问是否继续
-                if choice in ['1', '2', '3', '4', '5', '6']:
+                if choice in ['1', '2', '3', '4', '5', '6', '7']:
                     continue_choice = safe_input(u"\n是否继续使用？(Y/n): ").strip().lower()
                     if continue_choice == 'n':
                         print(u"谢谢使用，再见！")
@@ -556,23 +700,60 @@ class CLI(object):
             if not video_files:
                 return
             
+            # 选择参数期间在后台生成代理文件，供预览渲染使用
+            if self.config.get('proxy', 'enabled'):
+                print(u"后台生成代理文件...")
+                ProxyManager(self.config).start_background(video_files)
+            
+            # 关键词筛选素材
+            query = safe_input(u"\n关键词筛选（如 beach AND sunset -night，直接回车不筛选）: ").strip()
+            
             # 获取目标时长
             target_duration = self.get_target_duration()
             
-            # 获取混剪策略
-            strategy = self.get_mixing_strategy()
+            # 获取生成版本数量
+            variant_count = self.get_variant_count()
+            
+            # 获取混剪策略（多版本固定使用低重叠随机策略）
+            strategy = self.get_mixing_strategy() if variant_count == 1 else 'random'
+            
+            # 字幕对齐混剪的切点由字幕决定，不再按关键帧对齐
+            subtitles = None
+            if strategy == 'subtitle':
+                subtitles = self.get_script_subtitles(target_duration)
+                if not subtitles:
+                    return
+                keyframe_aligned = False
+            else:
+                keyframe_aligned = self.get_keyframe_alignment()
+            
+            # 先确定输出设置：约束策略按实际输出帧率把计划对齐到帧
+            output_path, output_settings = self.get_output_settings(input_path, ask_subtitle=not subtitles)
+            if subtitles:
+                output_settings['subtitles'] = subtitles
             
             # 创建处理计划
             print(u"\n创建处理计划...")
-            segments = self.processor.create_segments_plan(video_files, target_duration, strategy)
-            if not segments:
+            if subtitles:
+                if query:
+                    video_files = self.processor.filter_by_query(video_files, query)
+                segments = self.processor.create_subtitle_aligned_plan(video_files, subtitles, target_duration)
+                plans = [segments] if segments else []
+            elif variant_count > 1:
+                plans = self.processor.create_variant_plans(video_files, target_duration, variant_count,
+                                                            keyframe_aligned=keyframe_aligned, query=query)
+            else:
+                segments = self.processor.create_segments_plan(video_files, target_duration, strategy,
+                                                               keyframe_aligned, query, output_settings['fps'])
+                plans = [segments] if segments else []
+            if not plans:
                 print(u"无法创建有效的处理计划")
                 return
-            
-            # 获取输出设置
-            output_path, output_settings = self.get_output_settings(input_path)
+            segments = plans[0]
             
             # 显示处理计划并确认
+            if len(plans) > 1:
+                print(u"\n共 {} 个版本，以下为第1个版本的计划".format(len(plans)))
             if not self.show_processing_plan(segments, target_duration, output_settings):
                 print(u"操作已取消")
                 return
@@ -588,7 +769,26 @@ class CLI(object):
                     ))
             
             # 处理视频
-            success = self.process_video(segments, output_path, output_settings, first_video_info)
+            if len(plans) == 1:
+                self.save_plan_files(segments, output_path, strategy, target_duration, output_settings)
+                success = self.process_video(segments, output_path, output_settings, first_video_info)
+            else:
+                jobs = [{'name': index, 'segments': plan, 'output_settings': output_settings}
+                        for index, plan in enumerate(plans, 1)]
+                schedule = schedule_jobs(self.cost_model, jobs)
+                total_time = sum(job['predicted_time'] for job in schedule)
+                print(u"预计全部版本渲染耗时: {}".format(format_duration(total_time)))
+                
+                base_name, ext = os.path.splitext(output_path)
+                succeeded = 0
+                for index, plan in enumerate(plans, 1):
+                    print(u"\n渲染第 {}/{} 个版本...".format(index, len(plans)))
+                    variant_path = u"{}_v{:02d}{}".format(base_name, index, ext)
+                    self.save_plan_files(plan, variant_path, strategy, target_duration, output_settings)
+                    if self.process_video(plan, variant_path, output_settings, first_video_info):
+                        succeeded += 1
+                print(u"\n{}/{} 个版本渲染成功".format(succeeded, len(plans)))
+                success = succeeded == len(plans)
             
             if success:
                 print(u"\n视频混剪完成！")
@@ -598,6 +798,50 @@ class CLI(object):
         except Exception as e:
             print(u"\n自动扫描模式执行出错: {}".format(str(e)))
     
+    def replan_mode(self):
+        """从计划文件重新渲染，只重新编码修改过的片段组"""
+        try:
+            plan_path = safe_input(u"\n请输入计划文件路径 (.plan.json): ").strip().strip('"')
+            if not plan_path or not os.path.exists(plan_path):
+                print(u"计划文件不存在")
+                return
+            
+            segments, meta = load_plan(plan_path, self.processor)
+            if not segments:
+                print(u"计划中没有片段")
+                return
+            for path in meta['changed_sources']:
+                print(u"⚠ 源视频已变化，与计划记录的指纹不一致: {}".format(path))
+            
+            output_settings = meta['output_settings']
+            if not output_settings:
+                output_settings = {
+                    'width': self.config.get('video', 'default_output_width'),
+                    'height': self.config.get('video', 'default_output_height'),
+                    'fps': self.config.get('video', 'default_fps'),
+                    'crf': self.config.get('video', 'default_crf'),
+                    'preset': self.config.get('video', 'default_preset')
+                }
+            
+            default_output = plan_path[:-len(".plan.json")] if plan_path.endswith(".plan.json") \
+                else os.path.splitext(plan_path)[0]
+            default_output += ".mp4"
+            output_path = safe_input(u"输出文件路径（默认：{}）: ".format(default_output)).strip().strip('"')
+            if not output_path:
+                output_path = default_output
+            
+            target_duration = meta['target_duration'] or sum(s['duration'] for s in segments)
+            if not self.show_processing_plan(segments, target_duration, output_settings):
+                print(u"操作已取消")
+                return
+            
+            if self.process_video(segments, output_path, output_settings, incremental=True):
+                print(u"\n重新渲染完成！")
+            else:
+                print(u"\n重新渲染失败！")
+        except Exception as e:
+            print(u"\n重新渲染出错: {}".format(str(e)))
+    
     def manual_mode(self):
         """手动指定模式"""
         print(u"\n手动指定模式（功能待实现）")
@@ -19,7 +19,8 @@ class Config(object):
                 "default_output_height": 1080,
                 "default_fps": 30,
                 "default_crf": 23,
-                "default_preset": "medium"
+                "default_preset": "medium",
+                "output_profiles": []
             },
             "audio": {
                 "remove_audio": True,
@@ -28,14 +29,83 @@ class Config(object):
             },
             "processing": {
                 "min_segment_duration": 1.0,
+                "max_segment_duration": 10.0,
                 "max_segments_per_video": 10,
+                "keyframe_aligned": False,
+                "variant_max_overlap": 0.2,
+                "save_plan": True,
+                "incremental_render": False,
+                "stream_copy": True,
+                "smart_render": False,
+                "render_workers": 0,
+                "chunk_duration": 60.0,
+                "max_inputs_per_process": 32,
+                "max_outputs_per_process": 6,
+                "shared_decode": True,
+                "shared_decode_gap": 30.0,
+                "segment_cache": False,
+                "segment_cache_mb": 2048,
+                "stretch_segments": 8,
+                "stretch_cache_mb": 2048,
                 "random_seed": None,
                 "temp_folder": "temp"
             },
+            "analysis": {
+                "sample_width": 192,
+                "sample_frames": 24,
+                "watermark_keyframes": 16,
+                "ad_sample_frames": 8,
+                "cache_folder": "cache"
+            },
+            "vad": {
+                "frame_ms": 20,
+                "energy_margin_db": 10.0,
+                "hangover_ms": 300,
+                "min_speech_ms": 250,
+                "min_silence_ms": 300,
+                "noise_window_ms": 3000
+            },
+            "catalog": {
+                "database": "cache/media_catalog.db",
+                "record_usage": True,
+                "freshness_weighting": True,
+                "index_on_scan": True,
+                "freshness_half_life_days": 30,
+                "min_freshness": 0.05
+            },
+            "embedding": {
+                "enabled": False,
+                "image_model": "",
+                "text_model": "",
+                "input_size": 224,
+                "batch_size": 32,
+                "keyframes_per_video": 16,
+                "index_path": "cache/embedding_index.npz",
+                "nprobe": 8,
+                "top_k": 5
+            },
+            "highlights": {
+                "window": 4.0,
+                "loudness_weight": 0.4,
+                "motion_weight": 0.4,
+                "scene_weight": 0.2,
+                "analysis_fps": 2,
+                "analysis_width": 64,
+                "scene_threshold": 30.0
+            },
+            "proxy": {
+                "enabled": False,
+                "height": 360,
+                "crf": 28,
+                "gop": 10,
+                "workers": 2,
+                "preview_crf": 32
+            },
             "ffmpeg": {
                 "path": "ffmpeg",
                 "ffprobe_path": "ffprobe",
-                "log_level": "error"
+                "log_level": "error",
+                "stall_timeout": 0
             }
         }
         self.config = self.load_config()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+渲染成本模型模块
+记录每次渲染的参数、耗时和输出大小，拟合对数线性模型预测新计划的渲染耗时和文件大小
+"""
+
+import os
+import io
+import json
+import math
+import time
+from config import Config
+from utils import estimate_output_size
+
+PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+           'medium', 'slow', 'slower', 'veryslow']
+
+# 没有渲染记录时的经验值：1080p30素材每秒需要的编码秒数
+PRESET_SECONDS = {
+    'ultrafast': 0.15, 'superfast': 0.2, 'veryfast': 0.3, 'faster': 0.45, 'fast': 0.6,
+    'medium': 0.8, 'slow': 1.5, 'slower': 3.0, 'veryslow': 6.0
+}
+
+# 解码开销明显高于H.264的源编码
+HEAVY_CODECS = ('hevc', 'vp9', 'av1')
+
+
+def solve_least_squares(rows, targets, ridge=1e-3):
+    """岭回归最小二乘：解 (X'X + λI)β = X'y，特征数很少，直接高斯消元"""
+    size = len(rows[0])
+    matrix = [[0.0] * size for _ in range(size)]
+    vector = [0.0] * size
+    for row, target in zip(rows, targets):
+        for i in range(size):
+            vector[i] += row[i] * target
+            for j in range(size):
+                matrix[i][j] += row[i] * row[j]
+    for i in range(size):
+        matrix[i][i] += ridge
+
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(matrix[r][col]))
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        vector[col], vector[pivot] = vector[pivot], vector[col]
+        if abs(matrix[col][col]) < 1e-12:
+            continue
+        for r in range(col + 1, size):
+            factor = matrix[r][col] / matrix[col][col]
+            if factor:
+                for c in range(col, size):
+                    matrix[r][c] -= factor * matrix[col][c]
+                vector[r] -= factor * vector[col]
+
+    beta = [0.0] * size
+    for i in range(size - 1, -1, -1):
+        if abs(matrix[i][i]) < 1e-12:
+            continue
+        total = vector[i] - sum(matrix[i][j] * beta[j] for j in range(i + 1, size))
+        beta[i] = total / matrix[i][i]
+    return beta
+
+
+class RenderCostModel(object):
+    """渲染耗时和输出大小预测模型"""
+
+    def __init__(self, config=None, history_path=None):
+        self.config = config or Config()
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.history_path = history_path or os.path.join(cache_folder, 'render_history.jsonl')
+        self.min_runs = 5
+        self.max_runs = 500
+        self._runs = None
+        self._coefficients = None
+
+    def load_runs(self):
+        """读取最近max_runs次渲染记录"""
+        if self._runs is not None:
+            return self._runs
+        runs = []
+        if os.path.exists(self.history_path):
+            try:
+                with io.open(self.history_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            runs.append(json.loads(line))
+            except Exception as e:
+                print(u"读取渲染记录失败: {}".format(str(e)))
+        self._runs = runs[-self.max_runs:]
+        return self._runs
+
+    def record(self, run):
+        """
+        追加一次渲染记录
+
+        run需要包含: width, height, fps, preset, crf, codec, duration,
+        segments, wall_time, output_size
+        """
+        run = dict(run, recorded=time.time())
+        try:
+            history_dir = os.path.dirname(self.history_path)
+            if history_dir and not os.path.exists(history_dir):
+                os.makedirs(history_dir)
+            text = json.dumps(run, sort_keys=True)
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            with io.open(self.history_path, 'a', encoding='utf-8') as f:
+                f.write(text + u"\n")
+        except Exception as e:
+            print(u"保存渲染记录失败: {}".format(str(e)))
+        self.load_runs().append(run)
+        self._coefficients = None
+
+    def record_render(self, segments, output_settings, wall_time, output_info):
+        """根据计划和渲染结果记录一次渲染"""
+        if not segments or not output_info:
+            return
+        source_info = segments[0].get('video_info') or {}
+        self.record({
+            'width': output_info.get('width') or output_settings.get('width'),
+            'height': output_info.get('height') or output_settings.get('height'),
+            'fps': output_info.get('fps') or output_settings.get('fps'),
+            'preset': output_settings.get('preset'),
+            'crf': output_settings.get('crf'),
+            'codec': source_info.get('codec'),
+            'duration': output_info.get('duration') or sum(s['duration'] for s in segments),
+            'segments': len(segments),
+            'wall_time': wall_time,
+            'output_size': output_info.get('size')
+        })
+
+    def _features(self, width, height, fps, preset, crf, codec, duration, segments):
+        """时间模型和大小模型的特征向量"""
+        pixel_rate = max(1.0, float(width) * height * fps)
+        preset_rank = PRESETS.index(preset) if preset in PRESETS else PRESETS.index('medium')
+        heavy = 1.0 if codec in HEAVY_CODECS else 0.0
+        time_features = [1.0, math.log(pixel_rate * max(duration, 0.1) / 1e6), float(preset_rank),
+                         float(crf), math.log(1.0 + segments), heavy]
+        size_features = [1.0, math.log(pixel_rate / 1e6), float(preset_rank), float(crf)]
+        return time_features, size_features
+
+    def fit(self):
+        """
+        拟合模型：
+        - log(耗时) 对 log(像素数x时长)、预设、CRF、片段数、源编码
+        - log(每秒字节数) 对 log(像素速率)、预设、CRF
+
+        记录不足min_runs次时返回None
+        """
+        if self._coefficients is not None:
+            return self._coefficients
+        runs = [run for run in self.load_runs()
+                if run.get('wall_time', 0) > 0 and run.get('output_size', 0) > 0
+                and run.get('duration', 0) > 0 and run.get('width') and run.get('height')]
+        if len(runs) < self.min_runs:
+            return None
+
+        time_rows, time_targets, size_rows, size_targets = [], [], [], []
+        for run in runs:
+            crf = run.get('crf')
+            if crf is None:
+                crf = 23
+            time_features, size_features = self._features(
+                run['width'], run['height'], run.get('fps') or 30, run.get('preset'), crf,
+                run.get('codec'), run['duration'], run.get('segments') or 1)
+            time_rows.append(time_features)
+            time_targets.append(math.log(run['wall_time']))
+            size_rows.append(size_features)
+            size_targets.append(math.log(run['output_size'] / float(run['duration'])))
+
+        self._coefficients = {
+            'time': solve_least_squares(time_rows, time_targets),
+            'size': solve_least_squares(size_rows, size_targets),
+            'runs': len(runs)
+        }
+        return self._coefficients
+
+    def predict(self, segments, output_settings):
+        """
+        预测计划的渲染耗时和输出大小
+
+        返回: {'time': 秒, 'size_mb': MB, 'calibrated': 是否基于渲染记录, 'runs': 记录数}
+        """
+        width = output_settings.get('width') or 1920
+        height = output_settings.get('height') or 1080
+        fps = output_settings.get('fps') or 30
+        preset = output_settings.get('preset') or 'medium'
+        crf = output_settings.get('crf')
+        if crf is None:
+            crf = 23
+        duration = sum(segment['duration'] for segment in segments)
+        codec = (segments[0].get('video_info') or {}).get('codec') if segments else None
+
+        coefficients = self.fit()
+        if coefficients is None:
+            # 没有足够记录时按预设经验值和分辨率比例估算
+            scale = float(width) * height * fps / (1920 * 1080 * 30)
+            return {
+                'time': duration * PRESET_SECONDS.get(preset, 0.8) * scale,
+                'size_mb': estimate_output_size(segments, output_settings),
+                'calibrated': False,
+                'runs': len(self.load_runs())
+            }
+
+        time_features, size_features = self._features(width, height, fps, preset, crf, codec,
+                                                      duration, len(segments))
+        log_time = sum(c * x for c, x in zip(coefficients['time'], time_features))
+        log_rate = sum(c * x for c, x in zip(coefficients['size'], size_features))
+        return {
+            'time': math.exp(log_time),
+            'size_mb': math.exp(log_rate) * duration / (1024 * 1024),
+            'calibrated': True,
+            'runs': coefficients['runs']
+        }
+
+
+def schedule_jobs(model, jobs, start_time=None):
+    """
+    按截止时间优先（EDF）顺序排列渲染任务，并用成本模型预测每个任务能否按时完成
+
+    参数:
+        jobs: [{'name', 'segments', 'output_settings', 'deadline'(时间戳)}, ...]
+        start_time: 开始渲染的时间戳，默认当前时间
+
+    返回: 按执行顺序排列的任务列表，每项增加predicted_time、predicted_finish、meets_deadline
+    """
+    clock = time.time() if start_time is None else start_time
+    ordered = sorted(jobs, key=lambda job: job.get('deadline') or float('inf'))
+    result = []
+    for job in ordered:
+        estimate = model.predict(job['segments'], job['output_settings'])
+        clock += estimate['time']
+        deadline = job.get('deadline')
+        result.append(dict(job, predicted_time=estimate['time'], predicted_finish=clock,
+                           meets_deadline=deadline is None or clock <= deadline))
+    return result
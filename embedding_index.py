@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+画面向量索引模块
+用可在CPU上运行的ONNX图文编码模型（如CLIP类模型）为关键帧计算向量，
+以float16矩阵保存，并用倒排文件（IVF）近似最近邻索引按脚本句子检索匹配画面
+"""
+
+import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from config import Config
+from frame_sampler import FrameSampler
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# CLIP类模型的输入归一化参数
+IMAGE_MEAN = (0.48145466, 0.4578275, 0.40821073)
+IMAGE_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def normalize_rows(vectors):
+    """按行做L2归一化，归一化后内积即余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.sqrt((vectors * vectors).sum(axis=1, keepdims=True))
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingModel(object):
+    """ONNX图像/文本编码模型（CPU推理，按批处理）"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.image_model_path = self.config.get('embedding', 'image_model') or ''
+        self.text_model_path = self.config.get('embedding', 'text_model') or ''
+        self.input_size = int(self.config.get('embedding', 'input_size') or 224)
+        self.batch_size = int(self.config.get('embedding', 'batch_size') or 32)
+        self.threads = multiprocessing.cpu_count()
+        self._sessions = {}
+
+    def is_available(self, need_text=False):
+        """检查NumPy、onnxruntime和模型文件是否可用"""
+        if np is None:
+            print(u"未安装 numpy 库，无法计算画面向量")
+            print(u"请执行: pip install numpy")
+            return False
+        if ort is None:
+            print(u"未安装 onnxruntime 库，无法计算画面向量")
+            print(u"请执行: pip install onnxruntime")
+            return False
+        paths = [self.image_model_path] + ([self.text_model_path] if need_text else [])
+        for path in paths:
+            if not path or not os.path.exists(path):
+                print(u"未找到编码模型: {}".format(path or u"(未配置)"))
+                return False
+        return True
+
+    def _session(self, model_path):
+        """创建CPU推理会话，算子内并行使用全部核心"""
+        if model_path not in self._sessions:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self._sessions[model_path] = ort.InferenceSession(
+                model_path, options, providers=['CPUExecutionProvider'])
+        return self._sessions[model_path]
+
+    def preprocess(self, frames):
+        """N x H x W x 3 的uint8帧转换为模型输入（N x 3 x H x W，float32，已标准化）"""
+        batch = frames.astype(np.float32) / 255.0
+        batch -= np.array(IMAGE_MEAN, dtype=np.float32)
+        batch /= np.array(IMAGE_STD, dtype=np.float32)
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+    def embed_images(self, frames):
+        """
+        计算帧向量
+
+        参数:
+            frames: N x H x W x 3 的uint8数组（尺寸为input_size）
+
+        返回: N x D 的float16数组（已归一化）
+        """
+        session = self._session(self.image_model_path)
+        input_name = session.get_inputs()[0].name
+        outputs = []
+        for offset in range(0, len(frames), self.batch_size):
+            batch = self.preprocess(frames[offset:offset + self.batch_size])
+            outputs.append(session.run(None, {input_name: batch})[0])
+        return normalize_rows(np.concatenate(outputs)).astype(np.float16)
+
+    def embed_texts(self, texts):
+        """
+        计算文本向量，文本模型需要与图像模型共享向量空间，
+        且导出时已包含分词（输入为字符串张量）
+
+        返回: N x D 的float16数组（已归一化）
+        """
+        session = self._session(self.text_model_path)
+        input_name = session.get_inputs()[0].name
+        outputs = []
+        for offset in range(0, len(texts), self.batch_size):
+            batch = np.array(texts[offset:offset + self.batch_size], dtype=object)
+            outputs.append(session.run(None, {input_name: batch})[0])
+        return normalize_rows(np.concatenate(outputs)).astype(np.float16)
+
+
+class EmbeddingIndex(object):
+    """
+    关键帧向量索引
+
+    向量按所属倒排列表连续存放，查询时只扫描距离最近的nprobe个列表
+    """
+
+    def __init__(self, config=None, index_path=None):
+        self.config = config or Config()
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.index_path = index_path or self.config.get('embedding', 'index_path') or \
+            os.path.join(cache_folder, 'embedding_index.npz')
+        self.nprobe = int(self.config.get('embedding', 'nprobe') or 8)
+        self.frames_per_video = int(self.config.get('embedding', 'keyframes_per_video') or 16)
+        self.clear()
+
+    def clear(self):
+        """清空索引"""
+        self.sources = []        # 源视频路径
+        self.source_keys = []    # 路径|大小|修改时间，文件变化后重新计算
+        self.vectors = None      # N x D float16
+        self.source_ids = None   # N int32
+        self.timestamps = None   # N float32
+        self.centroids = None    # nlist x D float32
+        self.offsets = None      # nlist+1，第i个列表为 vectors[offsets[i]:offsets[i+1]]
+        self._parts = []         # 尚未合并的 (vectors, source_ids, timestamps)
+        self._source_index = {}  # 路径 -> 源视频编号
+
+    def __len__(self):
+        self._consolidate()
+        return 0 if self.vectors is None else len(self.vectors)
+
+    def _consolidate(self):
+        """把add()累积的数据一次性合并，避免逐个视频拼接大矩阵"""
+        if not self._parts:
+            return
+        parts = self._parts
+        if self.vectors is not None:
+            parts = [(self.vectors, self.source_ids, self.timestamps)] + parts
+        self.vectors = np.concatenate([part[0] for part in parts])
+        self.source_ids = np.concatenate([part[1] for part in parts])
+        self.timestamps = np.concatenate([part[2] for part in parts])
+        self._parts = []
+
+    def get_source_key(self, video_path):
+        """缓存键：绝对路径 + 文件大小 + 修改时间"""
+        try:
+            stat = os.stat(video_path)
+            return u"{}|{}|{}".format(os.path.abspath(video_path), stat.st_size, int(stat.st_mtime))
+        except OSError:
+            return os.path.abspath(video_path)
+
+    def add(self, video_path, timestamps, vectors, source_key=None):
+        """添加一个视频的关键帧向量（替换该视频已有的向量），添加后需要重新build"""
+        self.remove(video_path)
+        source_id = len(self.sources)
+        self._source_index[video_path] = source_id
+        self.sources.append(video_path)
+        self.source_keys.append(source_key or self.get_source_key(video_path))
+
+        vectors = normalize_rows(vectors).astype(np.float16)
+        self._parts.append((vectors, np.full(len(vectors), source_id, dtype=np.int32),
+                            np.asarray(timestamps, dtype=np.float32)))
+        self.centroids = self.offsets = None
+
+    def remove(self, video_path):
+        """删除一个视频的全部向量"""
+        source_id = self._source_index.pop(video_path, None)
+        if source_id is None:
+            return
+        self.sources[source_id] = None
+        self.source_keys[source_id] = None
+        self._consolidate()
+        if self.vectors is not None:
+            keep = self.source_ids != source_id
+            self.vectors = self.vectors[keep]
+            self.source_ids = self.source_ids[keep]
+            self.timestamps = self.timestamps[keep]
+        self.centroids = self.offsets = None
+
+    def build(self, nlist=None, iterations=8, seed=0):
+        """
+        用球面k-means训练粗聚类中心，并按列表重排向量
+
+        nlist默认取 sqrt(N)，10万帧约316个列表
+        """
+        count = len(self)
+        if count == 0:
+            return
+        if nlist is None:
+            nlist = int(np.sqrt(count))
+        nlist = max(1, min(nlist, count))
+        rng = np.random.RandomState(seed)
+
+        # 训练只用抽样数据，每个中心约64个样本足够
+        sample_size = min(count, nlist * 64)
+        sample = self.vectors[rng.choice(count, sample_size, replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample.dot(centroids.T), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            sizes = np.bincount(assignments, minlength=nlist)
+            empty = sizes == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assignments = self._assign(centroids)
+        order = np.argsort(assignments, kind='mergesort')
+        self.vectors = np.ascontiguousarray(self.vectors[order])
+        self.source_ids = self.source_ids[order]
+        self.timestamps = self.timestamps[order]
+        self.centroids = centroids
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+
+    def _assign(self, centroids, chunk=16384):
+        """分块计算每个向量所属的列表，避免一次生成 N x nlist 的大矩阵"""
+        result = np.empty(len(self), dtype=np.int32)
+        for offset in range(0, len(self), chunk):
+            block = self.vectors[offset:offset + chunk].astype(np.float32)
+            result[offset:offset + chunk] = np.argmax(block.dot(centroids.T), axis=1)
+        return result
+
+    def search(self, query, k=10, nprobe=None, candidates=None):
+        """
+        检索与查询向量最相似的关键帧
+
+        参数:
+            query: D维查询向量
+            candidates: 可选，只返回这些视频中的结果
+
+        返回: [(视频路径, 时间点, 相似度), ...]，按相似度降序
+        """
+        if len(self) == 0:
+            return []
+        query = normalize_rows(query)[0]
+        if self.centroids is None:
+            rows = np.arange(len(self))
+        else:
+            nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+            centroid_scores = self.centroids.dot(query)
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+
+        if candidates is not None:
+            allowed = set(candidates)
+            allowed_ids = [i for i, path in enumerate(self.sources) if path in allowed]
+            rows = rows[np.isin(self.source_ids[rows], allowed_ids)]
+            if len(rows) == 0:
+                return []
+
+        scores = self.vectors[rows].astype(np.float32).dot(query)
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.sources[self.source_ids[rows[i]]], float(self.timestamps[rows[i]]), float(scores[i]))
+                for i in top]
+
+    def save(self):
+        """保存索引（不压缩，便于快速加载）"""
+        if len(self) == 0:
+            return
+        try:
+            index_dir = os.path.dirname(self.index_path)
+            if index_dir and not os.path.exists(index_dir):
+                os.makedirs(index_dir)
+            live = [path or u"" for path in self.sources]
+            keys = [key or u"" for key in self.source_keys]
+            with open(self.index_path, 'wb') as f:
+                np.savez(f, vectors=self.vectors, source_ids=self.source_ids,
+                         timestamps=self.timestamps, sources=np.array(live),
+                         source_keys=np.array(keys),
+                         centroids=self.centroids if self.centroids is not None else np.zeros((0, 0)),
+                         offsets=self.offsets if self.offsets is not None else np.zeros(0))
+        except Exception as e:
+            print(u"保存画面向量索引失败: {}".format(str(e)))
+
+    def load(self):
+        """读取索引，返回是否成功"""
+        self.clear()
+        if np is None or not os.path.exists(self.index_path):
+            return False
+        try:
+            data = np.load(self.index_path)
+            self.vectors = data['vectors']
+            self.source_ids = data['source_ids']
+            self.timestamps = data['timestamps']
+            self.sources = [path or None for path in data['sources'].tolist()]
+            self.source_keys = [key or None for key in data['source_keys'].tolist()]
+            self._source_index = dict((path, i) for i, path in enumerate(self.sources) if path)
+            if data['centroids'].size:
+                self.centroids = data['centroids']
+                self.offsets = data['offsets'].astype(np.int64)
+            return True
+        except Exception as e:
+            print(u"读取画面向量索引失败: {}".format(str(e)))
+            self.clear()
+            return False
+
+    def update(self, model, video_infos, sampler=None):
+        """
+        为新增或已变化的视频计算关键帧向量并重建索引
+
+        多个视频的关键帧并行抽取（每个ffmpeg进程一个核心），
+        抽出的帧凑满一批后再交给模型推理
+
+        返回: 新计算的视频数
+        """
+        sampler = sampler or FrameSampler(self.config)
+        known = set(self.source_keys)
+        pending = []
+        for info in video_infos:
+            key = self.get_source_key(info['path'])
+            if key not in known:
+                pending.append((info, key))
+        if not pending:
+            return 0
+
+        size = (model.input_size, model.input_size)
+
+        def extract(item):
+            info, key = item
+            frames, timestamps = sampler.sample_keyframes(
+                info['path'], info, self.frames_per_video, color=True, size=size)
+            return info['path'], key, frames, timestamps
+
+        print(u"计算 {} 个视频的画面向量...".format(len(pending)))
+        batch_items, batch_frames = [], []
+        pool = ThreadPool(model.threads)
+        try:
+            for path, key, frames, timestamps in pool.imap_unordered(extract, pending):
+                if frames is None or len(frames) == 0:
+                    continue
+                batch_items.append((path, key, timestamps, len(frames)))
+                batch_frames.append(frames)
+                if sum(len(f) for f in batch_frames) >= model.batch_size:
+                    self._embed_batch(model, batch_items, batch_frames)
+                    batch_items, batch_frames = [], []
+            if batch_frames:
+                self._embed_batch(model, batch_items, batch_frames)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.build()
+        self.save()
+        return len(pending)
+
+    def _embed_batch(self, model, items, frames):
+        """对多个视频的帧统一推理，再按视频拆分写入索引"""
+        vectors = model.embed_images(np.concatenate(frames))
+        offset = 0
+        for path, key, timestamps, count in items:
+            self.add(path, timestamps, vectors[offset:offset + count], key)
+            offset += count
+
+    def retrieve(self, model, texts, k=5, candidates=None):
+        """
+        为每个句子检索最匹配的关键帧
+
+        返回: 与texts等长的列表，每项为 [(视频路径, 时间点, 相似度), ...]
+        """
+        if not texts or len(self) == 0:
+            return [[] for _ in texts]
+        queries = model.embed_texts(list(texts))
+        return [self.search(query, k, candidates=candidates) for query in queries]
@@ -14,6 +14,9 @@ import base64
 import time
 from config import Config
 from utils import generate_timestamped_filename, get_video_info
+from region_detector import SubtitleRegionDetector, WatermarkDetector
+from voice_activity import VoiceActivityDetector
+from ffmpeg_progress import run_ffmpeg, print_progress
 
 def safe_input(prompt):
     """安全的输入函数，处理Python 2.7的编码问题"""
@@ -47,6 +50,7 @@ class ExtractorCLI(object):
         self.ffmpeg_path = self.config.get('ffmpeg', 'path')
         # ffprobe通常和ffmpeg在同一目录
         self.ffprobe_path = self.ffmpeg_path.replace('ffmpeg.exe', 'ffprobe.exe')
+        self.stall_timeout = self.config.get('ffmpeg', 'stall_timeout') or 0
     
     def print_banner(self):
         """打印程序横幅"""
@@ -107,6 +111,11 @@ class ExtractorCLI(object):
             else:
                 print(u"无法读取视频文件信息，请检查文件是否损坏")
     
+    def run_ffmpeg_job(self, cmd, video_info):
+        """运行ffmpeg任务并在同一行显示进度，返回 (返回码, 错误输出最后若干行)"""
+        return run_ffmpeg(cmd, video_info.get('duration'), print_progress,
+                          os.path.basename(cmd[-1]), stall_timeout=self.stall_timeout)
+    
     def check_audio_stream(self, video_path):
         """检查视频是否包含音频流"""
         try:
@@ -226,10 +235,9 @@ class ExtractorCLI(object):
         
         try:
             print(u"执行命令: {}".format(' '.join(cmd)))
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
+            returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
             
-            if process.returncode == 0 and os.path.exists(output_path):
+            if returncode == 0 and os.path.exists(output_path):
                 file_size = os.path.getsize(output_path) / (1024 * 1024)
                 print(u"\n" + u"=" * 40)
                 print(u"音频提取完成！")
@@ -302,10 +310,9 @@ class ExtractorCLI(object):
             
             try:
                 print(u"提取字幕轨道 {} ...".format(i + 1))
-                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = process.communicate()
+                returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
                 
-                if process.returncode == 0 and os.path.exists(output_path):
+                if returncode == 0 and os.path.exists(output_path):
                     file_size = os.path.getsize(output_path) / 1024
                     print(u"✓ 字幕轨道 {} 提取成功: {} ({:.1f} KB)".format(
                         i + 1, output_name, file_size
@@ -355,10 +362,9 @@ class ExtractorCLI(object):
                 temp_audio
             ]
             
-            process = subprocess.Popen(audio_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
+            returncode, stderr = self.run_ffmpeg_job(audio_cmd, video_info)
             
-            if process.returncode != 0 or not os.path.exists(temp_audio):
+            if returncode != 0 or not os.path.exists(temp_audio):
                 print(u"✗ 音频提取失败")
                 if stderr:
                     error_msg = stderr.decode('utf-8') if isinstance(stderr, bytes) else stderr
@@ -457,19 +463,14 @@ class ExtractorCLI(object):
             recognizer.pause_threshold = 0.8
             recognizer.operation_timeout = None
             
-            # 分段识别以提高准确性
-            segment_duration = 10.0  # 每段10秒
-            segments = int(duration / segment_duration) + 1
+            # 按语音活动检测结果分段识别，跳过静音，每段不超过10秒
+            speech_segments = self.get_speech_segments(audio_path, duration, 10.0)
             all_recognized_text = []
             
             print(u"正在分段识别语音内容...")
             
-            for segment in range(segments):
-                start_time = segment * segment_duration
-                if start_time >= duration:
-                    break
-                
-                segment_duration_actual = min(segment_duration, duration - start_time)
+            for segment, (start_time, end_time) in enumerate(speech_segments):
+                segment_duration_actual = end_time - start_time
                 print(u"识别第 {} 段 ({:.1f}s - {:.1f}s)...".format(
                     segment + 1, start_time, start_time + segment_duration_actual
                 ))
@@ -529,7 +530,8 @@ class ExtractorCLI(object):
             if any(text and not text.startswith(u"[语音内容") for text in all_recognized_text):
                 final_text = u" ".join([text for text in all_recognized_text if text])
                 print(u"\n✓ 语音识别完成，识别到内容")
-                return self.generate_subtitle_file(output_path, final_text, duration, all_recognized_text)
+                return self.generate_subtitle_file(output_path, final_text, duration, all_recognized_text,
+                                                   speech_segments)
             else:
                 print(u"\n⚠ 未识别到有效语音内容，生成手动编辑模板...")
                 return self.create_manual_subtitle_template(output_path, duration)
@@ -581,17 +583,34 @@ class ExtractorCLI(object):
             return self.create_manual_subtitle_template(output_path, duration)
     
     def analyze_audio_segments(self, audio_path, duration):
-        """简单的音频分段分析"""
-        # 基于时长创建合理的分段
-        segment_duration = min(5.0, duration / 4)  # 每段最多5秒，至少4段
+        """音频分段分析 - 在语音边界分段，每段最多5秒"""
+        segments = VoiceActivityDetector(self.config).speech_segments(audio_path, max_duration=5.0)
+        if segments:
+            print(u"检测到 {} 个语音片段".format(len(segments)))
+            return segments
+        
+        # 语音活动检测不可用或未检测到语音时，基于时长创建合理的分段
+        return self.split_fixed_segments(duration, min(5.0, duration / 4))  # 每段最多5秒，至少4段
+    
+    def get_speech_segments(self, audio_path, duration, max_duration):
+        """获取语音识别分块：优先使用语音活动检测，失败时按固定时长分块"""
+        segments = VoiceActivityDetector(self.config).speech_segments(audio_path, max_duration=max_duration)
+        if segments:
+            speech_total = sum(end - start for start, end in segments)
+            print(u"语音活动检测: {} 段语音，共 {:.1f} 秒（跳过静音 {:.1f} 秒）".format(
+                len(segments), speech_total, max(0.0, duration - speech_total)
+            ))
+            return segments
+        return self.split_fixed_segments(duration, max_duration)
+    
+    def split_fixed_segments(self, duration, segment_duration):
+        """按固定时长分段（语音活动检测不可用时的备用方案），返回 [(开始, 结束), ...]"""
         segments = []
-        
         current_time = 0.0
         while current_time < duration:
             end_time = min(current_time + segment_duration, duration)
             segments.append((current_time, end_time))
             current_time = end_time
-        
         return segments
     
     def create_manual_subtitle_template(self, output_path, duration):
@@ -635,8 +654,8 @@ class ExtractorCLI(object):
             print(u"创建字幕模板失败: {}".format(str(e)))
             return False
     
-    def generate_subtitle_file(self, output_path, text, duration, segments_text=None):
-        """根据识别的文本生成字幕文件"""
+    def generate_subtitle_file(self, output_path, text, duration, segments_text=None, segment_times=None):
+        """根据识别的文本生成字幕文件，segment_times为各分段的(开始, 结束)时间"""
         try:
             # 如果有分段文本，优先使用分段结果
             if segments_text:
@@ -644,8 +663,11 @@ class ExtractorCLI(object):
                 time_per_segment = duration / len(segments_text)
                 
                 for i, segment_text in enumerate(segments_text):
-                    start_time = i * time_per_segment
-                    end_time = min((i + 1) * time_per_segment, duration)
+                    if segment_times and len(segment_times) == len(segments_text):
+                        start_time, end_time = segment_times[i]
+                    else:
+                        start_time = i * time_per_segment
+                        end_time = min((i + 1) * time_per_segment, duration)
                     
                     subtitle_content.append(u"{}\n{} --> {}\n{}\n".format(
                         i + 1,
@@ -767,13 +789,14 @@ class ExtractorCLI(object):
             print(u"1. 模糊指定区域")
             print(u"2. 用纯色填充指定区域")
             print(u"3. 裁剪视频去除边缘水印")
+            print(u"4. 自动检测静态水印（同一文件夹的视频共用检测结果）")
             
             while True:
                 try:
-                    watermark_method = int(safe_input(u"请选择方式 (1-3): ").strip())
-                    if 1 <= watermark_method <= 3:
+                    watermark_method = int(safe_input(u"请选择方式 (1-4): ").strip())
+                    if 1 <= watermark_method <= 4:
                         break
-                    print(u"请输入1-3之间的数字")
+                    print(u"请输入1-4之间的数字")
                 except ValueError:
                     print(u"请输入有效的数字")
             
@@ -781,8 +804,13 @@ class ExtractorCLI(object):
                 watermark_filter = self._configure_blur_filter()
             elif watermark_method == 2:  # 纯色填充
                 watermark_filter = self._configure_fill_filter()
-            else:  # 裁剪
+            elif watermark_method == 3:  # 裁剪
                 watermark_filter = self._configure_crop_filter(video_info)
+            else:  # 自动检测
+                watermark_filter = self._configure_auto_watermark_filter(video_path, video_info)
+                if not watermark_filter:
+                    print(u"未检测到静态水印，跳过水印去除")
+                    remove_watermark = False
         
         # 烧录字幕去除配置
         burned_subtitle_filter = None
@@ -804,11 +832,11 @@ class ExtractorCLI(object):
                     print(u"请输入有效的数字")
             
             if subtitle_method == 1:  # 模糊字幕区域
-                burned_subtitle_filter = self._configure_burned_subtitle_blur_filter(video_info)
+                burned_subtitle_filter = self._configure_burned_subtitle_blur_filter(video_info, video_path)
             elif subtitle_method == 2:  # 纯色遮盖
-                burned_subtitle_filter = self._configure_burned_subtitle_fill_filter(video_info)
+                burned_subtitle_filter = self._configure_burned_subtitle_fill_filter(video_info, video_path)
             elif subtitle_method == 3:  # 裁剪去除
-                burned_subtitle_filter = self._configure_burned_subtitle_crop_filter(video_info)
+                burned_subtitle_filter = self._configure_burned_subtitle_crop_filter(video_info, video_path)
             else:  # 自定义区域
                 burned_subtitle_filter = self._configure_custom_subtitle_filter(video_info)
         
@@ -907,10 +935,9 @@ class ExtractorCLI(object):
         print(u"执行命令: {}".format(' '.join(cmd)))
         
         try:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
+            returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
             
-            if process.returncode == 0 and os.path.exists(output_path):
+            if returncode == 0 and os.path.exists(output_path):
                 file_size = os.path.getsize(output_path) / (1024 * 1024)
                 print(u"\n" + u"=" * 50)
                 print(u"视频处理完成！")
@@ -1029,7 +1056,23 @@ class ExtractorCLI(object):
         # 创建裁剪滤镜
         return "crop={}:{}:{}:{}".format(new_width, new_height, crop_x, crop_y)
     
-    def _configure_burned_subtitle_blur_filter(self, video_info):
+    def _configure_auto_watermark_filter(self, video_path, video_info):
+        """自动检测静态水印并生成delogo滤镜"""
+        channel = safe_input(u"频道/来源名称（同名共用检测结果，默认按所在文件夹）: ").strip() or None
+        refresh = safe_input(u"是否忽略缓存重新检测？(y/N): ").strip().lower() in ['y', 'yes']
+        
+        print(u"正在稀疏采样关键帧检测水印...")
+        detector = WatermarkDetector(self.config)
+        regions, from_cache = detector.detect_cached(video_path, video_info, channel, refresh)
+        if not regions:
+            return None
+        
+        print(u"{}水印区域:".format(u"使用缓存的" if from_cache else u"检测到"))
+        for region in regions:
+            print(u"  {}x{} 位置({}, {})".format(region['width'], region['height'], region['x'], region['y']))
+        return detector.build_filter(regions, video_info)
+    
+    def _configure_burned_subtitle_blur_filter(self, video_info, video_path=None):
         """配置烧录字幕模糊滤镜"""
         print(u"配置字幕区域模糊处理...")
         print(u"视频尺寸: {}x{}".format(video_info['width'], video_info['height']))
@@ -1038,17 +1081,22 @@ class ExtractorCLI(object):
         print(u"请选择字幕区域:")
         print(u"1. 底部字幕区域 (推荐，底部20%区域)")
         print(u"2. 自定义区域")
+        if video_path:
+            print(u"3. 自动检测字幕区域")
+        max_choice = 3 if video_path else 2
         
         while True:
             try:
-                choice = int(safe_input(u"请选择 (1-2): ").strip())
-                if choice in [1, 2]:
+                choice = int(safe_input(u"请选择 (1-{}): ".format(max_choice)).strip())
+                if 1 <= choice <= max_choice:
                     break
-                print(u"请输入1或2")
+                print(u"请输入1-{}之间的数字".format(max_choice))
             except ValueError:
                 print(u"请输入有效的数字")
         
-        if choice == 1:
+        if choice == 3:
+            x, y, width, height = self._detect_subtitle_region(video_path, video_info)
+        elif choice == 1:
             # 底部20%区域
             subtitle_height = int(video_info['height'] * 0.2)
             x = 0
@@ -1080,7 +1128,7 @@ class ExtractorCLI(object):
         )
         return blur_filter
     
-    def _configure_burned_subtitle_fill_filter(self, video_info):
+    def _configure_burned_subtitle_fill_filter(self, video_info, video_path=None):
         """配置烧录字幕填充滤镜"""
         print(u"配置字幕区域填充处理...")
         print(u"视频尺寸: {}x{}".format(video_info['width'], video_info['height']))
@@ -1089,17 +1137,22 @@ class ExtractorCLI(object):
         print(u"请选择字幕区域:")
         print(u"1. 底部字幕区域 (推荐，底部20%区域)")
         print(u"2. 自定义区域")
+        if video_path:
+            print(u"3. 自动检测字幕区域")
+        max_choice = 3 if video_path else 2
         
         while True:
             try:
-                choice = int(safe_input(u"请选择 (1-2): ").strip())
-                if choice in [1, 2]:
+                choice = int(safe_input(u"请选择 (1-{}): ".format(max_choice)).strip())
+                if 1 <= choice <= max_choice:
                     break
-                print(u"请输入1或2")
+                print(u"请输入1-{}之间的数字".format(max_choice))
             except ValueError:
                 print(u"请输入有效的数字")
         
-        if choice == 1:
+        if choice == 3:
+            x, y, width, height = self._detect_subtitle_region(video_path, video_info)
+        elif choice == 1:
             # 底部20%区域
             subtitle_height = int(video_info['height'] * 0.2)
             x = 0
@@ -1156,7 +1209,7 @@ class ExtractorCLI(object):
             x, y, width, height, color
         )
     
-    def _configure_burned_subtitle_crop_filter(self, video_info):
+    def _configure_burned_subtitle_crop_filter(self, video_info, video_path=None):
         """配置去除烧录字幕的裁剪滤镜"""
         print(u"配置裁剪去除字幕区域...")
         print(u"当前视频尺寸: {}x{}".format(video_info['width'], video_info['height']))
@@ -1166,17 +1219,24 @@ class ExtractorCLI(object):
         print(u"1. 去除底部字幕区域 (保留上方80%)")
         print(u"2. 去除顶部字幕区域 (保留下方80%)")
         print(u"3. 自定义裁剪区域")
+        if video_path:
+            print(u"4. 自动检测字幕区域并裁剪")
+        max_choice = 4 if video_path else 3
         
         while True:
             try:
-                choice = int(safe_input(u"请选择 (1-3): ").strip())
-                if choice in [1, 2, 3]:
+                choice = int(safe_input(u"请选择 (1-{}): ".format(max_choice)).strip())
+                if 1 <= choice <= max_choice:
                     break
-                print(u"请输入1-3之间的数字")
+                print(u"请输入1-{}之间的数字".format(max_choice))
             except ValueError:
                 print(u"请输入有效的数字")
         
-        if choice == 1:
+        if choice == 4:
+            region = self._detect_subtitle_region(video_path, video_info)
+            new_width, new_height, crop_x, crop_y = self._crop_excluding_region(region, video_info)
+            print(u"根据检测结果裁剪去除字幕区域")
+        elif choice == 1:
             # 去除底部20%，保留上方80%
             new_width = video_info['width']
             new_height = int(video_info['height'] * 0.8)
@@ -1211,6 +1271,116 @@ class ExtractorCLI(object):
         print(u"裁剪后尺寸: {}x{} 位置({}, {})".format(new_width, new_height, crop_x, crop_y))
         return "crop={}:{}:{}:{}".format(new_width, new_height, crop_x, crop_y)
     
+    def _detect_subtitle_region(self, video_path, video_info):
+        """自动检测烧录字幕区域，检测失败时回退到底部20%区域"""
+        print(u"正在采样画面检测字幕区域...")
+        region = SubtitleRegionDetector(self.config).detect(video_path, video_info)
+        if region:
+            print(u"检测到字幕区域: {}x{} 位置({}, {})，置信度 {:.0%}".format(
+                region['width'], region['height'], region['x'], region['y'], region['confidence']
+            ))
+            return region['x'], region['y'], region['width'], region['height']
+        
+        subtitle_height = int(video_info['height'] * 0.2)
+        print(u"未检测到明显的字幕区域，使用底部20%区域")
+        return 0, video_info['height'] - subtitle_height, video_info['width'], subtitle_height
+    
+    def _crop_excluding_region(self, region, video_info):
+        """计算去除字幕带的裁剪参数，返回(宽, 高, x, y)"""
+        x, y, width, height = region
+        if y + height / 2.0 >= video_info['height'] / 2.0:
+            # 字幕在下半部分，保留字幕带上方画面
+            new_height = y
+            crop_y = 0
+        else:
+            # 字幕在上半部分，保留字幕带下方画面
+            crop_y = y + height
+            new_height = video_info['height'] - crop_y
+        new_height -= new_height % 2
+        return video_info['width'], new_height, 0, crop_y
+    
+    def build_subtitle_region_filter(self, method, region, video_info, blur_strength=10, color='black'):
+        """
+        根据字幕区域生成去除滤镜（可直接用于-vf）
+        
+        参数:
+        - method: 'blur' 模糊, 'fill' 纯色填充, 'crop' 裁剪
+        - region: (x, y, width, height)
+        """
+        x, y, width, height = region
+        if method == 'fill':
+            return "drawbox=x={}:y={}:w={}:h={}:color={}:t=fill".format(x, y, width, height, color)
+        if method == 'crop':
+            new_width, new_height, crop_x, crop_y = self._crop_excluding_region(region, video_info)
+            return "crop={}:{}:{}:{}".format(new_width, new_height, crop_x, crop_y)
+        return "split[main][subtitle];[subtitle]crop=w={}:h={}:x={}:y={},boxblur={}[blurred];[main][blurred]overlay={}:{}".format(
+            width, height, x, y, blur_strength, x, y
+        )
+    
+    def _remove_burned_subtitles_auto(self, video_path, video_info, method):
+        """自动检测并去除烧录字幕（用于批量处理）"""
+        try:
+            region = SubtitleRegionDetector(self.config).detect(video_path, video_info)
+            if not region:
+                print(u"  ⚠ 未检测到烧录字幕，跳过")
+                return False
+            
+            print(u"  检测到字幕区域: {}x{} 位置({}, {})".format(
+                region['width'], region['height'], region['x'], region['y']
+            ))
+            
+            base_name = os.path.splitext(os.path.basename(video_path))[0]
+            output_dir = "processed"
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            output_path = os.path.join(output_dir, base_name + "_no_burned_sub.mp4")
+            
+            video_filter = self.build_subtitle_region_filter(
+                method, (region['x'], region['y'], region['width'], region['height']), video_info
+            )
+            cmd = [
+                self.ffmpeg_path, '-y', '-i', video_path,
+                '-vf', video_filter,
+                '-c:a', 'copy',
+                output_path
+            ]
+            
+            returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
+            return returncode == 0 and os.path.exists(output_path)
+            
+        except Exception:
+            return False
+    
+    def _remove_watermark_auto(self, video_path, video_info):
+        """自动检测并去除静态水印（用于批量处理，检测结果按文件夹缓存）"""
+        try:
+            detector = WatermarkDetector(self.config)
+            regions, from_cache = detector.detect_cached(video_path, video_info)
+            if not regions:
+                print(u"  ⚠ 未检测到静态水印，跳过")
+                return False
+            
+            print(u"  {}水印区域 {} 处".format(u"使用缓存的" if from_cache else u"检测到", len(regions)))
+            
+            base_name = os.path.splitext(os.path.basename(video_path))[0]
+            output_dir = "processed"
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            output_path = os.path.join(output_dir, base_name + "_no_watermark.mp4")
+            
+            cmd = [
+                self.ffmpeg_path, '-y', '-i', video_path,
+                '-vf', detector.build_filter(regions, video_info),
+                '-c:a', 'copy',
+                output_path
+            ]
+            
+            returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
+            return returncode == 0 and os.path.exists(output_path)
+            
+        except Exception:
+            return False
+    
     def _configure_custom_subtitle_filter(self, video_info):
         """配置自定义字幕区域处理"""
         print(u"自定义字幕区域处理...")
@@ -1317,18 +1487,29 @@ class ExtractorCLI(object):
         print(u"1. 仅提取音频")
         print(u"2. 仅提取字幕")
         print(u"3. 同时提取音频和字幕")
+        print(u"4. 自动检测并去除烧录字幕")
+        print(u"5. 自动检测并去除静态水印（同一文件夹只检测一次）")
         
         while True:
             try:
-                choice = int(safe_input(u"请选择 (1-3): ").strip())
-                if choice in [1, 2, 3]:
+                choice = int(safe_input(u"请选择 (1-5): ").strip())
+                if choice in [1, 2, 3, 4, 5]:
                     break
-                print(u"请输入1-3之间的数字")
+                print(u"请输入1-5之间的数字")
             except ValueError:
                 print(u"请输入有效的数字")
         
         extract_audio = choice in [1, 3]
         extract_subs = choice in [2, 3]
+        remove_burned_method = None
+        if choice == 4:
+            print(u"\n请选择烧录字幕去除方式:")
+            print(u"1. 模糊字幕区域")
+            print(u"2. 用黑色遮盖字幕区域")
+            print(u"3. 裁剪去除字幕区域")
+            method_choice = safe_input(u"请选择 (1-3，默认1): ").strip() or "1"
+            remove_burned_method = {'1': 'blur', '2': 'fill', '3': 'crop'}.get(method_choice, 'blur')
+        remove_watermark = choice == 5
         
         confirm = safe_input(u"\n确认开始批量处理？(Y/n): ").strip().lower()
         if confirm == 'n':
@@ -1371,6 +1552,16 @@ class ExtractorCLI(object):
                     else:
                         print(u"  ⚠ 该文件没有字幕轨道")
                 
+                if remove_burned_method:
+                    print(u"  检测烧录字幕...")
+                    if not self._remove_burned_subtitles_auto(video_path, video_info, remove_burned_method):
+                        file_success = False
+                
+                if remove_watermark:
+                    print(u"  检测静态水印...")
+                    if not self._remove_watermark_auto(video_path, video_info):
+                        file_success = False
+                
                 if file_success:
                     success_count += 1
                     print(u"  ✓ 处理完成")
@@ -1401,9 +1592,8 @@ class ExtractorCLI(object):
                 output_path
             ]
             
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            return process.returncode == 0 and os.path.exists(output_path)
+            returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
+            return returncode == 0 and os.path.exists(output_path)
             
         except Exception:
             return False
@@ -1427,9 +1617,8 @@ class ExtractorCLI(object):
                     output_path
                 ]
                 
-                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = process.communicate()
-                if process.returncode != 0 or not os.path.exists(output_path):
+                returncode, stderr = self.run_ffmpeg_job(cmd, video_info)
+                if returncode != 0 or not os.path.exists(output_path):
                     success = False
             
             return success
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+FFmpeg进度模块
+用 -progress pipe:1 -nostats 运行ffmpeg，逐块解析机器可读的进度输出，
+通过回调实时提供帧数、帧率、速度、输出时间和预计剩余时间，错误输出只保留最后若干行
+"""
+
+import sys
+import time
+import threading
+import subprocess
+from collections import deque
+
+
+def parse_time(value):
+    """解析进度输出中的时间（HH:MM:SS.ffffff），无法解析返回None"""
+    try:
+        parts = value.strip().split(':')
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except (ValueError, AttributeError):
+        return None
+
+
+def parse_number(value):
+    """解析数字，'N/A'或空值返回None；速度值带有的'x'后缀会被去掉"""
+    try:
+        return float(value.strip().rstrip('x'))
+    except (ValueError, AttributeError):
+        return None
+
+
+class ProgressParser(object):
+    """
+    解析ffmpeg的 -progress 输出
+
+    输出由若干 key=value 行组成，每块以 progress=continue 或 progress=end 结束；
+    每读完一块生成一次进度快照并调用回调
+    """
+
+    def __init__(self, total_duration=None, callback=None, job=None):
+        self.total_duration = total_duration
+        self.callback = callback
+        self.job = job
+        self.started = time.time()
+        self.last_update = self.started
+        self.snapshot = None
+        self._fields = {}
+
+    def feed(self, line):
+        """
+        输入一行进度输出
+
+        返回: 一块结束时返回进度快照，否则返回None
+        """
+        line = line.strip()
+        if '=' not in line:
+            return None
+        key, value = line.split('=', 1)
+        self._fields[key.strip()] = value.strip()
+        if key.strip() != 'progress':
+            return None
+        self.snapshot = self.build_snapshot(self._fields)
+        self._fields = {}
+        self.last_update = time.time()
+        if self.callback:
+            self.callback(self.snapshot)
+        return self.snapshot
+
+    def build_snapshot(self, fields):
+        """
+        由一块进度字段计算快照
+
+        返回: {'job', 'frame', 'fps', 'speed', 'out_time', 'total', 'percent', 'eta', 'elapsed', 'finished'}
+        """
+        out_time = None
+        # out_time_us 和 out_time_ms 的单位都是微秒（旧版本ffmpeg的命名问题）
+        for key in ('out_time_us', 'out_time_ms'):
+            value = parse_number(fields.get(key, ''))
+            if value is not None and value >= 0:
+                out_time = value / 1000000.0
+                break
+        if out_time is None and 'out_time' in fields:
+            out_time = parse_time(fields['out_time'])
+
+        frame = parse_number(fields.get('frame', ''))
+        speed = parse_number(fields.get('speed', ''))
+        elapsed = time.time() - self.started
+        finished = fields.get('progress') == 'end'
+
+        percent = None
+        eta = None
+        if self.total_duration and out_time is not None:
+            percent = min(100.0, max(0.0, 100.0 * out_time / self.total_duration))
+            remaining = max(0.0, self.total_duration - out_time)
+            if finished:
+                eta = 0.0
+            elif speed:
+                eta = remaining / speed
+            elif out_time > 0:
+                # 速度未知时按已用时间外推
+                eta = elapsed * remaining / out_time
+
+        return {
+            'job': self.job,
+            'frame': int(frame) if frame is not None else None,
+            'fps': parse_number(fields.get('fps', '')),
+            'speed': speed,
+            'out_time': out_time,
+            'total': self.total_duration,
+            'percent': percent,
+            'eta': eta,
+            'elapsed': elapsed,
+            'finished': finished
+        }
+
+
+def format_progress(snapshot):
+    """把进度快照格式化为一行文字"""
+    parts = []
+    if snapshot.get('job'):
+        parts.append(snapshot['job'])
+    if snapshot.get('percent') is not None:
+        parts.append(u"{:.1f}%".format(snapshot['percent']))
+    if snapshot.get('frame') is not None:
+        parts.append(u"帧 {}".format(snapshot['frame']))
+    if snapshot.get('fps') is not None:
+        parts.append(u"{:.1f}fps".format(snapshot['fps']))
+    if snapshot.get('speed') is not None:
+        parts.append(u"速度 {:.2f}x".format(snapshot['speed']))
+    if snapshot.get('eta') is not None:
+        parts.append(u"剩余 {:.0f}秒".format(snapshot['eta']))
+    return u" | ".join(parts)
+
+
+def print_progress(snapshot):
+    """在同一行刷新显示进度（可直接作为回调使用）"""
+    sys.stdout.write(u"\r{}".format(format_progress(snapshot)))
+    if snapshot.get('finished'):
+        sys.stdout.write(u"\n")
+    sys.stdout.flush()
+
+
+def with_progress_args(cmd):
+    """在ffmpeg命令中加入 -progress pipe:1 -nostats（全局参数，紧跟可执行文件）"""
+    if '-progress' in cmd:
+        return list(cmd)
+    return [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+
+
+def run_ffmpeg(cmd, total_duration=None, callback=None, job=None, stderr_lines=200,
+               stall_timeout=None, cwd=None):
+    """
+    运行ffmpeg并实时解析进度
+
+    参数:
+    - cmd: ffmpeg命令（输出不能写到标准输出）
+    - total_duration: 输出总时长（秒），用于计算百分比和预计剩余时间
+    - callback: 每次进度更新时调用 callback(快照)
+    - job: 任务名称，写入快照，多个任务共用一个回调时区分来源
+    - stderr_lines: 最多保留的错误输出行数
+    - stall_timeout: 超过该秒数没有进度更新时终止进程，None或0表示不检测
+    - cwd: 工作目录
+
+    返回: (返回码, 错误输出最后若干行)，进程无法启动时抛出异常
+    """
+    parser = ProgressParser(total_duration, callback, job)
+    stderr_tail = deque(maxlen=stderr_lines)
+    process = subprocess.Popen(with_progress_args(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True, cwd=cwd)
+
+    def read_stderr():
+        for line in iter(process.stderr.readline, ''):
+            stderr_tail.append(line)
+        process.stderr.close()
+
+    stderr_thread = threading.Thread(target=read_stderr)
+    stderr_thread.daemon = True
+    stderr_thread.start()
+
+    stalled = []
+    done = threading.Event()
+    if stall_timeout:
+        def watch():
+            while not done.wait(min(stall_timeout, 5.0)):
+                if time.time() - parser.last_update > stall_timeout:
+                    stalled.append(True)
+                    process.kill()
+                    return
+        watcher = threading.Thread(target=watch)
+        watcher.daemon = True
+        watcher.start()
+
+    try:
+        for line in iter(process.stdout.readline, ''):
+            parser.feed(line)
+        process.stdout.close()
+        process.wait()
+    finally:
+        done.set()
+    stderr_thread.join()
+
+    stderr = ''.join(stderr_tail)
+    if stalled:
+        stderr += u"\n超过 {} 秒没有进度，已终止ffmpeg\n".format(stall_timeout)
+    return process.returncode, stderr
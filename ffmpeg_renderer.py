@@ -5,10 +5,74 @@ FFmpeg渲染器模块
 """
 
 import os
+import shutil
 import subprocess
 import tempfile
 import json
+import hashlib
+import threading
+import multiprocessing
+from bisect import bisect_left
+from multiprocessing.pool import ThreadPool
 from config import Config
+from plan_io import source_fingerprint
+from keyframe_index import KeyframeIndex, copy_signature
+from segment_cache import SegmentCache
+from ffmpeg_progress import run_ffmpeg
+from proxy_media import ProxyManager
+
+def escape_filter_path(path):
+    """转义滤镜参数中的文件路径（Windows盘符冒号、反斜杠和单引号）"""
+    path = os.path.abspath(path).replace('\\', '/')
+    return path.replace(':', '\\:').replace("'", "'\\''")
+
+def split_at_keyframe(keyframes, start, end, epsilon=1e-3):
+    """
+    智能渲染的切分：片段开头到下一个关键帧之间需要重新编码，其余部分可直接流复制
+
+    返回: [(起点, 终点, 'encode'或'copy'), ...]
+    """
+    index = bisect_left(keyframes, start - epsilon)
+    next_keyframe = keyframes[index] if index < len(keyframes) else end
+    if next_keyframe >= end - epsilon:
+        return [(start, end, 'encode')]
+    if next_keyframe <= start + epsilon:
+        return [(start, end, 'copy')]
+    return [(start, next_keyframe, 'encode'), (next_keyframe, end, 'copy')]
+
+def source_encoder_args(video_info):
+    """按源视频流参数生成libx264参数，使重新编码的部分能和流复制的部分拼接"""
+    stream = {}
+    for item in video_info.get('streams') or []:
+        if item.get('codec_type') == 'video':
+            stream = item
+            break
+    args = ['-pix_fmt', stream.get('pix_fmt') or 'yuv420p']
+    profile = (stream.get('profile') or '').lower().replace(' ', '')
+    if profile == 'constrainedbaseline':
+        profile = 'baseline'
+    if profile in ('baseline', 'main', 'high', 'high10', 'high422', 'high444'):
+        args.extend(['-profile:v', profile])
+    level = stream.get('level')
+    if level and level > 0:
+        args.extend(['-level:v', '{:.1f}'.format(level / 10.0)])
+    if stream.get('refs') and stream['refs'] > 0:
+        args.extend(['-refs', str(stream['refs'])])
+    if stream.get('has_b_frames') == 0:
+        args.extend(['-bf', '0'])
+    if stream.get('r_frame_rate') and stream['r_frame_rate'] != '0/0':
+        args.extend(['-r', stream['r_frame_rate']])
+    return args
+
+def splice_mismatch(source_stream, encoded_stream):
+    """
+    比较重新编码部分与源视频流中影响拼接的参数（profile、level、像素格式、分辨率）
+
+    返回: 不一致的参数名列表
+    """
+    keys = ('codec_name', 'profile', 'level', 'pix_fmt', 'width', 'height')
+    return [key for key in keys
+            if source_stream.get(key) is not None and source_stream.get(key) != encoded_stream.get(key)]
 
 class FFmpegRenderer(object):
     """FFmpeg渲染器"""
@@ -16,8 +80,36 @@ class FFmpegRenderer(object):
     def __init__(self, config=None):
         self.config = config or Config()
         self.ffmpeg_path = self.config.get('ffmpeg', 'path')
+        self.ffprobe_path = self.config.get('ffmpeg', 'ffprobe_path') or 'ffprobe'
         self.log_level = self.config.get('ffmpeg', 'log_level')
         self.temp_folder = self.config.get('processing', 'temp_folder')
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.stretch_segments = self.config.get('processing', 'stretch_segments') or 8
+        self.stretch_cache = SegmentCache(self.config, os.path.join(cache_folder, 'stretches'),
+                                          self.config.get('processing', 'stretch_cache_mb') or 2048)
+        self.stream_copy = self.config.get('processing', 'stream_copy')
+        self.smart_render = self.config.get('processing', 'smart_render')
+        self.chunk_duration = self.config.get('processing', 'chunk_duration') or 60.0
+        cpu_count = multiprocessing.cpu_count()
+        # x264单进程超过8个左右线程后扩展性变差，默认每8个核心一个编码进程
+        self.render_workers = self.config.get('processing', 'render_workers') or max(1, cpu_count // 8)
+        self.worker_threads = max(1, cpu_count // self.render_workers)
+        self.max_inputs = self.config.get('processing', 'max_inputs_per_process') or 32
+        # 共享解码时一个进程同时运行的x264编码器数（每个编码器都有自己的lookahead缓冲）
+        self.max_outputs = self.config.get('processing', 'max_outputs_per_process') or 6
+        self.shared_decode = self.config.get('processing', 'shared_decode')
+        self.shared_decode_gap = self.config.get('processing', 'shared_decode_gap') or 30.0
+        self.segment_cache = SegmentCache(self.config) if self.config.get('processing', 'segment_cache') else None
+        # 最近一次render_video是否走了流复制（流复制耗时不计入成本模型）
+        self.last_stream_copy = False
+        # 最近一次渲染从片段缓存复用的片段数（复用缓存的耗时不代表完整编码）
+        self.last_cache_hits = 0
+        self._hits_lock = threading.Lock()
+        # 最近一次多规格渲染的全部输出路径
+        self.last_outputs = []
+        # 进度回调：每个ffmpeg任务每次进度更新时调用 progress_callback(快照)，并行任务按job区分
+        self.progress_callback = None
+        self.stall_timeout = self.config.get('ffmpeg', 'stall_timeout') or 0
         self._ensure_temp_folder()
     
     def _ensure_temp_folder(self):
@@ -29,6 +121,12 @@ class FFmpegRenderer(object):
                 print(u"创建临时文件夹失败: {}".format(str(e)))
                 self.temp_folder = tempfile.gettempdir()
     
+    def execute(self, cmd, total_duration=None, job=None):
+        """运行ffmpeg并把进度转发给progress_callback，返回 (是否成功, 错误输出最后若干行)"""
+        returncode, stderr = run_ffmpeg(cmd, total_duration, self.progress_callback,
+                                        job or os.path.basename(cmd[-1]), stall_timeout=self.stall_timeout)
+        return returncode == 0, stderr
+    
     def create_filter_complex(self, segments, first_video_info=None):
         """创建复杂滤镜字符串，保持第一个视频的原始比例"""
         filter_parts = []
@@ -67,8 +165,665 @@ class FFmpegRenderer(object):
         
         return ";".join(filter_parts), output_label
     
+    def check_stream_copy(self, segments, first_video_info=None, require_aligned=True, **kwargs):
+        """
+        检查计划能否不重新编码直接拼接：片段按关键帧对齐、源视频都是H.264且编码参数一致，
+        分辨率和帧率与输出设置相同，并且不需要烧录字幕
+
+        require_aligned=False 时不要求片段按关键帧对齐（智能渲染只重新编码片段开头）
+
+        返回: (是否可流复制, 原因说明)
+        """
+        if require_aligned and self.stream_copy is False:
+            return False, u"已在配置中关闭流复制"
+        if not segments:
+            return False, u"没有片段"
+        if kwargs.get('subtitle_path'):
+            return False, u"需要烧录字幕"
+        if require_aligned and not all(segment.get('copy_eligible') for segment in segments):
+            return False, u"片段未按关键帧对齐或源视频编码参数不一致"
+        if len(set(copy_signature(segment['video_info']) for segment in segments)) != 1:
+            return False, u"源视频编码参数不一致"
+        
+        source_info = segments[0]['video_info']
+        signature = copy_signature(source_info)
+        if signature[0] != 'h264':
+            return False, u"源视频编码为 {}，输出需要H.264".format(signature[0])
+        if signature[4] not in (None, 'yuv420p'):
+            return False, u"源视频像素格式为 {}，输出需要yuv420p".format(signature[4])
+        
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        if (source_info.get('width'), source_info.get('height')) != (params['width'], params['height']):
+            return False, u"输出分辨率与源视频不同"
+        if abs(float(source_info.get('fps') or 0) - float(params['fps'])) >= 1.0:
+            return False, u"输出帧率与源视频不同"
+        return True, u"片段已按关键帧对齐，源视频与输出参数一致"
+    
+    def render_stream_copy(self, segments, output_path):
+        """用concat分离器按入点/出点截取各片段并直接流复制，不解码不编码"""
+        list_path = os.path.join(self.temp_folder, "copy_list_{}.txt".format(os.getpid()))
+        try:
+            with open(list_path, 'w') as f:
+                for segment in segments:
+                    f.write("file '{}'\n".format(
+                        os.path.abspath(segment['video_path']).replace('\\', '/').replace("'", "'\\''")))
+                    f.write("inpoint {:.6f}\n".format(segment['start_time']))
+                    f.write("outpoint {:.6f}\n".format(segment['start_time'] + segment['duration']))
+            
+            cmd = [
+                self.ffmpeg_path, '-y',
+                '-loglevel', self.log_level,
+                '-f', 'concat', '-safe', '0',
+                '-i', list_path,
+                '-map', '0:v:0',
+                '-c', 'copy',
+                '-an',
+                '-movflags', '+faststart',
+                output_path
+            ]
+            success, stderr = self.execute(cmd, sum(segment['duration'] for segment in segments))
+            if not success:
+                return False, stderr
+            return True, output_path
+        except Exception as e:
+            return False, u"流复制拼接失败: {}".format(str(e))
+        finally:
+            if os.path.exists(list_path):
+                os.remove(list_path)
+    
+    def render_smart(self, segments, output_path, first_video_info=None, keyframe_lookup=None, **kwargs):
+        """
+        智能渲染：每个片段只重新编码开头到下一个关键帧之间的不完整GOP（编码参数与源视频一致），
+        其余部分直接流复制，最后用concat分离器拼接，切点精确到帧
+
+        各部分先写成MPEG-TS（参数集随关键帧内嵌），重新编码和流复制的部分可以直接拼接；
+        输出MP4只有一个avcC，因此先用ffprobe确认重新编码部分的profile、level等与源视频一致，
+        不一致时返回失败，由调用方改为完整重新编码
+        """
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        if keyframe_lookup is None:
+            infos = dict((segment['video_path'], segment['video_info']) for segment in segments)
+            keyframe_lookup = KeyframeIndex(self.config).build_lookup(list(infos.values()))
+        
+        work_dir = tempfile.mkdtemp(prefix='smart_', dir=self.temp_folder)
+        try:
+            parts = []
+            encoded = 0.0
+            checked = set()
+            for index, segment in enumerate(segments):
+                keyframes = keyframe_lookup.get(segment['video_path'])
+                if not keyframes:
+                    return False, u"无法读取关键帧: {}".format(segment['video_path'])
+                start = segment['start_time']
+                for number, (part_start, part_end, mode) in enumerate(
+                        split_at_keyframe(keyframes, start, start + segment['duration'])):
+                    part_path = os.path.join(work_dir, "part_{:05d}_{}.ts".format(index, number))
+                    cmd = [self.ffmpeg_path, '-y', '-loglevel', self.log_level,
+                           '-ss', '{:.6f}'.format(part_start), '-i', segment['video_path'],
+                           '-t', '{:.6f}'.format(part_end - part_start), '-map', '0:v:0', '-an', '-sn']
+                    if mode == 'encode':
+                        encoded += part_end - part_start
+                        cmd.extend(['-c:v', 'libx264', '-preset', params['preset'], '-crf', str(params['crf'])])
+                        cmd.extend(source_encoder_args(segment['video_info']))
+                    else:
+                        cmd.extend(['-c:v', 'copy', '-bsf:v', 'h264_mp4toannexb'])
+                    cmd.extend(['-f', 'mpegts', part_path])
+                    success, stderr = self.execute(cmd, part_end - part_start)
+                    if not success:
+                        return False, stderr
+                    if mode == 'encode' and segment['video_path'] not in checked:
+                        mismatch = self.check_splice(segment['video_info'], part_path)
+                        if mismatch:
+                            return False, u"重新编码部分与源视频参数不一致: {}".format(", ".join(mismatch))
+                        checked.add(segment['video_path'])
+                    parts.append(part_path)
+            
+            total = sum(segment['duration'] for segment in segments)
+            print(u"智能渲染: 重新编码 {:.2f}秒，流复制 {:.2f}秒".format(encoded, total - encoded))
+            
+            success, stderr = self.concat_copy(parts, output_path, os.path.join(work_dir, "parts.txt"))
+            if not success:
+                return False, stderr
+            print(u"视频渲染成功!")
+            return True, output_path
+        except Exception as e:
+            return False, u"智能渲染失败: {}".format(str(e))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def probe_video_stream(self, path):
+        """用ffprobe读取第一个视频流的参数，失败返回None"""
+        cmd = [self.ffprobe_path, '-v', 'error', '-select_streams', 'v:0',
+               '-print_format', 'json', '-show_streams', path]
+        try:
+            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+            streams = json.loads(output.decode('utf-8')).get('streams') or []
+            return streams[0] if streams else None
+        except Exception:
+            return None
+    
+    def check_splice(self, video_info, part_path):
+        """
+        检查重新编码的部分能否与源视频流复制的部分放进同一个视频轨道
+
+        返回: 不一致的参数名列表，无法读取时返回 ['ffprobe']
+        """
+        source_stream = {}
+        for item in video_info.get('streams') or []:
+            if item.get('codec_type') == 'video':
+                source_stream = item
+                break
+        encoded_stream = self.probe_video_stream(part_path)
+        if encoded_stream is None:
+            return ['ffprobe']
+        return splice_mismatch(source_stream, encoded_stream)
+    
     def render_video(self, segments, output_path, first_video_info=None, **kwargs):
-        """渲染最终视频，可选择保持第一个视频的原始比例"""
+        """
+        渲染最终视频，可选择保持第一个视频的原始比例
+        
+        计划满足流复制条件时直接拼接；切点不在关键帧上但其余条件满足且开启smart_render时，
+        只重新编码片段开头的不完整GOP；失败或不满足条件时自动改为完整重新编码。
+        较长的计划优先分块并行编码，冷缓存不会取消并行；不分块时，多个片段来自同一视频则每个视频只解码一次。
+        片段缓存（默认关闭）在各路径内部使用：截取的片段写入缓存，已缓存的直接复用
+        
+        profiles: 可选，输出规格列表，给出时一次解码同时编码多个分辨率/画幅（见render_profiles）
+        """
+        self.last_stream_copy = False
+        self.last_cache_hits = 0
+        profiles = kwargs.pop('profiles', None)
+        if profiles:
+            return self.render_profiles(segments, output_path, profiles, first_video_info, **kwargs)
+        can_copy, reason = self.check_stream_copy(segments, first_video_info, **kwargs)
+        if can_copy:
+            print(u"流复制拼接（{}）...".format(reason))
+            success, result = self.render_stream_copy(segments, output_path)
+            if success:
+                self.last_stream_copy = True
+                print(u"视频渲染成功!")
+                return True, output_path
+            print(u"流复制拼接失败，改为重新编码: {}".format(result))
+        elif self.smart_render and self.check_stream_copy(segments, first_video_info, False, **kwargs)[0]:
+            success, result = self.render_smart(segments, output_path, first_video_info, **kwargs)
+            if success:
+                self.last_stream_copy = True
+                return True, output_path
+            print(u"智能渲染失败，改为完整重新编码: {}".format(result))
+        elif segments and segments[0].get('copy_eligible'):
+            print(u"无法流复制（{}），重新编码".format(reason))
+        
+        if (self.render_workers > 1 and not kwargs.get('subtitle_path')
+                and len(self.split_chunks(segments)) > 1):
+            return self.render_parallel(segments, output_path, first_video_info, **kwargs)
+        if self.reuses_sources(segments):
+            return self.render_pre_extracted(segments, output_path, first_video_info, **kwargs)
+        if self.segment_cache and not kwargs.get('subtitle_path'):
+            # 开启片段缓存时总是截取为统一参数的片段：已缓存的直接复用，其余编码后写入缓存，
+            # 冷缓存也在这次渲染中填充，下次渲染相同片段时命中
+            return self.render_pre_extracted(segments, output_path, first_video_info, **kwargs)
+        return self.encode_video(segments, output_path, first_video_info, **kwargs)
+    
+    def profile_output_paths(self, output_path, profiles):
+        """各输出规格的文件路径：第一个规格写到output_path，其余在文件名后加规格名称"""
+        base, ext = os.path.splitext(output_path)
+        paths = []
+        for index, profile in enumerate(profiles):
+            if profile.get('output_path'):
+                paths.append(profile['output_path'])
+            elif index == 0:
+                paths.append(output_path)
+            else:
+                name = profile.get('name') or "{}x{}".format(profile['width'], profile['height'])
+                paths.append("{}_{}{}".format(base, name, ext))
+        return paths
+    
+    def create_profile_filter(self, source_label, profiles, fps, subtitle_path=None):
+        """
+        把一路视频split为每个输出规格一路，各路分别缩放并裁切（fit=crop）或加黑边（fit=pad）
+
+        字幕在各路缩放之后烧录，竖屏等裁切画幅中字幕也完整可见
+
+        返回: (滤镜字符串列表, 各路输出标签列表)
+        """
+        filter_parts = ["{}split={}{}".format(
+            source_label, len(profiles), "".join("[p{}]".format(i) for i in range(len(profiles))))]
+        labels = []
+        for i, profile in enumerate(profiles):
+            width, height = profile['width'], profile['height']
+            if profile.get('fit') == 'crop':
+                chain = "scale={}:{}:force_original_aspect_ratio=increase,crop={}:{}".format(
+                    width, height, width, height)
+            else:
+                chain = "scale={}:{}:force_original_aspect_ratio=decrease,pad={}:{}:(ow-iw)/2:(oh-ih)/2:black".format(
+                    width, height, width, height)
+            chain += ",setsar=1,fps={}".format(profile.get('fps') or fps)
+            if subtitle_path:
+                chain += ",subtitles='{}'".format(escape_filter_path(subtitle_path))
+            filter_parts.append("[p{}]{}[out{}]".format(i, chain, i))
+            labels.append("[out{}]".format(i))
+        return filter_parts, labels
+    
+    def render_profiles(self, segments, output_path, profiles, first_video_info=None, **kwargs):
+        """
+        多规格输出：一个ffmpeg进程解码并拼接计划，split后按每个规格缩放/裁切并分别编码，
+        源视频只解码一次
+
+        profiles: [{'name': 'portrait', 'width': 1080, 'height': 1920, 'fit': 'crop',
+                    'fps': 可选, 'crf': 可选, 'preset': 可选, 'output_path': 可选}, ...]
+        片段超过max_inputs个时先无损编码一个中间文件，再由它split为各规格
+        返回: (是否成功, 第一个规格的输出路径或错误信息)，全部输出路径见last_outputs
+        """
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        reference_info = {'width': params['width'], 'height': params['height'], 'fps': params['fps']}
+        output_paths = self.profile_output_paths(output_path, profiles)
+        total = sum(segment['duration'] for segment in segments)
+        print(u"多规格输出: {}".format(u", ".join(
+            u"{}x{}".format(profile['width'], profile['height']) for profile in profiles)))
+        
+        work_dir = tempfile.mkdtemp(prefix='profiles_', dir=self.temp_folder)
+        try:
+            cmd = [self.ffmpeg_path, '-y', '-loglevel', self.log_level]
+            if len(segments) > self.max_inputs:
+                master_path = os.path.join(work_dir, "master.mp4")
+                success, result = self.encode_video(segments, master_path, reference_info,
+                                                    crf=0, preset='ultrafast')
+                if not success:
+                    return False, result
+                cmd.extend(['-i', master_path])
+                filter_parts, source_label = [], "[0:v]"
+            else:
+                for segment in segments:
+                    cmd.extend(['-ss', str(segment['start_time']), '-t', str(segment['duration']),
+                                '-i', segment['video_path']])
+                graph, source_label = self.create_filter_complex(segments, reference_info)
+                filter_parts = [graph]
+            
+            branches, labels = self.create_profile_filter(source_label, profiles, params['fps'],
+                                                          kwargs.get('subtitle_path'))
+            script_path = os.path.join(work_dir, "filter.txt")
+            with open(script_path, 'w') as f:
+                f.write(";".join(filter_parts + branches))
+            cmd.extend(['-filter_complex_script', script_path])
+            
+            for profile, label, path in zip(profiles, labels, output_paths):
+                cmd.extend(['-map', label,
+                            '-c:v', 'libx264',
+                            '-preset', profile.get('preset') or params['preset'],
+                            '-crf', str(profile.get('crf', params['crf'])),
+                            '-pix_fmt', 'yuv420p'])
+                if kwargs.get('threads'):
+                    cmd.extend(['-threads', str(kwargs['threads'])])
+                cmd.extend(['-an', '-movflags', '+faststart', path])
+            
+            success, stderr = self.execute(cmd, total, os.path.basename(output_path))
+            if not success:
+                print(u"FFmpeg执行失败:")
+                print(stderr)
+                return False, stderr
+            self.last_outputs = output_paths
+            for path in output_paths:
+                print(u"输出文件: {}".format(path))
+            print(u"视频渲染成功!")
+            return True, output_paths[0]
+        except Exception as e:
+            error_msg = u"多规格渲染失败: {}".format(str(e))
+            print(error_msg)
+            return False, error_msg
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def render_preview(self, segments, output_path, first_video_info=None, proxy_lookup=None, **kwargs):
+        """
+        预览渲染：片段改为从代理文件截取，按代理高度和ultrafast预设快速编码，用于正式渲染前检查计划
+
+        只替换片段副本中的视频路径，计划本身不变，正式渲染仍使用原始素材；
+        没有代理文件的片段使用原始素材
+        proxy_lookup: 可选，{源视频路径: 代理文件路径}，默认查找已生成的代理文件
+        """
+        proxies = ProxyManager(self.config)
+        if proxy_lookup is None:
+            proxy_lookup = proxies.build_lookup(set(segment['video_path'] for segment in segments))
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        height = min(int(params['height']), int(proxies.height))
+        width = int(round(params['width'] * float(height) / params['height'] / 2.0)) * 2
+        preview_info = {'width': width, 'height': height, 'fps': params['fps']}
+        
+        preview_segments = []
+        for segment in segments:
+            preview = dict(segment, copy_eligible=False)
+            preview['video_path'] = proxy_lookup.get(segment['video_path'], segment['video_path'])
+            preview_segments.append(preview)
+        used = sum(1 for segment in segments if segment['video_path'] in proxy_lookup)
+        print(u"预览渲染: {}x{}，{}/{} 个片段使用代理文件".format(width, height, used, len(segments)))
+        
+        preview_crf = (self.config.get('proxy') or {}).get('preview_crf', 32)
+        preview_kwargs = {'crf': preview_crf, 'preset': 'ultrafast'}
+        if kwargs.get('subtitle_path'):
+            preview_kwargs['subtitle_path'] = kwargs['subtitle_path']
+        return self.encode_video(preview_segments, output_path, preview_info, **preview_kwargs)
+    
+    def split_chunks(self, segments, chunk_count=None):
+        """
+        把计划按片段边界切成时长接近的连续分块，块数不少于并行进程数，
+        每块约chunk_duration秒
+
+        返回: [(起始索引, 结束索引), ...]
+        """
+        total = sum(segment['duration'] for segment in segments)
+        if chunk_count is None:
+            chunk_count = int(total // self.chunk_duration)
+            if chunk_count > 1:
+                chunk_count = max(chunk_count, self.render_workers)
+        chunk_count = max(1, min(chunk_count, len(segments)))
+        target = total / chunk_count
+        
+        chunks = []
+        start = 0
+        position = 0.0
+        for index, segment in enumerate(segments):
+            # 片段中点越过分块目标位置时在其后切分，各块时长误差不超过半个片段
+            middle = position + segment['duration'] / 2.0
+            position += segment['duration']
+            if middle >= target * (len(chunks) + 1) - 1e-6 and len(chunks) < chunk_count - 1:
+                chunks.append((start, index + 1))
+                start = index + 1
+        if start < len(segments):
+            chunks.append((start, len(segments)))
+        return chunks
+    
+    def reuses_sources(self, segments):
+        """开启共享解码且有多个片段来自同一视频时返回True"""
+        return bool(self.shared_decode) and len(set(segment['video_path'] for segment in segments)) < len(segments)
+    
+    def render_parallel(self, segments, output_path, first_video_info=None, **kwargs):
+        """
+        并行分块编码：各块由独立的ffmpeg进程用相同编码参数编码（闭合GOP，每块以IDR帧开始），
+        最后用concat流复制无损拼接；块内多个片段来自同一视频或开启了片段缓存时，该块用共享解码截取
+        """
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        # 各块都按同一参考分辨率和帧率编码，拼接时才能直接流复制
+        reference_info = {'width': params['width'], 'height': params['height'], 'fps': params['fps']}
+        chunks = self.split_chunks(segments)
+        print(u"并行编码: {} 块，{} 个进程，每个进程 {} 线程".format(
+            len(chunks), self.render_workers, self.worker_threads))
+        
+        work_dir = tempfile.mkdtemp(prefix='chunks_', dir=self.temp_folder)
+        chunk_paths = [os.path.join(work_dir, "chunk_{:04d}.mp4".format(i)) for i in range(len(chunks))]
+        
+        def encode_chunk(item):
+            (start, end), chunk_path = item
+            if self.segment_cache or self.reuses_sources(segments[start:end]):
+                # 每块只占一个并行位置，块内的读取分组依次执行
+                return self.render_pre_extracted(segments[start:end], chunk_path, reference_info,
+                                                 crf=params['crf'], preset=params['preset'], workers=1)
+            return self.encode_video(segments[start:end], chunk_path, reference_info,
+                                     crf=params['crf'], preset=params['preset'],
+                                     threads=self.worker_threads, closed_gop=True)
+        
+        pool = ThreadPool(self.render_workers)
+        try:
+            results = pool.map(encode_chunk, list(zip(chunks, chunk_paths)))
+            for success, result in results:
+                if not success:
+                    return False, result
+            
+            success, stderr = self.concat_copy(chunk_paths, output_path, os.path.join(work_dir, "chunks.txt"))
+            if not success:
+                print(u"拼接分块失败:")
+                print(stderr)
+                return False, stderr
+            print(u"视频渲染成功!")
+            return True, output_path
+        except Exception as e:
+            error_msg = u"并行编码失败: {}".format(str(e))
+            print(error_msg)
+            return False, error_msg
+        finally:
+            pool.close()
+            pool.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def group_source_runs(self, segments):
+        """
+        按源视频分组：同一视频中间隔不超过shared_decode_gap秒的片段合并为一次顺序读取，
+        每组最多max_outputs个片段
+
+        返回: [[片段索引, ...], ...]，组内按起点排序
+        """
+        by_source = {}
+        order = []
+        for index, segment in enumerate(segments):
+            path = segment['video_path']
+            if path not in by_source:
+                by_source[path] = []
+                order.append(path)
+            by_source[path].append(index)
+        
+        runs = []
+        for path in order:
+            indices = sorted(by_source[path], key=lambda i: segments[i]['start_time'])
+            run = []
+            run_end = None
+            for index in indices:
+                segment = segments[index]
+                if run and (segment['start_time'] - run_end > self.shared_decode_gap
+                            or len(run) >= self.max_outputs):
+                    runs.append(run)
+                    run = []
+                if not run:
+                    run_end = segment['start_time']
+                run.append(index)
+                run_end = max(run_end, segment['start_time'] + segment['duration'])
+            runs.append(run)
+        return runs
+    
+    def extract_run(self, segments, run, clip_paths, params, script_path, offsets=None, **kwargs):
+        """
+        一个ffmpeg进程顺序解码源视频的一段范围，用split/trim同时输出该范围内的多个片段，
+        每个片段直接编码为最终参数的独立文件（闭合GOP，可流复制拼接），
+        threads为整个进程的线程数，由各路编码器平分
+
+        offsets: 可选，片段在整条时间轴上的起始时间，用于烧录字幕
+        """
+        first = min(segments[i]['start_time'] for i in run)
+        last = max(segments[i]['start_time'] + segments[i]['duration'] for i in run)
+        width, height, fps = params['width'], params['height'], params['fps']
+        
+        filter_parts = []
+        if len(run) > 1:
+            filter_parts.append("[0:v]split={}{}".format(
+                len(run), "".join("[s{}]".format(j) for j in range(len(run)))))
+        for j, index in enumerate(run):
+            segment = segments[index]
+            source_label = "[s{}]".format(j) if len(run) > 1 else "[0:v]"
+            chain = ("{}trim=start={:.6f}:duration={:.6f},setpts=PTS-STARTPTS,"
+                     "scale={}:{}:force_original_aspect_ratio=decrease,"
+                     "pad={}:{}:(ow-iw)/2:(oh-ih)/2:black,fps={},format=yuv420p").format(
+                source_label, segment['start_time'] - first, segment['duration'],
+                width, height, width, height, fps)
+            if kwargs.get('subtitle_path') and offsets:
+                chain += ",setpts=PTS+{:.6f}/TB,subtitles='{}',setpts=PTS-STARTPTS".format(
+                    offsets[index], escape_filter_path(kwargs['subtitle_path']))
+            filter_parts.append(chain + "[v{}]".format(j))
+        with open(script_path, 'w') as f:
+            f.write(";".join(filter_parts))
+        
+        cmd = [self.ffmpeg_path, '-y', '-loglevel', self.log_level,
+               '-ss', '{:.6f}'.format(first), '-t', '{:.6f}'.format(last - first),
+               '-i', segments[run[0]]['video_path'],
+               '-filter_complex_script', script_path]
+        for j, index in enumerate(run):
+            cmd.extend(['-map', '[v{}]'.format(j),
+                        '-c:v', 'libx264', '-preset', params['preset'], '-crf', str(params['crf']),
+                        '-r', str(fps), '-pix_fmt', 'yuv420p', '-x264-params', 'open-gop=0'])
+            if kwargs.get('threads'):
+                cmd.extend(['-threads', str(max(1, kwargs['threads'] // len(run)))])
+            cmd.extend(['-an', clip_paths[index]])
+        
+        return self.execute(cmd, last - first, os.path.basename(segments[run[0]]['video_path']))
+    
+    def render_pre_extracted(self, segments, output_path, first_video_info=None, **kwargs):
+        """
+        共享解码渲染：每个源视频（的每段连续范围）只打开、解码一次，
+        同时截取其中的所有片段，最后按时间轴顺序流复制拼接
+        """
+        runs = self.group_source_runs(segments)
+        sources = len(set(segment['video_path'] for segment in segments))
+        print(u"共享解码: {} 个片段来自 {} 个视频，分 {} 次读取".format(len(segments), sources, len(runs)))
+        return self.render_clip_pool(segments, output_path, runs, first_video_info, **kwargs)
+    
+    def render_clip_pool(self, segments, output_path, runs, first_video_info=None, **kwargs):
+        """
+        按读取分组并行截取片段：每组一个ffmpeg进程，输出已统一分辨率、帧率、像素格式和GOP的片段文件，
+        最后只做流复制拼接；中间文件放在每次任务独立的临时目录中
+        """
+        workers = kwargs.pop('workers', None) or self.render_workers
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        offsets = []
+        position = 0.0
+        for segment in segments:
+            offsets.append(position)
+            position += segment['duration']
+        
+        work_dir = tempfile.mkdtemp(prefix='clips_', dir=self.temp_folder)
+        clip_paths = [os.path.join(work_dir, "clip_{:05d}.mp4".format(i)) for i in range(len(segments))]
+        
+        # 烧录字幕的片段与时间轴位置有关，不使用缓存
+        cache = self.segment_cache if not kwargs.get('subtitle_path') else None
+        keys = []
+        if cache:
+            keys = [cache.make_key(segment, params) for segment in segments]
+            cached = set()
+            for index, key in enumerate(keys):
+                cached_path = cache.lookup(key)
+                if cached_path:
+                    clip_paths[index] = cached_path
+                    cached.add(index)
+            runs = [[index for index in run if index not in cached] for run in runs]
+            runs = [run for run in runs if run]
+            with self._hits_lock:
+                self.last_cache_hits += len(cached)
+        
+        def extract(item):
+            number, run = item
+            return self.extract_run(segments, run, clip_paths, params,
+                                    os.path.join(work_dir, "filter_{:05d}.txt".format(number)),
+                                    offsets, threads=self.worker_threads,
+                                    subtitle_path=kwargs.get('subtitle_path'))
+        
+        pool = ThreadPool(workers)
+        try:
+            for success, result in pool.map(extract, list(enumerate(runs))):
+                if not success:
+                    print(u"截取片段失败:")
+                    print(result)
+                    return False, result
+            if cache:
+                for run in runs:
+                    for index in run:
+                        clip_paths[index] = cache.store(keys[index], clip_paths[index])
+            
+            success, stderr = self.concat_copy(clip_paths, output_path, os.path.join(work_dir, "clips.txt"))
+            if not success:
+                print(u"拼接片段失败:")
+                print(stderr)
+                return False, stderr
+            if cache:
+                cache.evict(keep=clip_paths)
+                metrics = cache.metrics()
+                print(u"片段缓存: 命中 {hits} 个，未命中 {misses} 个，占用 {mb:.1f}/{budget:.0f} MB".format(
+                    mb=metrics['bytes'] / 1048576.0, budget=metrics['budget_bytes'] / 1048576.0, **metrics))
+            print(u"视频渲染成功!")
+            return True, output_path
+        except Exception as e:
+            error_msg = u"片段截取渲染失败: {}".format(str(e))
+            print(error_msg)
+            return False, error_msg
+        finally:
+            pool.close()
+            pool.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def split_batches(self, count):
+        """把count个片段平均分成若干批，每批不超过max_inputs个，返回 [(起始索引, 结束索引), ...]"""
+        batch_count = -(-count // self.max_inputs)
+        bounds = [count * i // batch_count for i in range(batch_count + 1)]
+        return list(zip(bounds, bounds[1:]))
+    
+    def concat_copy(self, file_paths, output_path, list_path):
+        """用concat分离器把编码参数相同的文件直接流复制拼接，返回 (是否成功, 错误信息)"""
+        with open(list_path, 'w') as f:
+            for file_path in file_paths:
+                f.write("file '{}'\n".format(
+                    os.path.abspath(file_path).replace('\\', '/').replace("'", "'\\''")))
+        cmd = [
+            self.ffmpeg_path, '-y',
+            '-loglevel', self.log_level,
+            '-f', 'concat', '-safe', '0',
+            '-i', list_path,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            output_path
+        ]
+        return self.execute(cmd)
+    
+    def render_batched(self, segments, output_path, first_video_info=None, **kwargs):
+        """
+        分层渲染：每批最多max_inputs个片段单独编码为中间文件（闭合GOP，编码参数与最终输出一致），
+        再流复制拼接，单个ffmpeg进程的输入数、解码器数量和命令行长度都与计划长度无关
+        
+        字幕按每批在整条时间轴上的偏移烧录，不需要额外编码
+        """
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        reference_info = {'width': params['width'], 'height': params['height'], 'fps': params['fps']}
+        batches = self.split_batches(len(segments))
+        print(u"分批渲染: {} 个片段分为 {} 批".format(len(segments), len(batches)))
+        
+        work_dir = tempfile.mkdtemp(prefix='batches_', dir=self.temp_folder)
+        try:
+            part_paths = []
+            offset = kwargs.get('subtitle_offset') or 0.0
+            for number, (start, end) in enumerate(batches):
+                part_path = os.path.join(work_dir, "part_{:04d}.mp4".format(number))
+                batch_kwargs = {'crf': params['crf'], 'preset': params['preset'], 'closed_gop': True}
+                if kwargs.get('threads'):
+                    batch_kwargs['threads'] = kwargs['threads']
+                if kwargs.get('subtitle_path'):
+                    batch_kwargs['subtitle_path'] = kwargs['subtitle_path']
+                    batch_kwargs['subtitle_offset'] = offset
+                print(u"渲染第 {}/{} 批...".format(number + 1, len(batches)))
+                success, result = self.encode_video(segments[start:end], part_path, reference_info,
+                                                    **batch_kwargs)
+                if not success:
+                    return False, result
+                part_paths.append(part_path)
+                offset += sum(segment['duration'] for segment in segments[start:end])
+            
+            success, stderr = self.concat_copy(part_paths, output_path, os.path.join(work_dir, "parts.txt"))
+            if not success:
+                print(u"拼接中间文件失败:")
+                print(stderr)
+                return False, stderr
+            print(u"视频渲染成功!")
+            return True, output_path
+        except Exception as e:
+            error_msg = u"分批渲染失败: {}".format(str(e))
+            print(error_msg)
+            return False, error_msg
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def encode_video(self, segments, output_path, first_video_info=None, **kwargs):
+        """
+        用单个ffmpeg进程解码、缩放并重新编码整个计划，片段超过max_inputs个时分批渲染
+        
+        threads: 可选，限制x264线程数（并行分块编码时使用）
+        closed_gop: 为True时强制闭合GOP，分块编码后可无损拼接
+        subtitle_offset: 本次编码的片段在整条字幕时间轴上的起始时间（分批渲染时使用）
+        """
+        if len(segments) > self.max_inputs:
+            return self.render_batched(segments, output_path, first_video_info, **kwargs)
+        
         # 获取输出参数
         if first_video_info and 'width' not in kwargs and 'height' not in kwargs:
             # 使用第一个视频的分辨率
@@ -109,20 +864,38 @@ class FFmpegRenderer(object):
                 '-i', segment['video_path']
             ])
         
+        # 字幕在同一次编码中烧录，不需要先渲染再二次编码
+        subtitle_filter = None
+        if kwargs.get('subtitle_path'):
+            subtitle_filter = "subtitles='{}'".format(escape_filter_path(kwargs['subtitle_path']))
+            if kwargs.get('subtitle_offset'):
+                # 字幕滤镜按帧时间戳取字幕，先平移到整条时间轴上的位置，烧录后再移回
+                subtitle_filter = "setpts=PTS+{:.6f}/TB,{},setpts=PTS-STARTPTS".format(
+                    kwargs['subtitle_offset'], subtitle_filter)
+        
         # 创建滤镜
+        script_path = None
         if len(segments) > 1:
             filter_complex, output_label = self.create_filter_complex(
                 segments, first_video_info
             )
-            cmd.extend(['-filter_complex', filter_complex])
+            if subtitle_filter:
+                filter_complex += ";{}{}[subv]".format(output_label, subtitle_filter)
+                output_label = "[subv]"
+            # 滤镜写入脚本文件，命令行长度与片段数无关
+            handle, script_path = tempfile.mkstemp(prefix='filter_', suffix='.txt', dir=self.temp_folder)
+            with os.fdopen(handle, 'w') as f:
+                f.write(filter_complex)
+            cmd.extend(['-filter_complex_script', script_path])
             cmd.extend(['-map', output_label])
         else:
             # 单个片段，使用简单滤镜（保持原始比例，使用黑边填充）
-            cmd.extend([
-                '-vf', 'scale={}:{}:force_original_aspect_ratio=decrease,pad={}:{}:(ow-iw)/2:(oh-ih)/2:black'.format(
-                    output_width, output_height, output_width, output_height
-                )
-            ])
+            video_filter = 'scale={}:{}:force_original_aspect_ratio=decrease,pad={}:{}:(ow-iw)/2:(oh-ih)/2:black'.format(
+                output_width, output_height, output_width, output_height
+            )
+            if subtitle_filter:
+                video_filter += ',' + subtitle_filter
+            cmd.extend(['-vf', video_filter])
         
         # 视频编码参数
         cmd.extend([
@@ -132,6 +905,10 @@ class FFmpegRenderer(object):
             '-r', str(output_fps),
             '-pix_fmt', 'yuv420p'
         ])
+        if kwargs.get('threads'):
+            cmd.extend(['-threads', str(kwargs['threads'])])
+        if kwargs.get('closed_gop'):
+            cmd.extend(['-x264-params', 'open-gop=0'])
         
         # 不包含音频
         cmd.extend(['-an'])
@@ -143,21 +920,13 @@ class FFmpegRenderer(object):
         
         try:
             # 执行命令
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            
-            stdout, stderr = process.communicate()
+            success, stderr = self.execute(cmd, sum(segment['duration'] for segment in segments))
             
-            if process.returncode == 0:
+            if success:
                 print(u"视频渲染成功!")
                 return True, output_path
             else:
                 print(u"FFmpeg执行失败:")
-                print(u"返回码: {}".format(process.returncode))
                 if stderr:
                     print(u"错误信息:")
                     print(stderr)
@@ -167,98 +936,173 @@ class FFmpegRenderer(object):
             error_msg = u"执行FFmpeg时发生异常: {}".format(str(e))
             print(error_msg)
             return False, error_msg
+        finally:
+            if script_path and os.path.exists(script_path):
+                os.remove(script_path)
     
-    def create_concat_file(self, segments, concat_file_path):
-        """创建concat文件（备用方法）"""
-        try:
-            with open(concat_file_path, 'w') as f:
-                for segment in segments:
-                    # 为每个片段创建临时文件
-                    temp_file = self._create_segment_file(segment)
-                    if temp_file:
-                        f.write("file '{}'\n".format(temp_file.replace('\\', '/')))
-            return True
-        except Exception as e:
-            print(u"创建concat文件失败: {}".format(str(e)))
-            return False
+    def resolve_output_params(self, first_video_info=None, **kwargs):
+        """确定输出分辨率、帧率、CRF和预设（与render_video的规则一致）"""
+        if first_video_info and 'width' not in kwargs and 'height' not in kwargs:
+            output_width = first_video_info['width']
+            output_height = first_video_info['height']
+        else:
+            output_width = kwargs.get('width', self.config.get('video', 'default_output_width'))
+            output_height = kwargs.get('height', self.config.get('video', 'default_output_height'))
+        
+        if first_video_info and 'fps' not in kwargs:
+            output_fps = int(first_video_info['fps'])
+        else:
+            output_fps = kwargs.get('fps', self.config.get('video', 'default_fps'))
+        
+        return {
+            'width': output_width,
+            'height': output_height,
+            'fps': output_fps,
+            'crf': kwargs.get('crf', self.config.get('video', 'default_crf')),
+            'preset': kwargs.get('preset', self.config.get('video', 'default_preset'))
+        }
     
-    def _create_segment_file(self, segment):
-        """创建单个片段的临时文件"""
+    def split_stretches(self, segment_keys):
+        """
+        按内容划分连续片段组（stretch）
+        
+        片段键的哈希值满足条件时在其后切分，切分点只取决于片段本身，
+        修改、插入或删除一个片段只影响它所在的组，其余组保持不变；
+        每组最多stretch_segments*2个片段
+        
+        返回: [(起始索引, 结束索引), ...]
+        """
+        stretches = []
+        start = 0
+        limit = self.stretch_segments * 2
+        for index, key in enumerate(segment_keys):
+            boundary = int(key[:8], 16) % self.stretch_segments == 0
+            if boundary or index + 1 - start >= limit:
+                stretches.append((start, index + 1))
+                start = index + 1
+        if start < len(segment_keys):
+            stretches.append((start, len(segment_keys)))
+        return stretches
+    
+    def render_incremental(self, segments, output_path, first_video_info=None, **kwargs):
+        """
+        增量渲染：把计划按内容划分为若干组，每组单独编码并按内容哈希缓存，
+        最后用concat流复制拼接
+        
+        重新渲染修改过的计划时，未变化的组直接复用缓存文件，只重新编码变化的组。
+        缺少的组按共享解码方式截取片段（闭合GOP，可直接拼接），开启片段缓存时
+        普通渲染已经缓存的片段直接复用，因此从保存的计划第一次重新渲染也不需要完整编码
+        """
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        # 各组都按同一参考分辨率和帧率编码，拼接时才能直接流复制
+        reference_info = {'width': params['width'], 'height': params['height'], 'fps': params['fps']}
+        settings_key = u"{width}x{height}|{fps}|{crf}|{preset}".format(**params)
+        
+        fingerprints = {}
+        segment_keys = []
+        for segment in segments:
+            path = segment['video_path']
+            if path not in fingerprints:
+                fingerprints[path] = source_fingerprint(path) or os.path.abspath(path)
+            key = u"{}|{:.6f}|{:.6f}".format(fingerprints[path], segment['start_time'], segment['duration'])
+            segment_keys.append(hashlib.sha1(key.encode('utf-8')).hexdigest())
+        
+        stretch_files = []
+        missing = []
+        stretches = self.split_stretches(segment_keys)
+        for number, (start, end) in enumerate(stretches):
+            digest = hashlib.sha1(settings_key.encode('utf-8'))
+            for key in segment_keys[start:end]:
+                digest.update(key.encode('ascii'))
+            stretch_key = digest.hexdigest()
+            stretch_path = self.stretch_cache.lookup(stretch_key)
+            if stretch_path is None:
+                missing.append((number, stretch_key))
+            stretch_files.append(stretch_path)
+        
+        if len(missing) == len(stretches) and not self.segment_cache:
+            print(u"片段组缓存中没有该计划的任何组：本次完整编码并写入缓存，之后修改计划只重新编码变化的组")
+        print(u"共 {} 组片段，复用 {} 组，重新编码 {} 组".format(
+            len(stretches), len(stretches) - len(missing), len(missing)))
+        
+        work_dir = tempfile.mkdtemp(prefix='stretches_', dir=self.temp_folder)
         try:
-            temp_name = "segment_{}_{}.mp4".format(
-                segment['id'], 
-                os.path.basename(segment['video_path']).split('.')[0]
-            )
-            temp_path = os.path.join(self.temp_folder, temp_name)
-            
-            cmd = [
-                self.ffmpeg_path, '-y',
-                '-ss', str(segment['start_time']),
-                '-t', str(segment['duration']),
-                '-i', segment['video_path'],
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',
-                '-an',  # 去除音频
-                temp_path
-            ]
+            for count, (number, stretch_key) in enumerate(missing, 1):
+                start, end = stretches[number]
+                print(u"编码第 {}/{} 个变化的组...".format(count, len(missing)))
+                stretch_path = os.path.join(work_dir, "stretch_{:04d}.mp4".format(number))
+                success, result = self.render_pre_extracted(segments[start:end], stretch_path, reference_info,
+                                                            crf=params['crf'], preset=params['preset'])
+                if not success:
+                    return False, result
+                stretch_files[number] = self.stretch_cache.store(stretch_key, stretch_path)
             
-            subprocess.check_call(cmd, 
-                                stdout=subprocess.DEVNULL, 
-                                stderr=subprocess.DEVNULL)
-            return temp_path
+            success, stderr = self.concat_copy(stretch_files, output_path, os.path.join(work_dir, "stretches.txt"))
+            if not success:
+                print(u"拼接片段组失败:")
+                print(stderr)
+                return False, stderr
+            self.stretch_cache.evict(keep=stretch_files)
+            print(u"视频渲染成功!")
+            return True, output_path
         except Exception as e:
-            print(u"创建片段文件失败: {}".format(str(e)))
-            return None
+            error_msg = u"增量渲染失败: {}".format(str(e))
+            print(error_msg)
+            return False, error_msg
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
     
     def render_with_concat(self, segments, output_path, first_video_info=None, **kwargs):
-        """使用concat方法渲染（备用方案），支持保持第一个视频的原始比例"""
-        concat_file = os.path.join(self.temp_folder, "concat_list.txt")
+        """
+        备用方案，支持保持第一个视频的原始比例
+
+        每个片段由独立的ffmpeg进程（只有一个输入、一路输出）并行预编码为统一分辨率、帧率和GOP的片段，
+        最后用concat流复制拼接；不经过主渲染的共享解码和片段缓存，中间文件放在任务独立的临时目录中
+        """
+        params = self.resolve_output_params(first_video_info, **kwargs)
+        reference_info = {'width': params['width'], 'height': params['height'], 'fps': params['fps']}
+        offsets = []
+        position = kwargs.get('subtitle_offset') or 0.0
+        for segment in segments:
+            offsets.append(position)
+            position += segment['duration']
+        print(u"逐片段预编码 {} 个片段，{} 个进程...".format(len(segments), self.render_workers))
+        
+        work_dir = tempfile.mkdtemp(prefix='concat_', dir=self.temp_folder)
+        clip_paths = [os.path.join(work_dir, "clip_{:05d}.mp4".format(i)) for i in range(len(segments))]
         
+        def encode_clip(index):
+            clip_kwargs = {'crf': params['crf'], 'preset': params['preset'],
+                           'threads': self.worker_threads, 'closed_gop': True}
+            if kwargs.get('subtitle_path'):
+                clip_kwargs['subtitle_path'] = kwargs['subtitle_path']
+                clip_kwargs['subtitle_offset'] = offsets[index]
+            return self.encode_video([segments[index]], clip_paths[index], reference_info, **clip_kwargs)
+        
+        pool = ThreadPool(self.render_workers)
         try:
-            # 创建所有片段文件
-            print(u"创建临时片段文件...")
-            if not self.create_concat_file(segments, concat_file):
-                return False, u"创建concat文件失败"
-            
-            # 合并视频
-            print(u"合并视频片段...")
-            if first_video_info and 'width' not in kwargs and 'height' not in kwargs:
-                # 使用第一个视频的分辨率
-                output_width = first_video_info['width']
-                output_height = first_video_info['height']
-                print(u"使用第一个视频的分辨率: {}x{}".format(output_width, output_height))
-            else:
-                output_width = kwargs.get('width', self.config.get('video', 'default_output_width'))
-                output_height = kwargs.get('height', self.config.get('video', 'default_output_height'))
+            for success, result in pool.map(encode_clip, range(len(segments))):
+                if not success:
+                    return False, result
             
-            cmd = [
-                self.ffmpeg_path, '-y',
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', concat_file,
-                '-vf', 'scale={}:{}:force_original_aspect_ratio=decrease,pad={}:{}:(ow-iw)/2:(oh-ih)/2:black'.format(
-                    output_width, output_height, output_width, output_height
-                ),
-                '-c:v', 'libx264',
-                '-preset', kwargs.get('preset', 'medium'),
-                '-crf', str(kwargs.get('crf', 23)),
-                '-an',
-                output_path
-            ]
-            
-            subprocess.check_call(cmd)
+            success, stderr = self.concat_copy(clip_paths, output_path, os.path.join(work_dir, "clips.txt"))
+            if not success:
+                print(u"拼接片段失败:")
+                print(stderr)
+                return False, stderr
+            print(u"视频渲染成功!")
             return True, output_path
-            
         except Exception as e:
-            error_msg = u"concat方法渲染失败: {}".format(str(e))
+            error_msg = u"备用渲染失败: {}".format(str(e))
             print(error_msg)
             return False, error_msg
         finally:
-            # 清理临时文件
-            self.cleanup_temp_files()
+            pool.close()
+            pool.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
     
     def cleanup_temp_files(self):
-        """清理临时文件"""
+        """清理旧版本备用渲染遗留在公共临时文件夹中的片段文件"""
         try:
             if os.path.exists(self.temp_folder):
                 for file in os.listdir(self.temp_folder):
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+低分辨率帧采样模块
+通过ffmpeg的rawvideo管道读取缩小后的灰度帧，供画面分析使用
+"""
+
+import subprocess
+from config import Config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def spread_timestamps(start_time, end_time, count):
+    """在 (start_time, end_time) 内均匀取count个时间点（不含两端）"""
+    count = max(1, int(count))
+    step = (end_time - start_time) / (count + 1)
+    return [start_time + step * (i + 1) for i in range(count)]
+
+
+class FrameSampler(object):
+    """低分辨率灰度帧采样器"""
+
+    def __init__(self, config=None, sample_width=None):
+        self.config = config or Config()
+        self.ffmpeg_path = self.config.get('ffmpeg', 'path') or 'ffmpeg'
+        self.sample_width = sample_width or self.config.get('analysis', 'sample_width') or 192
+
+    def is_available(self):
+        """检查NumPy是否可用"""
+        if np is None:
+            print(u"未安装 numpy 库，无法进行画面分析")
+            print(u"请执行: pip install numpy")
+            return False
+        return True
+
+    def get_sample_size(self, video_info):
+        """根据原视频比例计算采样分辨率（宽高均为偶数）"""
+        width = int(self.sample_width)
+        src_width = video_info.get('width') or 16
+        src_height = video_info.get('height') or 9
+        height = int(round(width * float(src_height) / float(src_width)))
+        height = max(2, height - height % 2)
+        return width, height
+
+    def sample_uniform(self, video_path, video_info, count=24, start_time=None, end_time=None):
+        """
+        在时间范围内均匀采样帧（单个ffmpeg进程，一次管道读取）
+
+        返回: (frames, timestamps)，frames为 N x H x W 的uint8数组
+        """
+        if not self.is_available():
+            return None, []
+
+        duration = float(video_info.get('duration') or 0)
+        if duration <= 0:
+            return None, []
+
+        # 默认跳过片头片尾各5%，避免片头黑场和片尾字幕干扰
+        if start_time is None:
+            start_time = duration * 0.05
+        if end_time is None:
+            end_time = duration * 0.95
+        span = max(end_time - start_time, 0.1)
+        count = max(1, int(count))
+
+        width, height = self.get_sample_size(video_info)
+        cmd = [
+            self.ffmpeg_path, '-v', 'error',
+            '-ss', '{:.3f}'.format(start_time),
+            '-t', '{:.3f}'.format(span),
+            '-i', video_path,
+            '-an', '-sn',
+            '-vf', 'fps={:.6f},scale={}:{},format=gray'.format(count / span, width, height),
+            '-frames:v', str(count),
+            '-f', 'rawvideo', '-pix_fmt', 'gray', '-'
+        ]
+        frames = self._read_frames(cmd, width, height)
+        if frames is None:
+            return None, []
+
+        step = span / count
+        timestamps = [start_time + step * (i + 0.5) for i in range(len(frames))]
+        return frames, timestamps
+
+    def sample_keyframes(self, video_path, video_info, count=16, start_time=None, end_time=None,
+                         color=False, size=None):
+        """
+        只解码关键帧进行稀疏采样，开销远小于完整解码
+
+        返回: (frames, timestamps)
+        """
+        duration = float(video_info.get('duration') or 0)
+        if duration <= 0:
+            return None, []
+
+        if start_time is None:
+            start_time = 0.0
+        if end_time is None:
+            end_time = duration
+        timestamps = spread_timestamps(start_time, end_time, count)
+        return self.sample_at(video_path, video_info, timestamps, keyframes_only=True,
+                              color=color, size=size)
+
+    def sample_at(self, video_path, video_info, timestamps, keyframes_only=False, color=False, size=None):
+        """
+        在指定时间点各取一帧
+
+        keyframes_only=True 时使用 -skip_frame nokey 和 -noaccurate_seek，
+        每个时间点只解码该时间点之前最近的一个关键帧
+        color=True 时输出RGB帧（N x H x W x 3），size=(width, height) 时缩放到固定尺寸
+
+        返回: (frames, timestamps)，只包含成功读取的帧
+        """
+        if not self.is_available():
+            return None, []
+
+        width, height = size or self.get_sample_size(video_info)
+        pix_fmt = 'rgb24' if color else 'gray'
+        channels = 3 if color else 1
+        frames = []
+        sampled = []
+        for timestamp in timestamps:
+            cmd = [self.ffmpeg_path, '-v', 'error']
+            if keyframes_only:
+                cmd.extend(['-skip_frame', 'nokey', '-noaccurate_seek'])
+            cmd.extend([
+                '-ss', '{:.3f}'.format(timestamp),
+                '-i', video_path,
+                '-an', '-sn',
+                '-vf', 'scale={}:{},format={}'.format(width, height, pix_fmt),
+                '-frames:v', '1',
+                '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-'
+            ])
+            frame = self._read_frames(cmd, width, height, channels)
+            if frame is not None and len(frame) > 0:
+                frames.append(frame[0])
+                sampled.append(timestamp)
+
+        if not frames:
+            return None, []
+        return np.stack(frames), sampled
+
+    def _read_frames(self, cmd, width, height, channels=1):
+        """执行ffmpeg命令并把rawvideo输出转换为帧数组"""
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+        except Exception as e:
+            print(u"帧采样失败: {}".format(str(e)))
+            return None
+
+        frame_size = width * height * channels
+        if process.returncode != 0 or len(stdout) < frame_size:
+            return None
+
+        frame_count = len(stdout) // frame_size
+        data = np.frombuffer(stdout[:frame_count * frame_size], dtype=np.uint8)
+        if channels > 1:
+            return data.reshape((frame_count, height, width, channels))
+        return data.reshape((frame_count, height, width))
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+精彩片段信号索引模块
+每个视频只用一个ffmpeg进程解码一次，按秒计算响度、画面运动强度和镜头切换次数并缓存，
+供精彩集锦策略直接读取
+"""
+
+import os
+import json
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from config import Config
+from ffmpeg_renderer import escape_filter_path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class HighlightIndex(object):
+    """按秒统计的响度/运动/镜头切换信号（按文件大小和修改时间缓存）"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.ffmpeg_path = self.config.get('ffmpeg', 'path') or 'ffmpeg'
+        highlight_config = self.config.get('highlights') or {}
+        self.analysis_fps = highlight_config.get('analysis_fps', 2)
+        self.analysis_width = highlight_config.get('analysis_width', 64)
+        self.scene_threshold = highlight_config.get('scene_threshold', 30.0)
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.cache_path = os.path.join(cache_folder, 'highlight_index.json')
+        self._cache = None
+
+    def is_available(self):
+        """检查NumPy是否可用"""
+        if np is None:
+            print(u"未安装 numpy 库，无法分析精彩片段")
+            print(u"请执行: pip install numpy")
+            return False
+        return True
+
+    def compute_signals(self, video_path, video_info, sample_rate=8000):
+        """
+        用一个ffmpeg进程同时分析画面和音频，每个源视频只解复用、解码一次：
+        - 视频以analysis_fps输出缩小的灰度帧，计算每秒的平均帧差（运动强度）
+          和帧差超过scene_threshold的次数（镜头切换）
+        - 音频按每秒一帧用astats统计RMS电平（dB），写入临时文本文件
+
+        错误输出由后台线程持续读取，避免大量解码错误写满管道导致死锁；
+        ffmpeg返回非0时视为失败
+
+        返回: (loudness, motion, scenes)，每秒一个值的列表；没有音轨时loudness为空，失败时均为空
+        """
+        width = int(self.analysis_width)
+        src_width = video_info.get('width') or 16
+        src_height = video_info.get('height') or 9
+        height = int(round(width * float(src_height) / float(src_width)))
+        height = max(2, height - height % 2)
+        fps = int(self.analysis_fps)
+        cmd = [
+            self.ffmpeg_path, '-v', 'error', '-i', video_path,
+            '-map', '0:v:0',
+            '-vf', 'fps={},scale={}:{},format=gray'.format(fps, width, height),
+            '-f', 'rawvideo', '-pix_fmt', 'gray', '-'
+        ]
+        stats_path = None
+        if video_info.get('has_audio', True):
+            handle, stats_path = tempfile.mkstemp(prefix='loudness_', suffix='.txt')
+            os.close(handle)
+            cmd.extend([
+                '-map', '0:a:0', '-ac', '1', '-ar', str(sample_rate),
+                '-af', "asetnsamples=n={}:p=0,astats=metadata=1:reset=1,"
+                       "ametadata=mode=print:file='{}'".format(sample_rate, escape_filter_path(stats_path)),
+                '-f', 'null', '-'
+            ])
+
+        block = width * height * fps
+        motion, scenes = [], []
+        previous = None
+        stderr_tail = deque(maxlen=20)
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            def read_stderr():
+                for line in iter(process.stderr.readline, b''):
+                    stderr_tail.append(line)
+                process.stderr.close()
+
+            stderr_thread = threading.Thread(target=read_stderr)
+            stderr_thread.daemon = True
+            stderr_thread.start()
+            while True:
+                raw = process.stdout.read(block)
+                if len(raw) < block:
+                    break
+                frames = np.frombuffer(raw, dtype=np.uint8).reshape(fps, height * width).astype(np.int16)
+                if previous is not None:
+                    frames = np.vstack([previous, frames])
+                diffs = np.abs(frames[1:] - frames[:-1]).mean(axis=1) if len(frames) > 1 else np.zeros(1)
+                previous = frames[-1:]
+                motion.append(round(float(diffs.mean()), 2))
+                scenes.append(int((diffs > self.scene_threshold).sum()))
+            process.stdout.close()
+            process.wait()
+            stderr_thread.join()
+            if process.returncode != 0:
+                print(u"精彩片段信号分析失败: {} - {}".format(
+                    video_path, b''.join(stderr_tail).decode('utf-8', 'replace').strip()))
+                return [], [], []
+            loudness = self.read_loudness(stats_path, sample_rate) if stats_path else []
+        except Exception as e:
+            print(u"精彩片段信号分析失败: {} - {}".format(video_path, str(e)))
+            return [], [], []
+        finally:
+            if stats_path and os.path.exists(stats_path):
+                os.remove(stats_path)
+        return loudness, motion, scenes
+
+    def read_loudness(self, stats_path, sample_rate=8000):
+        """
+        读取ametadata输出的每秒RMS电平，跳过不足一秒的最后一帧
+
+        返回: 每秒一个值的列表（dB，静音记为-100）
+        """
+        loudness = []
+        level = None
+        samples = None
+        with open(stats_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('frame:'):
+                    if level is not None and samples == sample_rate:
+                        loudness.append(level)
+                    level, samples = None, None
+                elif line.startswith('lavfi.astats.Overall.RMS_level='):
+                    value = float(line.split('=', 1)[1])
+                    level = round(max(-100.0, value), 2) if value == value else -100.0
+                elif line.startswith('lavfi.astats.Overall.Number_of_samples='):
+                    samples = int(float(line.split('=', 1)[1]))
+        if level is not None and samples == sample_rate:
+            loudness.append(level)
+        return loudness
+
+    def get_cache_key(self, video_path):
+        """缓存键：绝对路径 + 文件大小 + 修改时间，文件变化后自动失效"""
+        try:
+            stat = os.stat(video_path)
+            return u"{}|{}|{}".format(os.path.abspath(video_path), stat.st_size, int(stat.st_mtime))
+        except OSError:
+            return os.path.abspath(video_path)
+
+    def load_cache(self):
+        """读取信号缓存"""
+        if self._cache is not None:
+            return self._cache
+        self._cache = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self._cache = json.load(f)
+            except Exception as e:
+                print(u"读取精彩片段缓存失败: {}".format(str(e)))
+        return self._cache
+
+    def save_cache(self):
+        """保存信号缓存"""
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.load_cache(), f)
+        except Exception as e:
+            print(u"保存精彩片段缓存失败: {}".format(str(e)))
+
+    def get_signals(self, video_path, video_info, refresh=False, save=True):
+        """
+        获取视频的按秒信号（优先使用缓存）
+
+        返回: {'loudness': [...], 'motion': [...], 'scenes': [...]}，失败返回None
+        """
+        cache = self.load_cache()
+        key = self.get_cache_key(video_path)
+        if not refresh and key in cache:
+            return cache[key]
+        if not self.is_available():
+            return None
+
+        print(u"分析精彩片段信号: {}".format(os.path.basename(video_path)))
+        loudness, motion, scenes = self.compute_signals(video_path, video_info)
+        if not motion:
+            return None
+        signals = {
+            'loudness': loudness,
+            'motion': motion,
+            'scenes': scenes
+        }
+        cache[key] = signals
+        if save:
+            self.save_cache()
+        return signals
+
+    def build_lookup(self, video_infos):
+        """批量获取信号，返回 {视频路径: 信号}，失败的视频不包含在内"""
+        lookup = {}
+        computed = False
+        cache = self.load_cache()
+        for info in video_infos:
+            path = info['path']
+            if path in lookup:
+                continue
+            cached = self.get_cache_key(path) in cache
+            signals = self.get_signals(path, info, save=False)
+            computed = computed or not cached
+            if signals:
+                lookup[path] = signals
+        if computed:
+            self.save_cache()
+        return lookup
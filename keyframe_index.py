@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+关键帧索引模块
+用ffprobe读取视频流的关键帧时间点并缓存，供按关键帧对齐片段和流复制渲染使用
+"""
+
+import os
+import json
+import subprocess
+from bisect import bisect_left, bisect_right
+from config import Config
+
+
+def copy_signature(video_info):
+    """
+    流复制拼接所需的编码参数签名
+
+    编码器、profile、分辨率、像素格式、帧率、时间基都相同的视频
+    才能不重新编码直接拼接
+    """
+    video_stream = None
+    for stream in video_info.get('streams') or []:
+        if stream.get('codec_type') == 'video':
+            video_stream = stream
+            break
+    if video_stream is None:
+        return (video_info.get('codec'), video_info.get('width'), video_info.get('height'),
+                None, None, None, round(video_info.get('fps') or 0, 3))
+    return (
+        video_stream.get('codec_name'),
+        video_stream.get('profile'),
+        video_stream.get('width'),
+        video_stream.get('height'),
+        video_stream.get('pix_fmt'),
+        video_stream.get('time_base'),
+        video_stream.get('r_frame_rate')
+    )
+
+
+class KeyframeIndex(object):
+    """视频关键帧索引（按文件大小和修改时间缓存）"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.ffprobe_path = self.config.get('ffmpeg', 'ffprobe_path') or 'ffprobe'
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.cache_path = os.path.join(cache_folder, 'keyframe_index.json')
+        self._cache = None
+
+    def probe_keyframes(self, video_path):
+        """
+        读取视频流的关键帧时间点
+
+        只读取数据包的时间戳和标志位，不解码画面
+
+        返回: 升序的时间点列表（秒），失败返回None
+        """
+        cmd = [
+            self.ffprobe_path, '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            video_path
+        ]
+        try:
+            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        except Exception as e:
+            print(u"读取关键帧失败: {} - {}".format(video_path, str(e)))
+            return None
+
+        keyframes = []
+        for line in output.decode('utf-8', 'ignore').splitlines():
+            parts = line.strip().split(',')
+            if len(parts) < 2 or 'K' not in parts[1]:
+                continue
+            try:
+                keyframes.append(float(parts[0]))
+            except ValueError:
+                continue
+        keyframes.sort()
+        return keyframes
+
+    def get_cache_key(self, video_path):
+        """缓存键：绝对路径 + 文件大小 + 修改时间，文件变化后自动失效"""
+        try:
+            stat = os.stat(video_path)
+            return u"{}|{}|{}".format(os.path.abspath(video_path), stat.st_size, int(stat.st_mtime))
+        except OSError:
+            return os.path.abspath(video_path)
+
+    def load_cache(self):
+        """读取关键帧索引缓存"""
+        if self._cache is not None:
+            return self._cache
+        self._cache = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self._cache = json.load(f)
+            except Exception as e:
+                print(u"读取关键帧缓存失败: {}".format(str(e)))
+        return self._cache
+
+    def save_cache(self):
+        """保存关键帧索引缓存"""
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(self.cache_path, 'w') as f:
+                json.dump(self.load_cache(), f)
+        except Exception as e:
+            print(u"保存关键帧缓存失败: {}".format(str(e)))
+
+    def get_keyframes(self, video_path, refresh=False):
+        """获取视频的关键帧时间点（优先使用缓存），失败返回None"""
+        cache = self.load_cache()
+        key = self.get_cache_key(video_path)
+        if not refresh and key in cache:
+            return cache[key]
+
+        keyframes = self.probe_keyframes(video_path)
+        if keyframes:
+            cache[key] = keyframes
+            self.save_cache()
+        return keyframes
+
+    def build_lookup(self, video_infos):
+        """批量获取关键帧，返回 {视频路径: 关键帧列表}，失败的视频不包含在内"""
+        lookup = {}
+        for info in video_infos:
+            path = info['path']
+            if path in lookup:
+                continue
+            keyframes = self.get_keyframes(path)
+            if keyframes:
+                lookup[path] = keyframes
+        return lookup
+
+
+def snap_to_keyframes(keyframes, start, end, duration):
+    """
+    把[start, end)扩展到关键帧边界：起点取不晚于start的关键帧，
+    终点取不早于end的关键帧（没有则取视频结尾）
+
+    返回: (start, end)
+    """
+    epsilon = 1e-6
+    index = bisect_right(keyframes, start + epsilon) - 1
+    snapped_start = keyframes[index] if index >= 0 else 0.0
+
+    index = bisect_left(keyframes, end - epsilon)
+    if index < len(keyframes) and keyframes[index] <= snapped_start + epsilon:
+        index = bisect_right(keyframes, snapped_start + epsilon)
+    snapped_end = keyframes[index] if index < len(keyframes) else duration
+    return snapped_start, max(snapped_end, snapped_start)
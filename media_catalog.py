@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+素材目录模块
+基于SQLite记录素材在已发布视频中的使用历史，按最近使用时间计算素材新鲜度；
+并对路径、文件名和用户标签建立倒排索引，支持关键词检索素材
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import sqlite3
+from config import Config
+
+WORD_PATTERN = re.compile(u'[a-z]+|[0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+')
+CAMEL_PATTERN = re.compile(u'([a-z0-9])([A-Z])')
+
+# 倒排索引中词项的来源
+ORIGIN_PATH = 0
+ORIGIN_TAG = 1
+
+
+def to_unicode(text):
+    """路径和标签统一转为unicode"""
+    if isinstance(text, bytes):
+        try:
+            return text.decode('utf-8')
+        except UnicodeDecodeError:
+            return text.decode(sys.getfilesystemencoding() or 'utf-8', 'ignore')
+    return text
+
+
+def tokenize(text, for_query=False):
+    """
+    分词：英文和数字按单词（拆分驼峰命名），中日韩文字按单字和相邻双字
+
+    查询时中日韩词语只取双字（单字词取单字），所有双字都命中才算匹配
+    """
+    text = CAMEL_PATTERN.sub(u'\\1 \\2', to_unicode(text)).lower()
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        if word[0] < u'\u3040':
+            tokens.append(word)
+            continue
+        if len(word) == 1:
+            tokens.append(word)
+            continue
+        if not for_query:
+            tokens.extend(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def parse_query(query):
+    """
+    解析检索式，例如 "beach AND sunset -night"、"海边 OR 沙滩 NOT 夜景"
+
+    空格和AND表示同时满足，OR连接的词满足其一即可，-词 或 NOT 词 表示排除
+
+    返回: (clauses, excluded)，clauses为[[词, ...], ...]（组内为OR关系）
+    """
+    clauses = []
+    excluded = []
+    negate_next = False
+    join_next = False
+    for word in to_unicode(query).split():
+        upper = word.upper()
+        if upper == u'AND':
+            continue
+        if upper == u'OR':
+            join_next = bool(clauses)
+            continue
+        if upper == u'NOT':
+            negate_next = True
+            continue
+        if word.startswith(u'-') and len(word) > 1:
+            excluded.append(word[1:])
+        elif negate_next:
+            excluded.append(word)
+        elif join_next:
+            clauses[-1].append(word)
+        else:
+            clauses.append([word])
+        negate_next = False
+        join_next = False
+    return clauses, excluded
+
+
+class MediaCatalog(object):
+    """
+    素材目录
+
+    表结构：
+    - sources: 每个源视频一行，冗余保存最近使用时间和使用次数，查询新鲜度只需主键查找
+    - outputs: 每个发布的输出视频一行
+    - usage:   使用明细（源视频、时间范围、输出视频、使用时间），按(source_id, used_at)建索引
+    - terms/postings: 倒排索引，词项 -> 源视频，postings按(term_id, source_id)聚簇存储
+    """
+
+    def __init__(self, config=None, db_path=None):
+        self.config = config or Config()
+        catalog_config = self.config.get('catalog') or {}
+        self.db_path = db_path or catalog_config.get('database', os.path.join('cache', 'media_catalog.db'))
+        self.half_life_days = catalog_config.get('freshness_half_life_days', 30)
+        self.min_freshness = catalog_config.get('min_freshness', 0.05)
+        self._connection = None
+
+    def connect(self):
+        """打开数据库并创建表结构"""
+        if self._connection is not None:
+            return self._connection
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                last_used REAL,
+                use_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS outputs (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS usage (
+                source_id INTEGER NOT NULL,
+                output_id INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS usage_source_time ON usage (source_id, used_at);
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER NOT NULL,
+                source_id INTEGER NOT NULL,
+                origin INTEGER NOT NULL,
+                PRIMARY KEY (term_id, source_id, origin)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_source ON postings (source_id, origin);
+        """)
+        self._connection = connection
+        return connection
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _source_id(self, cursor, path):
+        """获取源视频ID，不存在时插入"""
+        path = os.path.abspath(path)
+        cursor.execute("SELECT id FROM sources WHERE path = ?", (path,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        cursor.execute("INSERT INTO sources (path) VALUES (?)", (path,))
+        return cursor.lastrowid
+
+    def record_usage(self, segments, output_path, used_at=None):
+        """
+        记录一个输出视频使用的所有片段
+
+        参数:
+            segments: 片段列表（需要video_path、start_time、duration）
+            output_path: 发布的输出视频路径
+            used_at: 使用时间戳，默认当前时间
+        """
+        if not segments:
+            return
+        used_at = used_at or time.time()
+        connection = self.connect()
+        with connection:
+            cursor = connection.cursor()
+            cursor.execute("INSERT INTO outputs (path, created) VALUES (?, ?)",
+                           (os.path.abspath(output_path), used_at))
+            output_id = cursor.lastrowid
+
+            rows = []
+            counts = {}
+            for segment in segments:
+                source_id = self._source_id(cursor, segment['video_path'])
+                start = segment['start_time']
+                rows.append((source_id, output_id, start, start + segment['duration'], used_at))
+                counts[source_id] = counts.get(source_id, 0) + 1
+            cursor.executemany(
+                "INSERT INTO usage (source_id, output_id, start_time, end_time, used_at) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            cursor.executemany(
+                "UPDATE sources SET use_count = use_count + ?, "
+                "last_used = MAX(COALESCE(last_used, 0), ?) WHERE id = ?",
+                [(count, used_at, source_id) for source_id, count in counts.items()])
+
+    def last_used(self, paths):
+        """批量查询最近使用时间，返回 {路径: 时间戳}，未使用过的不包含在内"""
+        connection = self.connect()
+        lookup = {}
+        for path in paths:
+            lookup[os.path.abspath(path)] = path
+
+        result = {}
+        keys = list(lookup)
+        # SQLite单条语句的参数数量有限制，分批查询
+        for offset in range(0, len(keys), 500):
+            chunk = keys[offset:offset + 500]
+            cursor = connection.execute(
+                "SELECT path, last_used FROM sources WHERE last_used IS NOT NULL AND path IN ({})".format(
+                    ",".join("?" * len(chunk))), chunk)
+            for path, last_used in cursor:
+                result[lookup[path]] = last_used
+        return result
+
+    def freshness(self, age_seconds):
+        """按指数衰减计算新鲜度：刚使用过接近min_freshness，经过一个半衰期恢复一半"""
+        half_life = self.half_life_days * 86400.0
+        if half_life <= 0:
+            return 1.0
+        recovered = 1.0 - math.pow(0.5, max(0.0, age_seconds) / half_life)
+        return self.min_freshness + (1.0 - self.min_freshness) * recovered
+
+    def freshness_weights(self, paths, now=None):
+        """
+        批量计算素材新鲜度权重
+
+        返回: {路径: 权重}，从未使用过的素材权重为1.0
+        """
+        now = now or time.time()
+        last_used = self.last_used(paths)
+        weights = {}
+        for path in paths:
+            if path in last_used:
+                weights[path] = self.freshness(now - last_used[path])
+            else:
+                weights[path] = 1.0
+        return weights
+
+    def get_used_intervals(self, path, since=None):
+        """查询源视频被使用过的时间范围 [(start, end, used_at), ...]"""
+        connection = self.connect()
+        row = connection.execute("SELECT id FROM sources WHERE path = ?",
+                                 (os.path.abspath(path),)).fetchone()
+        if not row:
+            return []
+        cursor = connection.execute(
+            "SELECT start_time, end_time, used_at FROM usage "
+            "WHERE source_id = ? AND used_at >= ? ORDER BY start_time",
+            (row[0], since or 0))
+        return cursor.fetchall()
+
+    def _term_ids(self, cursor, terms):
+        """获取词项ID，不存在时插入"""
+        ids = []
+        for term in set(terms):
+            cursor.execute("INSERT OR IGNORE INTO terms (term) VALUES (?)", (term,))
+            cursor.execute("SELECT id FROM terms WHERE term = ?", (term,))
+            ids.append(cursor.fetchone()[0])
+        return ids
+
+    def _replace_postings(self, cursor, source_id, terms, origin):
+        """用新的词项替换源视频某一来源的全部倒排记录"""
+        cursor.execute("DELETE FROM postings WHERE source_id = ? AND origin = ?", (source_id, origin))
+        cursor.executemany(
+            "INSERT OR IGNORE INTO postings (term_id, source_id, origin) VALUES (?, ?, ?)",
+            [(term_id, source_id, origin) for term_id in self._term_ids(cursor, terms)])
+
+    def index_sources(self, paths, root=None):
+        """
+        为源视频建立路径索引：root以下的各级文件夹名和文件名都参与分词
+
+        参数:
+            root: 素材库根目录，根目录以上的路径不参与索引；默认只索引所在文件夹和文件名
+        """
+        connection = self.connect()
+        with connection:
+            cursor = connection.cursor()
+            for path in paths:
+                absolute = os.path.abspath(path)
+                if root:
+                    relative = os.path.relpath(absolute, os.path.abspath(root))
+                else:
+                    relative = os.path.join(os.path.basename(os.path.dirname(absolute)),
+                                            os.path.basename(absolute))
+                relative = os.path.splitext(relative)[0]
+                source_id = self._source_id(cursor, absolute)
+                self._replace_postings(cursor, source_id, tokenize(relative), ORIGIN_PATH)
+
+    def set_tags(self, path, tags):
+        """设置源视频的用户标签（覆盖原有标签）"""
+        connection = self.connect()
+        with connection:
+            cursor = connection.cursor()
+            source_id = self._source_id(cursor, path)
+            terms = []
+            for tag in tags:
+                terms.extend(tokenize(tag))
+            self._replace_postings(cursor, source_id, terms, ORIGIN_TAG)
+
+    def _match_word(self, word):
+        """返回包含词语全部词项的源视频ID集合"""
+        connection = self.connect()
+        result = None
+        for term in set(tokenize(word, for_query=True)):
+            rows = connection.execute(
+                "SELECT DISTINCT p.source_id FROM postings p JOIN terms t ON t.id = p.term_id "
+                "WHERE t.term = ?", (term,))
+            ids = set(row[0] for row in rows)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def search(self, query, candidates=None):
+        """
+        按检索式查找源视频
+
+        参数:
+            candidates: 可选的候选路径列表，只在其中查找
+
+        返回: 匹配的源视频路径列表（candidates给定时保持其顺序和原始写法）
+        """
+        clauses, excluded = parse_query(query)
+        connection = self.connect()
+
+        matched = None
+        for clause in clauses:
+            ids = set()
+            for word in clause:
+                ids |= self._match_word(word)
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                break
+        if matched is None:
+            matched = set(row[0] for row in connection.execute("SELECT DISTINCT source_id FROM postings"))
+        for word in excluded:
+            if not matched:
+                break
+            matched -= self._match_word(word)
+
+        paths = set()
+        ids = list(matched)
+        for offset in range(0, len(ids), 500):
+            chunk = ids[offset:offset + 500]
+            rows = connection.execute("SELECT path FROM sources WHERE id IN ({})".format(
+                ",".join("?" * len(chunk))), chunk)
+            paths.update(row[0] for row in rows)
+
+        if candidates is not None:
+            return [path for path in candidates if os.path.abspath(path) in paths]
+        return sorted(paths)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+片段计划导入导出模块
+把片段计划保存为稳定的JSON格式（含随机种子和源视频指纹），并可导出CMX3600格式EDL
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+
+PLAN_VERSION = 1
+
+
+def source_fingerprint(video_path, block_size=65536):
+    """
+    源视频指纹：文件大小 + 文件头尾各一块数据的SHA1
+
+    只读取两小块数据，大文件也能快速计算；文件不存在返回None
+    """
+    try:
+        size = os.path.getsize(video_path)
+        digest = hashlib.sha1()
+        digest.update(str(size).encode('ascii'))
+        with open(video_path, 'rb') as f:
+            digest.update(f.read(block_size))
+            if size > block_size * 2:
+                f.seek(-block_size, os.SEEK_END)
+                digest.update(f.read(block_size))
+        return digest.hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def plan_to_dict(segments, seed=None, strategy=None, target_duration=None, output_settings=None):
+    """把片段计划转换为可序列化的字典，源视频按首次出现顺序编号"""
+    sources = []
+    source_index = {}
+    items = []
+    for segment in segments:
+        path = segment['video_path']
+        if path not in source_index:
+            source_index[path] = len(sources)
+            sources.append({
+                'path': path,
+                'duration': segment.get('video_info', {}).get('duration'),
+                'fingerprint': source_fingerprint(path)
+            })
+        item = {
+            'source': source_index[path],
+            'start_time': round(segment['start_time'], 6),
+            'duration': round(segment['duration'], 6)
+        }
+        if segment.get('copy_eligible'):
+            item['copy_eligible'] = True
+        items.append(item)
+
+    return {
+        'version': PLAN_VERSION,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'seed': seed,
+        'strategy': strategy,
+        'target_duration': target_duration,
+        'output_settings': output_settings or {},
+        'sources': sources,
+        'segments': items
+    }
+
+
+def save_plan(plan_path, segments, seed=None, strategy=None, target_duration=None, output_settings=None):
+    """保存片段计划为JSON文件（键排序，便于版本对比）"""
+    data = plan_to_dict(segments, seed, strategy, target_duration, output_settings)
+    plan_dir = os.path.dirname(plan_path)
+    if plan_dir and not os.path.exists(plan_dir):
+        os.makedirs(plan_dir)
+    text = json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False)
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    with io.open(plan_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return plan_path
+
+
+def load_plan(plan_path, video_processor=None):
+    """
+    读取JSON片段计划
+
+    参数:
+        video_processor: 可选，用于重新获取源视频信息；不提供时只使用计划中记录的时长
+
+    返回: (segments, meta)，meta包含seed、strategy、target_duration、output_settings
+    和changed_sources（指纹与计划不一致的源视频路径列表）
+    """
+    with io.open(plan_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version', 1) > PLAN_VERSION:
+        raise ValueError(u"不支持的计划文件版本: {}".format(data.get('version')))
+
+    video_infos = []
+    changed_sources = []
+    for source in data['sources']:
+        path = source['path']
+        info = video_processor.get_video_info(path) if video_processor else None
+        if info is None:
+            info = {'path': path, 'duration': source.get('duration') or 0}
+        fingerprint = source_fingerprint(path)
+        if source.get('fingerprint') and fingerprint != source['fingerprint']:
+            changed_sources.append(path)
+        video_infos.append(info)
+
+    segments = []
+    for index, item in enumerate(data['segments']):
+        video_info = video_infos[item['source']]
+        segment = {
+            'id': index,
+            'video_path': video_info['path'],
+            'start_time': item['start_time'],
+            'duration': item['duration'],
+            'video_info': video_info
+        }
+        if item.get('copy_eligible'):
+            segment['copy_eligible'] = True
+        segments.append(segment)
+
+    meta = {
+        'seed': data.get('seed'),
+        'strategy': data.get('strategy'),
+        'target_duration': data.get('target_duration'),
+        'output_settings': data.get('output_settings') or {},
+        'changed_sources': changed_sources
+    }
+    return segments, meta
+
+
+def format_timecode(seconds, fps):
+    """秒数转换为 HH:MM:SS:FF 时间码（非丢帧）"""
+    fps = int(round(fps))
+    frames = int(round(seconds * fps))
+    hours, frames = divmod(frames, 3600 * fps)
+    minutes, frames = divmod(frames, 60 * fps)
+    secs, frames = divmod(frames, fps)
+    return "{:02d}:{:02d}:{:02d}:{:02d}".format(hours, minutes, secs, frames)
+
+
+def save_edl(edl_path, segments, fps=30, title=None):
+    """导出CMX3600格式EDL，供剪辑软件导入"""
+    title = title or os.path.splitext(os.path.basename(edl_path))[0]
+    lines = [u"TITLE: {}".format(title), u"FCM: NON-DROP FRAME", u""]
+    record = 0.0
+    for index, segment in enumerate(segments, 1):
+        start = segment['start_time']
+        end = start + segment['duration']
+        lines.append(u"{:03d}  AX       V     C        {} {} {} {}".format(
+            index,
+            format_timecode(start, fps), format_timecode(end, fps),
+            format_timecode(record, fps), format_timecode(record + segment['duration'], fps)
+        ))
+        lines.append(u"* FROM CLIP NAME: {}".format(os.path.basename(segment['video_path'])))
+        lines.append(u"* SOURCE FILE: {}".format(segment['video_path']))
+        lines.append(u"")
+        record += segment['duration']
+    with io.open(edl_path, 'w', encoding='utf-8') as f:
+        f.write(u"\n".join(lines))
+    return edl_path
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+代理文件模块
+为素材库生成低分辨率、短GOP的代理文件，预览渲染用代理文件代替原始素材，
+几秒内就能检查计划；最终渲染仍使用原始素材
+"""
+
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+from config import Config
+from plan_io import source_fingerprint
+from ffmpeg_progress import run_ffmpeg
+
+
+class ProxyManager(object):
+    """代理文件管理（按源视频指纹命名，素材变化后自动重新生成）"""
+
+    def __init__(self, config=None, proxy_dir=None):
+        self.config = config or Config()
+        self.ffmpeg_path = self.config.get('ffmpeg', 'path') or 'ffmpeg'
+        self.log_level = self.config.get('ffmpeg', 'log_level') or 'error'
+        proxy_config = self.config.get('proxy') or {}
+        self.height = proxy_config.get('height', 360)
+        self.crf = proxy_config.get('crf', 28)
+        # 关键帧间隔很短，预览渲染从任意位置截取时几乎不需要多解码
+        self.gop = proxy_config.get('gop', 10)
+        self.workers = proxy_config.get('workers', 2)
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.proxy_dir = proxy_dir or os.path.join(cache_folder, 'proxies')
+        self.progress_callback = None
+        self._fingerprints = {}
+
+    def proxy_path(self, video_path):
+        """代理文件路径：源视频指纹 + 代理高度"""
+        if video_path not in self._fingerprints:
+            self._fingerprints[video_path] = source_fingerprint(video_path) or \
+                os.path.basename(video_path).replace('.', '_')
+        return os.path.join(self.proxy_dir, "{}_{}p.mp4".format(self._fingerprints[video_path], self.height))
+
+    def get_proxy(self, video_path):
+        """返回已生成的代理文件路径，没有返回None"""
+        path = self.proxy_path(video_path)
+        return path if os.path.exists(path) else None
+
+    def build_lookup(self, video_paths):
+        """返回 {源视频路径: 代理文件路径}，只包含已生成代理的视频"""
+        lookup = {}
+        for video_path in video_paths:
+            proxy = self.get_proxy(video_path)
+            if proxy:
+                lookup[video_path] = proxy
+        return lookup
+
+    def create_proxy(self, video_path):
+        """
+        生成一个代理文件（只有视频流，保持源视频时间轴），已存在时直接返回
+
+        先写临时文件再重命名，预览渲染不会读到写了一半的代理
+        返回: (是否成功, 代理文件路径或错误信息)
+        """
+        path = self.proxy_path(video_path)
+        if os.path.exists(path):
+            return True, path
+        if not os.path.exists(self.proxy_dir):
+            try:
+                os.makedirs(self.proxy_dir)
+            except OSError:
+                if not os.path.isdir(self.proxy_dir):
+                    raise
+        partial_path = "{}.{}.part".format(path, os.getpid())
+        cmd = [
+            self.ffmpeg_path, '-y', '-loglevel', self.log_level,
+            '-i', video_path,
+            '-map', '0:v:0', '-an', '-sn',
+            '-vf', 'scale=-2:{}'.format(self.height),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(self.crf),
+            '-g', str(self.gop), '-keyint_min', str(self.gop), '-sc_threshold', '0', '-bf', '0',
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            '-f', 'mp4', partial_path
+        ]
+        try:
+            returncode, stderr = run_ffmpeg(cmd, callback=self.progress_callback,
+                                            job=os.path.basename(video_path))
+            if returncode != 0:
+                return False, stderr
+            os.rename(partial_path, path)
+            return True, path
+        except Exception as e:
+            return False, u"生成代理文件失败: {}".format(str(e))
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def generate(self, video_paths):
+        """
+        为多个视频并行生成代理文件
+
+        返回: {源视频路径: 代理文件路径}，失败的视频不包含在内
+        """
+        video_paths = list(dict.fromkeys(video_paths))
+        lookup = {}
+        pool = ThreadPool(max(1, self.workers))
+        try:
+            for video_path, (success, result) in zip(video_paths, pool.map(self.create_proxy, video_paths)):
+                if success:
+                    lookup[video_path] = result
+                else:
+                    print(u"代理文件生成失败: {} - {}".format(os.path.basename(video_path), result))
+        finally:
+            pool.close()
+            pool.join()
+        print(u"代理文件: {}/{} 个可用".format(len(lookup), len(video_paths)))
+        return lookup
+
+    def start_background(self, video_paths):
+        """在后台线程中生成代理文件，返回线程对象（可join等待完成）"""
+        thread = threading.Thread(target=self.generate, args=(list(video_paths),))
+        thread.daemon = True
+        thread.start()
+        return thread
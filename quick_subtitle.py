@@ -7,6 +7,7 @@
 import os
 import sys
 from subtitle_inserter import SubtitleInserter
+from ffmpeg_progress import print_progress
 
 def main():
     print("=" * 60)
@@ -32,6 +33,7 @@ def main():
     
     # 创建字幕插入器
     inserter = SubtitleInserter()
+    inserter.progress_callback = print_progress
     
     try:
         print(u"开始处理...")
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+画面区域检测模块
+基于低分辨率采样帧自动定位烧录字幕等区域
+"""
+
+import os
+import json
+import time
+from config import Config
+from frame_sampler import FrameSampler
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def edge_map(frames, threshold=40):
+    """计算每帧的二值边缘图（水平+垂直梯度）"""
+    data = frames.astype(np.int16)
+    grad_x = np.abs(np.diff(data, axis=2))[:, :-1, :]
+    grad_y = np.abs(np.diff(data, axis=1))[:, :, :-1]
+    return (grad_x + grad_y) > threshold
+
+
+def find_runs(mask):
+    """查找布尔数组中连续为True的区间，返回[(start, end), ...]（end不含）"""
+    runs = []
+    start = None
+    for i, value in enumerate(mask):
+        if value and start is None:
+            start = i
+        elif not value and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(mask)))
+    return runs
+
+
+def scale_region(region, sample_size, video_info, pad_x=0.0, pad_y=0.0):
+    """把采样分辨率下的区域换算为原视频坐标，并按比例外扩、对齐到偶数"""
+    sample_width, sample_height = sample_size
+    scale_x = float(video_info['width']) / sample_width
+    scale_y = float(video_info['height']) / sample_height
+
+    x0, y0, x1, y1 = region
+    extra_x = (x1 - x0) * pad_x
+    extra_y = (y1 - y0) * pad_y
+    left = max(0, int((x0 - extra_x) * scale_x))
+    top = max(0, int((y0 - extra_y) * scale_y))
+    right = min(video_info['width'], int(round((x1 + extra_x) * scale_x)))
+    bottom = min(video_info['height'], int(round((y1 + extra_y) * scale_y)))
+
+    left -= left % 2
+    top -= top % 2
+    width = (right - left) - (right - left) % 2
+    height = (bottom - top) - (bottom - top) % 2
+    return {'x': left, 'y': top, 'width': width, 'height': height}
+
+
+class SubtitleRegionDetector(object):
+    """烧录字幕区域检测器"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.sampler = FrameSampler(self.config)
+        self.sample_count = self.config.get('analysis', 'sample_frames') or 24
+        self.edge_threshold = 40
+        # 字幕只在画面顶部和底部出现，中间区域不参与搜索
+        self.search_zones = [(0.0, 0.25), (0.55, 1.0)]
+
+    def compute_heatmap(self, frames):
+        """
+        计算文字可能性热力图
+
+        边缘密度：文字笔画在小范围内产生密集的强边缘
+        时间稳定性：字幕文字内容会变，但所在行位置在各帧间保持不变
+
+        返回: (heatmap, row_scores)
+        """
+        edges = edge_map(frames, self.edge_threshold)
+        # 每个像素在各帧中成为边缘的频率
+        heatmap = edges.mean(axis=0)
+
+        # 每帧每行的边缘密度，与该帧的整体水平比较，得到该行"有文字"的帧比例
+        row_density = edges.mean(axis=2)
+        frame_baseline = np.median(row_density, axis=1)[:, np.newaxis]
+        presence = (row_density > frame_baseline * 2.0 + 0.02).mean(axis=0)
+
+        row_scores = heatmap.mean(axis=1) * presence
+        # 3行平滑，消除笔画间隙造成的断行
+        kernel = np.ones(3) / 3.0
+        row_scores = np.convolve(row_scores, kernel, mode='same')
+        return heatmap, row_scores
+
+    def locate_band(self, heatmap, row_scores):
+        """从行得分中找出字幕带，返回采样坐标下的(x0, y0, x1, y1)和置信度"""
+        rows = len(row_scores)
+        zone_mask = np.zeros(rows, dtype=bool)
+        for zone_start, zone_end in self.search_zones:
+            zone_mask[int(rows * zone_start):int(rows * zone_end)] = True
+
+        candidates = np.where(zone_mask, row_scores, 0.0)
+        peak_row = int(np.argmax(candidates))
+        peak = candidates[peak_row]
+        # 画面中部的普通内容决定噪声水平，字幕带必须明显高于它
+        baseline = float(np.median(row_scores))
+        middle = row_scores[~zone_mask]
+        middle_peak = float(middle.max()) if len(middle) else 0.0
+        threshold = max(baseline * 3.0, middle_peak * 1.5, 0.01)
+        if peak < threshold:
+            return None, 0.0
+
+        # 以峰值为中心，扩展到得分超过峰值一半的连续行
+        band_mask = (candidates >= max(peak * 0.35, threshold * 0.5)) & zone_mask
+        y0, y1 = peak_row, peak_row + 1
+        for start, end in find_runs(band_mask):
+            if start <= peak_row < end:
+                y0, y1 = start, end
+                break
+
+        # 水平范围：字幕带内边缘频率明显高于该列整体水平的列
+        column_profile = heatmap[y0:y1].mean(axis=0)
+        column_baseline = np.median(heatmap, axis=0)
+        column_mask = column_profile > np.maximum(column_baseline * 2.0, column_profile.max() * 0.25)
+        columns = np.nonzero(column_mask)[0]
+        if len(columns) == 0:
+            return None, 0.0
+        x0, x1 = int(columns[0]), int(columns[-1]) + 1
+
+        confidence = min(1.0, float(peak) / (threshold * 4.0))
+        return (x0, y0, x1, y1), confidence
+
+    def detect(self, video_path, video_info, frames=None):
+        """
+        自动检测视频中的烧录字幕区域
+
+        参数:
+        - video_path: 视频路径
+        - video_info: 视频信息（需包含width/height/duration）
+        - frames: 可选，已采样的帧数组（N x H x W）
+
+        返回: {'x', 'y', 'width', 'height', 'confidence'}，未检测到返回None
+        """
+        if frames is None:
+            if not self.sampler.is_available():
+                return None
+            frames, _ = self.sampler.sample_uniform(video_path, video_info, self.sample_count)
+        if frames is None or len(frames) < 2:
+            return None
+
+        heatmap, row_scores = self.compute_heatmap(frames)
+        band, confidence = self.locate_band(heatmap, row_scores)
+        if band is None:
+            return None
+
+        sample_size = (frames.shape[2], frames.shape[1])
+        region = scale_region(band, sample_size, video_info, pad_x=0.04, pad_y=0.25)
+        if region['width'] <= 0 or region['height'] <= 0:
+            return None
+        region['confidence'] = confidence
+        return region
+
+
+def grid_components(cell_mask):
+    """在二维布尔网格上查找4邻接连通块，返回[(cells), ...]"""
+    rows, cols = cell_mask.shape
+    visited = np.zeros_like(cell_mask, dtype=bool)
+    components = []
+    for row in range(rows):
+        for col in range(cols):
+            if not cell_mask[row, col] or visited[row, col]:
+                continue
+            stack = [(row, col)]
+            visited[row, col] = True
+            cells = []
+            while stack:
+                r, c = stack.pop()
+                cells.append((r, c))
+                for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                    if 0 <= nr < rows and 0 <= nc < cols and cell_mask[nr, nc] and not visited[nr, nc]:
+                        visited[nr, nc] = True
+                        stack.append((nr, nc))
+            components.append(cells)
+    return components
+
+
+class WatermarkDetector(object):
+    """静态水印/台标检测器"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.sampler = FrameSampler(self.config)
+        self.keyframe_count = self.config.get('analysis', 'watermark_keyframes') or 16
+        self.edge_threshold = 30
+        self.cell_size = 4
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.cache_path = os.path.join(cache_folder, 'watermark_masks.json')
+
+    def compute_static_map(self, frames):
+        """
+        计算静态边缘图
+
+        时间中值：去除运动内容后保留静止的台标
+        梯度一致性：台标边缘在每个关键帧的同一位置都出现，普通画面边缘会随内容移动
+
+        返回: 每个像素的静态边缘得分（0-1）
+        """
+        median_frame = np.median(frames, axis=0).astype(np.uint8)
+        median_edges = edge_map(median_frame[np.newaxis], self.edge_threshold)[0]
+        consistency = edge_map(frames, self.edge_threshold).mean(axis=0)
+        return median_edges * consistency
+
+    def locate_logos(self, static_map, max_logos=2):
+        """把静态边缘图聚合成台标区域，返回采样坐标下的[(x0, y0, x1, y1, score), ...]"""
+        cell = self.cell_size
+        rows = static_map.shape[0] // cell
+        cols = static_map.shape[1] // cell
+        if rows == 0 or cols == 0:
+            return []
+
+        cells = static_map[:rows * cell, :cols * cell].reshape(rows, cell, cols, cell).mean(axis=(1, 3))
+        cell_mask = cells > 0.3
+
+        logos = []
+        for component in grid_components(cell_mask):
+            component_rows = [r for r, c in component]
+            component_cols = [c for r, c in component]
+            r0, r1 = min(component_rows), max(component_rows) + 1
+            c0, c1 = min(component_cols), max(component_cols) + 1
+            # 跨越大半个画面的静态边缘通常是黑边或画中画边框，不是台标
+            if (c1 - c0) > cols * 0.5 or (r1 - r0) > rows * 0.5:
+                continue
+            if len(component) < 2:
+                continue
+            score = float(sum(cells[r, c] for r, c in component))
+            logos.append((c0 * cell, r0 * cell, c1 * cell, r1 * cell, score))
+
+        logos.sort(key=lambda item: item[4], reverse=True)
+        return logos[:max_logos]
+
+    def detect(self, video_path, video_info, frames=None):
+        """
+        检测视频中的静态水印
+
+        返回: 区域列表 [{'x', 'y', 'width', 'height', 'score'}, ...]，未检测到返回空列表
+        """
+        if frames is None:
+            if not self.sampler.is_available():
+                return []
+            frames, _ = self.sampler.sample_keyframes(video_path, video_info, self.keyframe_count)
+        if frames is None or len(frames) < 3:
+            return []
+
+        static_map = self.compute_static_map(frames)
+        sample_size = (frames.shape[2], frames.shape[1])
+        regions = []
+        for x0, y0, x1, y1, score in self.locate_logos(static_map):
+            region = scale_region((x0, y0, x1, y1), sample_size, video_info, pad_x=0.15, pad_y=0.15)
+            if region['width'] > 0 and region['height'] > 0:
+                region['score'] = score
+                regions.append(region)
+        return regions
+
+    def get_cache_key(self, video_path, video_info, channel=None):
+        """缓存键：频道名（未指定时使用所在文件夹）+ 分辨率"""
+        source = channel or os.path.dirname(os.path.abspath(video_path))
+        return u"{}|{}x{}".format(source, video_info['width'], video_info['height'])
+
+    def load_cache(self):
+        """读取水印检测缓存"""
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(u"读取水印缓存失败: {}".format(str(e)))
+            return {}
+
+    def save_cache(self, cache):
+        """保存水印检测缓存"""
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(self.cache_path, 'w') as f:
+                json.dump(cache, f, indent=2)
+        except Exception as e:
+            print(u"保存水印缓存失败: {}".format(str(e)))
+
+    def detect_cached(self, video_path, video_info, channel=None, refresh=False):
+        """
+        检测水印并按频道/文件夹缓存结果，同一来源的视频只需检测一次
+
+        未检测到水印的结果同样缓存，采样失败时不缓存
+        返回: (regions, from_cache)
+        """
+        key = self.get_cache_key(video_path, video_info, channel)
+        cache = self.load_cache()
+        if not refresh and key in cache:
+            return cache[key]['regions'], True
+
+        if not self.sampler.is_available():
+            return [], False
+        frames, _ = self.sampler.sample_keyframes(video_path, video_info, self.keyframe_count)
+        if frames is None:
+            return [], False
+
+        regions = self.detect(video_path, video_info, frames=frames)
+        cache[key] = {
+            'regions': regions,
+            'sample_video': os.path.basename(video_path),
+            'created': time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self.save_cache(cache)
+        return regions, False
+
+    def build_filter(self, regions, video_info, method='delogo', blur_strength=10):
+        """
+        生成去水印滤镜
+
+        参数:
+        - method: 'delogo' 使用delogo插值修补, 'blur' 使用boxblur模糊
+        """
+        filters = []
+        for region in regions:
+            # delogo要求区域不能贴住画面边缘
+            x = max(1, region['x'])
+            y = max(1, region['y'])
+            width = min(region['width'], video_info['width'] - x - 1)
+            height = min(region['height'], video_info['height'] - y - 1)
+            if width <= 0 or height <= 0:
+                continue
+            if method == 'blur':
+                index = len(filters)
+                filters.append(
+                    "split[main{0}][logo{0}];[logo{0}]crop=w={1}:h={2}:x={3}:y={4},boxblur={5}[blurred{0}];"
+                    "[main{0}][blurred{0}]overlay={3}:{4}".format(index, width, height, x, y, blur_strength)
+                )
+            else:
+                filters.append("delogo=x={}:y={}:w={}:h={}".format(x, y, width, height))
+        return ",".join(filters)
+
+
+class AdPlacementAnalyzer(object):
+    """广告位置分析器 - 为广告时间窗口挑选干扰最小的画面区域"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.sampler = FrameSampler(self.config)
+        self.sample_count = self.config.get('analysis', 'ad_sample_frames') or 8
+        self.edge_threshold = 40
+        # 运动、边缘、文字三项的权重
+        self.weights = {'motion': 2.0, 'edges': 1.0, 'text': 1.5}
+
+    def score_regions(self, frames, regions, video_info):
+        """
+        为每个候选区域计算干扰得分（越低越适合放广告）
+
+        参数:
+        - frames: 采样帧数组（N x H x W）
+        - regions: {name: {'x', 'y', 'width', 'height'}}，原视频坐标
+
+        返回: {name: {'motion', 'edges', 'text', 'score'}}
+        """
+        data = frames.astype(np.float32)
+        if len(data) > 1:
+            motion_map = np.abs(np.diff(data, axis=0)).mean(axis=0) / 255.0
+        else:
+            motion_map = np.zeros(data.shape[1:], dtype=np.float32)
+        edge_frequency = edge_map(frames, self.edge_threshold).mean(axis=0)
+        # 大多数采样帧中都存在的边缘视为文字/台标等叠加元素
+        text_map = edge_frequency > 0.5
+
+        scale_x = float(frames.shape[2]) / video_info['width']
+        scale_y = float(frames.shape[1]) / video_info['height']
+        scores = {}
+        for name, region in regions.items():
+            x0 = int(region['x'] * scale_x)
+            y0 = int(region['y'] * scale_y)
+            x1 = max(x0 + 1, int(round((region['x'] + region['width']) * scale_x)))
+            y1 = max(y0 + 1, int(round((region['y'] + region['height']) * scale_y)))
+            motion = float(motion_map[y0:y1, x0:x1].mean())
+            edges = float(edge_frequency[y0:y1, x0:x1].mean())
+            text = float(text_map[y0:y1, x0:x1].mean())
+            scores[name] = {
+                'motion': motion,
+                'edges': edges,
+                'text': text,
+                'score': (self.weights['motion'] * motion +
+                          self.weights['edges'] * edges +
+                          self.weights['text'] * text)
+            }
+        return scores
+
+    def choose_position(self, video_path, video_info, regions, start_time, duration, frames=None):
+        """
+        在广告显示时间窗口内采样，选出干扰最小的位置
+
+        广告窗口通常比GOP短，只解码关键帧时各采样点会落到同一个（可能在窗口之前的）关键帧上，
+        运动强度恒为0；因此用单个ffmpeg进程快速定位到窗口起点，只解码窗口内的画面并均匀取帧
+
+        返回: (position_name, scores)，无法分析时返回(None, {})
+        """
+        if frames is None:
+            if not self.sampler.is_available():
+                return None, {}
+            frames, _ = self.sampler.sample_uniform(video_path, video_info, self.sample_count,
+                                                    start_time, start_time + duration)
+        if frames is None or len(frames) == 0:
+            return None, {}
+
+        scores = self.score_regions(frames, regions, video_info)
+        best = min(sorted(scores), key=lambda name: scores[name]['score'])
+        return best, scores
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+片段缓存模块
+按内容寻址缓存已统一编码参数的片段文件，重复使用的素材窗口只需拼接，不再重新编码
+"""
+
+import os
+import shutil
+import hashlib
+from config import Config
+from plan_io import source_fingerprint
+
+
+class SegmentCache(object):
+    """
+    已编码片段缓存（磁盘容量上限，最近最少使用淘汰）
+
+    文件的修改时间即最近使用时间，命中时更新；多个任务同时使用同一缓存目录也不需要共享索引
+    """
+
+    def __init__(self, config=None, cache_dir=None, budget_mb=None):
+        self.config = config or Config()
+        cache_folder = self.config.get('analysis', 'cache_folder') or 'cache'
+        self.cache_dir = cache_dir or os.path.join(cache_folder, 'segments')
+        if budget_mb is None:
+            budget_mb = self.config.get('processing', 'segment_cache_mb') or 2048
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._fingerprints = {}
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def make_key(self, segment, params, pix_fmt='yuv420p'):
+        """缓存键：源视频指纹、起点、时长和全部输出编码参数"""
+        path = segment['video_path']
+        if path not in self._fingerprints:
+            self._fingerprints[path] = source_fingerprint(path) or os.path.abspath(path)
+        key = u"{}|{:.6f}|{:.6f}|{}|{}|{}|{}|{}|{}".format(
+            self._fingerprints[path], segment['start_time'], segment['duration'],
+            params['width'], params['height'], params['fps'], params['crf'], params['preset'], pix_fmt)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        """缓存文件路径（按键前两位分子目录）"""
+        return os.path.join(self.cache_dir, key[:2], key + '.mp4')
+
+    def contains(self, key):
+        """检查是否已缓存（不计入命中统计）"""
+        return os.path.exists(self.path_for(key))
+
+    def lookup(self, key):
+        """查找缓存，命中时更新使用时间并返回文件路径，未命中返回None"""
+        path = self.path_for(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def store(self, key, file_path):
+        """
+        把已编码的片段移入缓存，返回缓存文件路径
+
+        先移动为同目录下的临时文件再重命名，其他任务不会读到写了一半的文件
+        """
+        path = self.path_for(key)
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        partial_path = "{}.{}.part".format(path, os.getpid())
+        shutil.move(file_path, partial_path)
+        try:
+            os.rename(partial_path, path)
+        except OSError:
+            # Windows下目标已存在时重命名失败：其他任务已写入相同内容
+            if not os.path.exists(path):
+                raise
+            os.remove(partial_path)
+        self.stored += 1
+        return path
+
+    def entries(self):
+        """返回 [(修改时间, 大小, 路径), ...]，跳过写入中的临时文件"""
+        result = []
+        if not os.path.exists(self.cache_dir):
+            return result
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.mp4'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result.append((stat.st_mtime, stat.st_size, path))
+        return result
+
+    def evict(self, keep=None):
+        """
+        超出容量上限时按最近使用时间从旧到新删除
+
+        keep: 可选，本次任务正在使用、不能删除的文件路径
+        返回: 删除的文件数
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.budget_bytes:
+            return 0
+        keep = set(os.path.abspath(path) for path in keep or [])
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.budget_bytes:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.evicted += removed
+        return removed
+
+    def metrics(self):
+        """命中统计和当前占用"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'stored': self.stored,
+            'evicted': self.evicted,
+            'bytes': sum(size for _, size, _ in self.entries()),
+            'budget_bytes': self.budget_bytes
+        }
@@ -0,0 +1,707 @@
+# -*- coding: utf-8 -*-
+"""
+片段规划模块
+基于索引数组的线性时间混剪策略实现，供VideoProcessor调用
+"""
+
+import math
+import random
+from bisect import bisect_right
+from collections import deque
+from config import Config
+from keyframe_index import copy_signature, snap_to_keyframes
+
+
+class AliasSampler(object):
+    """Walker/Vose别名采样器：O(n)建表，O(1)按权重抽取索引"""
+
+    def __init__(self, weights, rng=None):
+        self.rng = rng or random.Random()
+        count = len(weights)
+        if count == 0:
+            raise ValueError(u"权重列表不能为空")
+
+        total = float(sum(weights))
+        if total <= 0:
+            # 权重全为0时退化为均匀抽样
+            weights = [1.0] * count
+            total = float(count)
+
+        scaled = [w * count / total for w in weights]
+        self.probability = [0.0] * count
+        self.alias = [0] * count
+
+        small = deque(i for i, p in enumerate(scaled) if p < 1.0)
+        large = deque(i for i, p in enumerate(scaled) if p >= 1.0)
+        while small and large:
+            less = small.popleft()
+            more = large.popleft()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # 剩余项由于浮点误差可能略偏离1，直接视为1
+        for index in large:
+            self.probability[index] = 1.0
+        for index in small:
+            self.probability[index] = 1.0
+
+    def __len__(self):
+        return len(self.probability)
+
+    def pick(self):
+        """按权重抽取一个索引"""
+        column = int(self.rng.random() * len(self.probability))
+        if self.rng.random() < self.probability[column]:
+            return column
+        return self.alias[column]
+
+
+class IntervalSet(object):
+    """
+    有序不相交区间集合（左闭右开），重叠检查为O(log n)
+
+    merge会合并重叠和相接的区间，区间数不超过视频时长/最短片段时长，
+    插入时的列表移动开销只与单个源视频的长度有关，不随计划数或版本数增长
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        """检查[start, end)是否与已有区间重叠"""
+        index = bisect_right(self.starts, start)
+        if index > 0 and self.ends[index - 1] > start:
+            return True
+        return index < len(self.starts) and self.starts[index] < end
+
+    def add(self, start, end):
+        """加入区间（调用方保证不与已有区间重叠）"""
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+    def merge(self, start, end):
+        """加入区间，与已有区间重叠或相接时合并"""
+        left = bisect_right(self.ends, start - 1e-9)
+        right = bisect_right(self.starts, end + 1e-9)
+        if left < right:
+            start = min(start, self.starts[left])
+            end = max(end, self.ends[right - 1])
+        self.starts[left:right] = [start]
+        self.ends[left:right] = [end]
+
+    def overlap_length(self, start, end):
+        """计算[start, end)与已有区间的重叠总长度（区间需互不重叠，O(log n + k)）"""
+        index = max(0, bisect_right(self.starts, start) - 1)
+        total = 0
+        while index < len(self.starts) and self.starts[index] < end:
+            total += max(0, min(end, self.ends[index]) - max(start, self.starts[index]))
+            index += 1
+        return total
+
+    def gaps(self, lower, upper):
+        """按顺序返回[lower, upper)内的空闲区间"""
+        result = []
+        cursor = lower
+        for start, end in zip(self.starts, self.ends):
+            if start > cursor:
+                result.append((cursor, min(start, upper)))
+            cursor = max(cursor, end)
+            if cursor >= upper:
+                break
+        if cursor < upper:
+            result.append((cursor, upper))
+        return result
+
+    def gaps_near(self, position, lower, upper, count=2):
+        """
+        返回position附近的空闲区间：包含（或紧随）position的空闲区间及其前后各count个，
+        区间需互不重叠（merge维护），二分定位后只访问常数个区间，与区间总数无关
+        """
+        index = bisect_right(self.starts, position)
+        result = []
+        for k in range(max(0, index - count), min(len(self.starts), index + count) + 1):
+            gap_start = max(lower, self.ends[k - 1] if k > 0 else lower)
+            gap_end = min(upper, self.starts[k] if k < len(self.starts) else upper)
+            if gap_end > gap_start:
+                result.append((gap_start, gap_end))
+        return result
+
+
+class SegmentPlanner(object):
+    """
+    片段规划器
+
+    内部只维护并行的索引数组（源索引、起点、时长），
+    最后一次性生成与原策略相同结构的片段字典
+    """
+
+    def __init__(self, config=None, seed=None, source_weights=None):
+        """
+        source_weights: 可选的 {视频路径: 权重系数}，例如素材新鲜度，
+        与视频时长相乘后作为抽取权重
+        """
+        self.config = config or Config()
+        self.source_weights = source_weights or {}
+        self.min_segment_duration = self.config.get('processing', 'min_segment_duration') or 1.0
+        if seed is None:
+            seed = self.config.get('processing', 'random_seed')
+        if seed is None:
+            # 记录实际使用的种子，导出计划后可以复现
+            seed = random.SystemRandom().randint(0, 2 ** 31 - 1)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    def selection_weights(self, video_infos, sizes):
+        """抽取权重：视频长度乘以权重系数"""
+        if not self.source_weights:
+            return sizes
+        return [size * self.source_weights.get(info['path'], 1.0)
+                for info, size in zip(video_infos, sizes)]
+
+    def build_segments(self, video_infos, sources, starts, durations, first_id=0):
+        """把索引数组转换为片段字典列表"""
+        segments = []
+        for offset, (source, start, duration) in enumerate(zip(sources, starts, durations)):
+            video_info = video_infos[source]
+            segments.append({
+                'id': first_id + offset,
+                'video_path': video_info['path'],
+                'start_time': start,
+                'duration': duration,
+                'video_info': video_info
+            })
+        return segments
+
+    def _fill_random(self, durations_by_source, sampler, remaining, sources, starts, durations):
+        """按时长加权随机抽取源视频，向数组追加片段直到填满remaining"""
+        rng = self.rng
+        min_duration = self.min_segment_duration
+        while remaining > 0:
+            source = sampler.pick()
+            video_duration = durations_by_source[source]
+
+            max_duration = min(remaining, video_duration)
+            if max_duration < min_duration:
+                duration = max_duration
+            else:
+                duration = rng.uniform(min_duration, max_duration)
+
+            if video_duration > duration:
+                start = rng.uniform(0, video_duration - duration)
+            else:
+                start = 0
+                duration = video_duration
+
+            sources.append(source)
+            starts.append(start)
+            durations.append(duration)
+            remaining -= duration
+
+    def plan_random(self, video_infos, target_duration):
+        """随机策略：按视频时长加权O(1)抽取源视频，随机选择起点"""
+        if not video_infos:
+            return []
+        durations_by_source = [info['duration'] for info in video_infos]
+        sampler = AliasSampler(self.selection_weights(video_infos, durations_by_source), self.rng)
+
+        sources, starts, durations = [], [], []
+        self._fill_random(durations_by_source, sampler, target_duration, sources, starts, durations)
+        return self.build_segments(video_infos, sources, starts, durations)
+
+    def plan_sequential(self, video_infos, target_duration):
+        """顺序策略：依次从每个视频开头连续截取"""
+        if not video_infos:
+            return []
+        min_duration = self.min_segment_duration
+        count = len(video_infos)
+
+        sources, starts, durations = [], [], []
+        remaining = target_duration
+        video_index = 0
+        current_start = 0
+        skipped = 0
+
+        while remaining > 0:
+            if video_index >= count:
+                video_index = 0
+                current_start = 0
+
+            video_duration = video_infos[video_index]['duration']
+            available = video_duration - current_start
+            if available <= 0:
+                video_index += 1
+                current_start = 0
+                continue
+
+            duration = min(remaining, available)
+            # 所有视频都短于最短片段时不再跳过，避免死循环
+            if duration < min_duration and remaining > min_duration and skipped < count:
+                video_index += 1
+                current_start = 0
+                skipped += 1
+                continue
+            skipped = 0
+
+            sources.append(video_index)
+            starts.append(current_start)
+            durations.append(duration)
+
+            current_start += duration
+            remaining -= duration
+            if current_start >= video_duration:
+                video_index += 1
+                current_start = 0
+
+        return self.build_segments(video_infos, sources, starts, durations)
+
+    def plan_balanced(self, video_infos, target_duration):
+        """平衡策略：每个视频贡献相同时长，不足部分按时长加权随机补齐"""
+        if not video_infos:
+            return []
+        durations_by_source = [info['duration'] for info in video_infos]
+        share = float(target_duration) / len(video_infos)
+
+        sources, starts, durations = [], [], []
+        for source, video_duration in enumerate(durations_by_source):
+            if video_duration <= share:
+                # 视频太短，就用全部
+                sources.append(source)
+                starts.append(0)
+                durations.append(video_duration)
+            else:
+                sources.append(source)
+                starts.append(self.rng.uniform(0, video_duration - share))
+                durations.append(share)
+
+        remaining = target_duration - sum(durations)
+        if remaining > 0:
+            sampler = AliasSampler(self.selection_weights(video_infos, durations_by_source), self.rng)
+            self._fill_random(durations_by_source, sampler, remaining, sources, starts, durations)
+
+        return self.build_segments(video_infos, sources, starts, durations)
+
+    def plan_constrained(self, video_infos, target_duration, fps=None):
+        """
+        约束策略：
+        - 每个源视频最多使用max_segments_per_video次
+        - 同一源视频的片段时间范围互不重叠
+        - 片段时长在[min_segment_duration, max_segment_duration]之间
+        - 所有时间按输出帧率取整，总时长精确等于目标帧数
+
+        源视频按时长（乘以权重系数）加权抽取，不可用的源从候选中移除，候选减少一半时重建别名表
+        """
+        if not video_infos:
+            return []
+
+        fps = float(fps or self.config.get('video', 'default_fps') or 30)
+        max_per_video = self.config.get('processing', 'max_segments_per_video') or 0
+        min_frames = max(1, int(round(self.min_segment_duration * fps)))
+        max_duration = self.config.get('processing', 'max_segment_duration')
+        max_frames = max(min_frames, int(round(max_duration * fps))) if max_duration else None
+        remaining = int(round(target_duration * fps))
+
+        source_frames = [int(info['duration'] * fps) for info in video_infos]
+        weights = self.selection_weights(video_infos, source_frames)
+        used = [IntervalSet() for _ in video_infos]
+        active = set(i for i, frames in enumerate(source_frames) if frames > 0)
+
+        sources, starts, durations = [], [], []
+        sampler = None
+        sampler_sources = []
+        removed = set()
+        misses = 0
+        slots = sum(max_per_video for _ in active) if max_per_video else 0
+
+        while remaining > 0 and active:
+            if sampler is None or len(removed) * 2 > len(sampler_sources):
+                sampler_sources = sorted(active)
+                sampler = AliasSampler([weights[i] for i in sampler_sources], self.rng)
+                removed = set()
+            source = sampler_sources[sampler.pick()]
+            if source in removed:
+                continue
+
+            # 剩余可用片段数不多时提高最短长度，避免片段数用完而时长不足
+            lower = min_frames
+            if max_per_video:
+                lower = max(lower, -(-remaining // max(1, slots)))
+                if max_frames:
+                    lower = min(lower, max_frames)
+            wanted = self._choose_length(remaining, lower, max_frames)
+            start, length = self._find_free_range(used[source], source_frames[source], wanted,
+                                                  min(min_frames, remaining))
+            if start is None:
+                # 没有任何足够长的空闲范围，该源视频已用尽
+                removed.add(source)
+                active.discard(source)
+                if max_per_video:
+                    slots -= max_per_video - len(used[source])
+                continue
+            if length < wanted and 0 < remaining - length < min_frames:
+                # 缩短后剩余部分不足一个最短片段，再留出min_frames
+                length = remaining - min_frames
+                if length < min_frames:
+                    # 该源视频放不下最后一段，换一个源视频；全部都放不下时放弃
+                    misses += 1
+                    if misses > 2 * len(active) + 8:
+                        break
+                    continue
+            misses = 0
+
+            used[source].add(start, start + length)
+            sources.append(source)
+            starts.append(start / fps)
+            durations.append(length / fps)
+            remaining -= length
+            slots -= 1
+
+            if max_per_video and len(used[source]) >= max_per_video:
+                removed.add(source)
+                active.discard(source)
+
+        if remaining > 0:
+            print(u"警告：受片段数量和不重复约束限制，计划比目标时长短 {:.2f}秒".format(remaining / fps))
+
+        return self.build_segments(video_infos, sources, starts, durations)
+
+    def _choose_length(self, remaining, min_frames, max_frames):
+        """选择片段帧数，保证剩余部分不会小于最短片段"""
+        upper = remaining if max_frames is None else min(max_frames, remaining)
+        if remaining <= upper:
+            return remaining
+        # 给最后一段留出至少min_frames
+        upper = min(upper, remaining - min_frames)
+        if upper <= min_frames:
+            return min(remaining, min_frames)
+        return self.rng.randint(min_frames, upper)
+
+    def _find_free_range(self, used, total_frames, length, min_length):
+        """
+        在源视频未使用的时间范围内找一个位置
+
+        先随机尝试几次（每次O(log n)检查），失败再扫描空闲区间；
+        空闲区间都不够长时缩短片段，但不短于min_length
+
+        返回: (start, length)，找不到返回(None, 0)
+        """
+        if length <= total_frames:
+            for _ in range(4):
+                start = self.rng.randint(0, total_frames - length)
+                if not used.overlaps(start, start + length):
+                    return start, length
+
+        gaps = used.gaps(0, total_frames)
+        fitting = [(gap_start, gap_end) for gap_start, gap_end in gaps if gap_end - gap_start >= length]
+        if fitting:
+            gap_start, gap_end = fitting[self.rng.randint(0, len(fitting) - 1)]
+            return self.rng.randint(gap_start, gap_end - length), length
+
+        if not gaps:
+            return None, 0
+        gap_start, gap_end = max(gaps, key=lambda gap: gap[1] - gap[0])
+        if gap_end - gap_start < min_length:
+            return None, 0
+        return gap_start, gap_end - gap_start
+
+    def align_to_keyframes(self, segments, keyframe_lookup, target_duration=None):
+        """
+        把片段起点对齐到源视频关键帧、终点对齐到下一个关键帧
+
+        对齐会让片段变长，按target_duration累计，超出后丢弃后面的片段，
+        最终时长不超过目标时长加一个GOP
+        keyframe_lookup: {视频路径: 升序关键帧时间列表}
+
+        返回: (aligned_segments, all_aligned)
+        """
+        aligned = []
+        all_aligned = True
+        total = 0.0
+        for segment in segments:
+            if target_duration is not None and total >= target_duration:
+                break
+            keyframes = keyframe_lookup.get(segment['video_path'])
+            if not keyframes:
+                all_aligned = False
+                aligned.append(dict(segment, id=len(aligned)))
+                total += segment['duration']
+                continue
+
+            duration = segment['duration']
+            if target_duration is not None:
+                duration = min(duration, target_duration - total)
+            video_duration = segment['video_info'].get('duration') or segment['start_time'] + duration
+            start, end = snap_to_keyframes(keyframes, segment['start_time'],
+                                           segment['start_time'] + duration, video_duration)
+            if end - start <= 0:
+                continue
+            aligned.append(dict(segment, id=len(aligned), start_time=start, duration=end - start,
+                                keyframe_aligned=True))
+            total += end - start
+        return aligned, all_aligned
+
+    def mark_copy_eligible(self, segments, all_aligned=True):
+        """
+        标记计划能否直接流复制拼接：所有片段已按关键帧对齐且源视频编码参数一致
+
+        返回: 是否可流复制
+        """
+        signatures = set(copy_signature(segment['video_info']) for segment in segments)
+        eligible = bool(segments) and all_aligned and len(signatures) == 1
+        for segment in segments:
+            segment['copy_eligible'] = eligible
+        return eligible
+
+    def highlight_scores(self, signals, weights):
+        """
+        按秒综合得分：每种信号先在视频内换算为百分位（0-1，相同值取平均名次），再加权求和
+
+        weights: [(信号名, 权重), ...]
+        """
+        length = len(signals.get('motion') or [])
+        total = [0.0] * length
+        for name, weight in weights:
+            values = (signals.get(name) or [])[:length]
+            if not weight or len(values) < 2:
+                continue
+            order = sorted(range(len(values)), key=values.__getitem__)
+            scale = weight / float(len(values) - 1)
+            first = 0
+            while first < len(order):
+                last = first
+                while last + 1 < len(order) and values[order[last + 1]] == values[order[first]]:
+                    last += 1
+                rank = (first + last) / 2.0 * scale
+                for position in range(first, last + 1):
+                    total[order[position]] += rank
+                first = last + 1
+        return total
+
+    def plan_highlights(self, video_infos, target_duration, signals_lookup, window=None):
+        """
+        精彩集锦策略：用预先计算的响度、运动强度和镜头切换密度给每个窗口打分，
+        按得分从高到低贪心选取互不重叠的窗口直到目标时长
+
+        参数:
+            signals_lookup: {视频路径: {'loudness', 'motion', 'scenes'}}，每秒一个值
+            window: 窗口时长，默认取配置highlights.window
+
+        返回: 片段列表（每个视频内按时间顺序），总时长可能因素材不足而小于目标时长
+        """
+        highlight_config = self.config.get('highlights') or {}
+        window = window or highlight_config.get('window', 4.0)
+        max_duration = self.config.get('processing', 'max_segment_duration')
+        if max_duration:
+            window = min(window, max_duration)
+        weights = [('loudness', highlight_config.get('loudness_weight', 0.4)),
+                   ('motion', highlight_config.get('motion_weight', 0.4)),
+                   ('scenes', highlight_config.get('scene_weight', 0.2))]
+
+        candidates = []
+        for source, info in enumerate(video_infos):
+            signals = signals_lookup.get(info['path'])
+            if not signals:
+                continue
+            per_second = self.highlight_scores(signals, weights)
+            span = min(int(math.ceil(min(window, info['duration']))), len(per_second))
+            if span <= 0:
+                continue
+            prefix = [0.0]
+            for value in per_second:
+                prefix.append(prefix[-1] + value)
+            for start in range(len(per_second) - span + 1):
+                candidates.append((-(prefix[start + span] - prefix[start]) / span, source, start))
+        if not candidates:
+            return []
+        candidates.sort()
+
+        used = {}
+        chosen = []
+        remaining = target_duration
+        for _, source, start in candidates:
+            if remaining <= 1e-6:
+                break
+            video_duration = video_infos[source]['duration']
+            duration = min(window, video_duration, remaining)
+            start = min(float(start), video_duration - duration)
+            intervals = used.setdefault(source, IntervalSet())
+            if intervals.overlaps(start, start + duration):
+                continue
+            intervals.add(start, start + duration)
+            chosen.append((source, start, duration))
+            remaining -= duration
+
+        chosen.sort()
+        return self.build_segments(video_infos, [item[0] for item in chosen],
+                                   [item[1] for item in chosen], [item[2] for item in chosen])
+
+    def plan_variants(self, video_infos, target_duration, count, max_overlap=None):
+        """
+        批量生成count个互相低重叠的随机片段计划
+
+        所有版本已使用的时间范围按源视频合并在IntervalSet中，新片段只与合并后的区间
+        比较重叠（O(log n)定位），计算量随版本数线性增长，不需要两两比较版本
+        max_overlap: 每个版本与已生成片段重叠时长占目标时长的上限比例，
+        素材不够时无法满足，取候选中重叠最小的片段
+
+        返回: (plans, overlap_ratios)
+        """
+        if not video_infos or count <= 0:
+            return [], []
+        if max_overlap is None:
+            max_overlap = self.config.get('processing', 'variant_max_overlap')
+            if max_overlap is None:
+                max_overlap = 0.2
+
+        durations_by_source = [info['duration'] for info in video_infos]
+        sampler = AliasSampler(self.selection_weights(video_infos, durations_by_source), self.rng)
+        used = [IntervalSet() for _ in video_infos]
+        budget = max_overlap * target_duration
+        attempts = 8
+
+        plans = []
+        overlap_ratios = []
+        for _ in range(count):
+            sources, starts, durations = [], [], []
+            overlap_total = 0.0
+            remaining = target_duration
+            while remaining > 1e-6:
+                best = None
+                for _ in range(attempts):
+                    source = sampler.pick()
+                    start, length = self._place_variant_segment(
+                        used[source], durations_by_source[source], remaining)
+                    overlap = used[source].overlap_length(start, start + length)
+                    if best is None or overlap < best[3]:
+                        best = (source, start, length, overlap)
+                    if overlap_total + overlap <= budget:
+                        break
+
+                source, start, length, overlap = best
+                used[source].merge(start, start + length)
+                sources.append(source)
+                starts.append(start)
+                durations.append(length)
+                overlap_total += overlap
+                remaining -= length
+
+            plans.append(self.build_segments(video_infos, sources, starts, durations))
+            overlap_ratios.append(overlap_total / target_duration if target_duration > 0 else 0.0)
+        return plans, overlap_ratios
+
+    def _place_variant_segment(self, used, video_duration, remaining):
+        """
+        为多版本计划选择片段位置：在随机位置附近的空闲区间中优先选足够长的，
+        没有时取其中最长的（不短于最短片段），仍不行则随机放置
+
+        只查看二分定位到的常数个空闲区间，不遍历全部已用区间；
+        多次尝试由调用方完成（每次随机位置不同）
+
+        返回: (start, length)
+        """
+        rng = self.rng
+        min_duration = self.min_segment_duration
+        max_duration = self.config.get('processing', 'max_segment_duration')
+        upper = min(remaining, video_duration)
+        if max_duration:
+            upper = min(upper, max_duration)
+        length = upper if upper < min_duration else rng.uniform(min_duration, upper)
+
+        offset = rng.uniform(0, max(0.0, video_duration - length))
+        gaps = used.gaps_near(offset, 0, video_duration)
+        fitting = [(gap_start, gap_end) for gap_start, gap_end in gaps if gap_end - gap_start >= length]
+        if fitting:
+            gap_start, gap_end = fitting[rng.randint(0, len(fitting) - 1)]
+            return rng.uniform(gap_start, gap_end - length), length
+
+        if gaps:
+            gap_start, gap_end = max(gaps, key=lambda gap: gap[1] - gap[0])
+            if gap_end - gap_start >= min(min_duration, length):
+                return gap_start, gap_end - gap_start
+        return rng.uniform(0, video_duration - length), length
+
+    def subtitle_slots(self, subtitles, total_duration=None):
+        """
+        把字幕时间轴转换为切点区间：每条字幕从它的开始时间持续到下一条字幕开始，
+        第一条从0开始（包含片头空白），最后一条到字幕结束或total_duration
+
+        返回: 每个区间的时长列表
+        """
+        starts = sorted(float(subtitle['start']) for subtitle in subtitles)
+        if not starts:
+            return []
+        end = max(float(subtitle['end']) for subtitle in subtitles)
+        if total_duration is not None:
+            end = max(end, total_duration)
+        bounds = [0.0] + starts[1:] + [end]
+        return [b - a for a, b in zip(bounds, bounds[1:]) if b - a > 1e-6]
+
+    def plan_aligned(self, video_infos, slot_durations, slot_matches=None):
+        """
+        切点对齐策略：每个区间（一句字幕或一段TTS语音）对应一个或多个片段，
+        所有切换点都落在区间边界上
+
+        区间超过max_segment_duration时平均拆成多个片段；相邻片段尽量来自不同视频
+        slot_matches: 可选，与区间等长，每项为按相似度排序的 [(视频路径, 时间点, 相似度), ...]，
+        片段优先从匹配的画面位置开始截取，没有可用匹配时随机抽取
+
+        返回: 片段列表
+        """
+        if not video_infos or not slot_durations:
+            return []
+        durations_by_source = [info['duration'] for info in video_infos]
+        sampler = AliasSampler(self.selection_weights(video_infos, durations_by_source), self.rng)
+        max_duration = self.config.get('processing', 'max_segment_duration')
+        # 片段不能超过最长的素材，否则渲染出的片段会变短，切点错位
+        longest = max(durations_by_source)
+        if not max_duration or max_duration > longest:
+            max_duration = longest
+        longest_source = durations_by_source.index(longest)
+        source_index = dict((info['path'], i) for i, info in enumerate(video_infos))
+
+        sources, starts, durations = [], [], []
+        for slot_number, slot in enumerate(slot_durations):
+            pieces = max(1, int(-(-slot // max_duration)))
+            length = slot / pieces
+            matches = list(slot_matches[slot_number]) if slot_matches else []
+            for _ in range(pieces):
+                source = start = None
+                while matches:
+                    path, timestamp = matches.pop(0)[:2]
+                    candidate = source_index.get(path)
+                    if candidate is None or durations_by_source[candidate] < length:
+                        continue
+                    if sources and candidate == sources[-1] and len(video_infos) > 1:
+                        continue
+                    source = candidate
+                    start = min(max(0.0, timestamp), durations_by_source[candidate] - length)
+                    break
+                if source is not None:
+                    sources.append(source)
+                    starts.append(start)
+                    durations.append(length)
+                    continue
+                for _ in range(8):
+                    candidate = sampler.pick()
+                    if durations_by_source[candidate] < length:
+                        continue
+                    if sources and candidate == sources[-1] and len(video_infos) > 1:
+                        continue
+                    source = candidate
+                    break
+                if source is None:
+                    source = longest_source
+                video_duration = durations_by_source[source]
+                sources.append(source)
+                starts.append(self.rng.uniform(0, max(0.0, video_duration - length)))
+                durations.append(length)
+
+        return self.build_segments(video_infos, sources, starts, durations)
@@ -10,6 +10,7 @@ import time
 from subtitle_inserter import SubtitleInserter
 from subtitle_generator import SubtitleGenerator
 from utils import format_duration, format_file_size
+from ffmpeg_progress import print_progress
 
 def safe_input(prompt):
     """安全的输入函数，处理Python 2.7的编码问题"""
@@ -633,6 +634,7 @@ def add_subtitle_to_video():
                 print(u"\n开始添加字幕...")
             
             inserter = SubtitleInserter()
+            inserter.progress_callback = print_progress
             result_path = inserter.insert_subtitles_to_video(
                 video_path=video_path,
                 subtitle_source=subtitle_source,
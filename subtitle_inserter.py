@@ -10,7 +10,9 @@ import time
 import subprocess
 from subtitle_generator import SubtitleGenerator
 from text_to_speech import TextToSpeechGenerator
+from config import Config
 from utils import generate_timestamped_filename, validate_output_path
+from ffmpeg_progress import run_ffmpeg
 
 class SubtitleInserter(object):
     """字幕插入器类"""
@@ -18,6 +20,9 @@ class SubtitleInserter(object):
     def __init__(self):
         self.subtitle_generator = SubtitleGenerator()
         self.tts_generator = TextToSpeechGenerator()
+        # 进度回调：编码过程中每次进度更新时调用 progress_callback(快照)
+        self.progress_callback = None
+        self.stall_timeout = Config().get('ffmpeg', 'stall_timeout') or 0
     
     def insert_subtitles_to_video(self, video_path, subtitle_source, output_path=None, 
                                  style='default', auto_fit=True, split_mode='smart_split', 
@@ -323,18 +328,11 @@ class SubtitleInserter(object):
             
             print(u"FFmpeg命令: {}".format(' '.join(cmd)))
             
-            # 使用绝对路径执行命令，避免路径问题
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-                # 移除cwd参数，使用当前工作目录
-            )
-            
-            stdout, stderr = process.communicate()
+            # 使用绝对路径执行命令，避免路径问题（使用当前工作目录）
+            returncode, stderr = run_ffmpeg(cmd, video_info.get('duration', 30.0), self.progress_callback,
+                                            os.path.basename(abs_output_path), stall_timeout=self.stall_timeout)
             
-            if process.returncode == 0:
+            if returncode == 0:
                 return True
             else:
                 print(u"FFmpeg错误输出:")
@@ -380,17 +378,11 @@ class SubtitleInserter(object):
             print(u"工作目录: {}".format(srt_dir))
             
             # 在SRT文件所在目录执行命令
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                cwd=srt_dir  # 设置工作目录
-            )
-            
-            stdout, stderr = process.communicate()
+            returncode, stderr = run_ffmpeg(cmd, callback=self.progress_callback,
+                                            job=os.path.basename(output_path), cwd=srt_dir,
+                                            stall_timeout=self.stall_timeout)
             
-            if process.returncode == 0:
+            if returncode == 0:
                 return True
             else:
                 print(u"FFmpeg错误输出:")
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+测试渲染成本模型
+"""
+import sys
+import os
+import math
+import random
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cost_model import RenderCostModel, PRESETS, schedule_jobs
+
+
+def simulated_run(rng, width, height, fps, preset, crf, duration, segments):
+    """按已知规律生成模拟渲染记录（带少量噪声）"""
+    rank = PRESETS.index(preset)
+    work = width * height * fps * duration / 1e6
+    wall_time = 0.004 * work * math.exp(0.25 * rank - 0.01 * crf) * (1 + 0.05 * segments)
+    bitrate = 60000 * (width * height * fps / 1e6) * math.exp(-0.1 * (crf - 23) - 0.02 * rank)
+    noise = math.exp(rng.gauss(0, 0.03))
+    return {'width': width, 'height': height, 'fps': fps, 'preset': preset, 'crf': crf,
+            'codec': 'h264', 'duration': duration, 'segments': segments,
+            'wall_time': wall_time * noise, 'output_size': bitrate * duration * noise}
+
+
+def test_cost_model_fit():
+    """测试从渲染记录拟合耗时和大小"""
+    print(u"=== 测试渲染成本模型 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        model = RenderCostModel(history_path=os.path.join(temp_dir, 'history.jsonl'))
+        segments = [{'duration': 6.0, 'video_info': {'codec': 'h264'}} for _ in range(10)]
+        settings = {'width': 1280, 'height': 720, 'fps': 30, 'preset': 'fast', 'crf': 20}
+
+        estimate = model.predict(segments, settings)
+        assert not estimate['calibrated'] and estimate['time'] > 0 and estimate['size_mb'] > 0
+        print(u"✓ 没有渲染记录时使用经验估算")
+
+        rng = random.Random(4)
+        for _ in range(40):
+            width, height = rng.choice([(1920, 1080), (1280, 720), (854, 480)])
+            model.record(simulated_run(rng, width, height, rng.choice([25, 30]),
+                                       rng.choice(PRESETS[2:7]), rng.choice([18, 20, 23, 26]),
+                                       rng.uniform(20, 300), rng.randint(5, 40)))
+
+        # 重新加载，确认记录已持久化
+        model = RenderCostModel(history_path=os.path.join(temp_dir, 'history.jsonl'))
+        estimate = model.predict(segments, settings)
+        expected = simulated_run(random.Random(0), 1280, 720, 30, 'fast', 20, 60.0, 10)
+        time_error = abs(estimate['time'] / expected['wall_time'] - 1)
+        size_error = abs(estimate['size_mb'] * 1024 * 1024 / expected['output_size'] - 1)
+        print(u"预测耗时{:.1f}秒（实际{:.1f}秒），预测大小{:.2f}MB".format(
+            estimate['time'], expected['wall_time'], estimate['size_mb']))
+        assert estimate['calibrated'] and estimate['runs'] == 40
+        assert time_error < 0.15 and size_error < 0.15
+        print(u"✓ 拟合模型的耗时和大小预测误差在15%以内")
+
+        jobs = [
+            {'name': 'late', 'segments': segments, 'output_settings': settings, 'deadline': 1000.0},
+            {'name': 'soon', 'segments': segments, 'output_settings': settings, 'deadline': 1.0},
+        ]
+        schedule = schedule_jobs(model, jobs, start_time=0.0)
+        assert [job['name'] for job in schedule] == ['soon', 'late']
+        assert not schedule[0]['meets_deadline'] and schedule[1]['meets_deadline']
+        assert abs(schedule[1]['predicted_finish'] - 2 * estimate['time']) < 1e-6
+        print(u"✓ 按截止时间排序并判断能否按时完成")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    test_cost_model_fit()
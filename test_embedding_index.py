@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+测试画面向量索引和按句子匹配画面
+"""
+import sys
+import os
+import time
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from embedding_index import EmbeddingIndex, normalize_rows
+from segment_planner import SegmentPlanner
+
+
+def make_index(temp_dir, videos=6250, frames=16, dim=256, seed=0):
+    """生成带聚类结构的随机向量，模拟真实画面的分布"""
+    rng = np.random.RandomState(seed)
+    topics = normalize_rows(rng.randn(400, dim))
+    index = EmbeddingIndex(index_path=os.path.join(temp_dir, 'embedding_index.npz'))
+    for video in range(videos):
+        topic = topics[rng.randint(len(topics), size=frames)]
+        vectors = topic + 0.35 * rng.randn(frames, dim) / np.sqrt(dim)
+        index.add(u'video_{}.mp4'.format(video), np.arange(frames) * 2.0, vectors,
+                  source_key=u'video_{}.mp4|0|0'.format(video))
+    return index, rng
+
+
+def test_search_recall_and_speed():
+    """测试10万关键帧上的检索召回率和查询耗时"""
+    print(u"=== 测试向量检索 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        index, rng = make_index(temp_dir)
+        assert len(index) == 100000
+        assert index.vectors.dtype == np.float16
+
+        start = time.time()
+        index.build()
+        print(u"建立索引: {:.2f}秒，{}个列表".format(time.time() - start, len(index.centroids)))
+
+        queries = index.vectors[rng.choice(len(index), 50, replace=False)].astype(np.float32)
+        queries += 0.05 * rng.randn(*queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+        exact = normalize_rows(queries).dot(index.vectors.astype(np.float32).T)
+
+        hits = 0
+        start = time.time()
+        for query, scores in zip(queries, exact):
+            results = index.search(query, k=10)
+            truth = set(np.argsort(-scores)[:10])
+            found = set()
+            for path, timestamp, score in results:
+                source_id = index.sources.index(path)
+                rows = np.where((index.source_ids == source_id) & (index.timestamps == timestamp))[0]
+                found.update(rows.tolist())
+            hits += len(truth & found)
+        elapsed = (time.time() - start) / len(queries) * 1000
+        recall = hits / (10.0 * len(queries))
+        print(u"召回率@10: {:.2f}，平均查询耗时: {:.2f}ms".format(recall, elapsed))
+        assert recall >= 0.9
+        assert elapsed < 50
+
+        # 限定候选视频
+        results = index.search(queries[0], k=5, candidates=[u'video_1.mp4', u'video_2.mp4'])
+        assert all(path in (u'video_1.mp4', u'video_2.mp4') for path, _, _ in results)
+
+        # 保存后重新加载，结果不变
+        index.save()
+        loaded = EmbeddingIndex(index_path=index.index_path)
+        assert loaded.load()
+        assert len(loaded) == len(index)
+        assert loaded.search(queries[0], k=10) == index.search(queries[0], k=10)
+
+        # 替换一个视频的向量
+        loaded.add(u'video_0.mp4', [0.0], rng.randn(1, queries.shape[1]))
+        assert len(loaded) == 100000 - 16 + 1
+        print(u"✓ 检索测试通过")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_semantic_aligned_plan():
+    """测试按句子匹配结果截取画面"""
+    print(u"\n=== 测试语义匹配切点 ===")
+    video_infos = [{'path': 'a.mp4', 'duration': 30.0}, {'path': 'b.mp4', 'duration': 20.0}]
+    planner = SegmentPlanner(seed=3)
+    slots = [3.0, 2.5, 4.0]
+    matches = [
+        [('b.mp4', 12.0, 0.9)],
+        [('b.mp4', 5.0, 0.8), ('a.mp4', 29.0, 0.7)],
+        [('c.mp4', 1.0, 0.9)]
+    ]
+    segments = planner.plan_aligned(video_infos, slots, matches)
+    assert len(segments) == 3
+    assert segments[0]['video_path'] == 'b.mp4' and segments[0]['start_time'] == 12.0
+    # 相邻片段不重复同一视频，匹配点过于靠后时向前收回
+    assert segments[1]['video_path'] == 'a.mp4'
+    assert abs(segments[1]['start_time'] - 27.5) < 1e-9
+    # 匹配的视频不在素材中时随机抽取
+    assert segments[2]['video_path'] in ('a.mp4', 'b.mp4')
+    print(u"✓ 语义匹配切点测试通过")
+
+
+if __name__ == "__main__":
+    test_search_recall_and_speed()
+    test_semantic_aligned_plan()
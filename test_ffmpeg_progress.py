@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+测试FFmpeg进度解析
+"""
+import sys
+import os
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ffmpeg_progress import ProgressParser, run_ffmpeg, with_progress_args, format_progress
+
+SAMPLE = u"""frame=120
+fps=60.00
+stream_0_0_q=28.0
+bitrate=1024.0kbits/s
+total_size=524288
+out_time_us=4000000
+out_time_ms=4000000
+out_time=00:00:04.000000
+dup_frames=0
+drop_frames=0
+speed=2.00x
+progress=continue
+frame=300
+fps=N/A
+out_time_us=N/A
+out_time=00:00:10.000000
+speed=N/A
+progress=end
+"""
+
+FAKE_FFMPEG = u"""#!{python}
+import sys
+sys.stdout.write(u'''{sample}''')
+for i in range(1000):
+    sys.stderr.write('line {{}}\\n'.format(i))
+sys.exit(1)
+"""
+
+
+def test_progress_parser():
+    """测试进度块解析和剩余时间计算"""
+    print(u"=== 测试进度解析 ===")
+    snapshots = []
+    parser = ProgressParser(total_duration=10.0, callback=snapshots.append, job='out.mp4')
+    for line in SAMPLE.splitlines():
+        parser.feed(line)
+
+    assert len(snapshots) == 2
+    first, last = snapshots
+    print(u"进度: {}".format(format_progress(first)))
+    assert first['frame'] == 120 and first['fps'] == 60.0 and first['speed'] == 2.0
+    assert first['out_time'] == 4.0 and first['percent'] == 40.0
+    # 剩余6秒输出，2倍速需要3秒
+    assert first['eta'] == 3.0 and not first['finished']
+    # 数值为N/A时回退到out_time字段
+    assert last['out_time'] == 10.0 and last['fps'] is None and last['speed'] is None
+    assert last['finished'] and last['percent'] == 100.0 and last['eta'] == 0.0
+    assert last['job'] == 'out.mp4'
+
+    assert with_progress_args(['ffmpeg', '-y', 'out.mp4']) == \
+        ['ffmpeg', '-progress', 'pipe:1', '-nostats', '-y', 'out.mp4']
+    print(u"✓ 帧数、帧率、速度、输出时间和剩余时间正确")
+
+
+def test_run_ffmpeg_stderr_limit():
+    """测试运行时的进度回调和错误输出上限"""
+    print(u"\n=== 测试进度回调和错误输出 ===")
+    if os.name != 'posix':
+        print(u"跳过: 需要可执行脚本")
+        return
+    temp_dir = tempfile.mkdtemp()
+    try:
+        script = os.path.join(temp_dir, 'ffmpeg')
+        with open(script, 'w') as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable, sample=SAMPLE))
+        os.chmod(script, 0o755)
+
+        snapshots = []
+        returncode, stderr = run_ffmpeg([script, '-y', 'out.mp4'], 10.0, snapshots.append, stderr_lines=50)
+        print(u"返回码 {}，收到 {} 次进度，保留 {} 行错误输出".format(
+            returncode, len(snapshots), len(stderr.splitlines())))
+        assert returncode == 1
+        assert [s['percent'] for s in snapshots] == [40.0, 100.0]
+        lines = stderr.splitlines()
+        assert len(lines) == 50 and lines[0] == 'line 950' and lines[-1] == 'line 999'
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 进度实时回调，错误输出只保留最后若干行")
+
+
+if __name__ == "__main__":
+    test_progress_parser()
+    test_run_ffmpeg_stderr_limit()
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+测试渲染方式选择
+"""
+import sys
+import os
+import shutil
+import tempfile
+import subprocess
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ffmpeg_renderer import FFmpegRenderer, split_at_keyframe, source_encoder_args, splice_mismatch
+from segment_cache import SegmentCache
+
+
+def make_info(path, codec='h264', width=1920, height=1080, fps=30.0, pix_fmt='yuv420p'):
+    """生成带视频流参数的模拟视频信息"""
+    return {
+        'path': path, 'duration': 60.0, 'width': width, 'height': height, 'fps': fps, 'codec': codec,
+        'streams': [{'codec_type': 'video', 'codec_name': codec, 'profile': 'High',
+                     'width': width, 'height': height, 'pix_fmt': pix_fmt,
+                     'time_base': '1/15360', 'r_frame_rate': '{}/1'.format(int(fps))}]
+    }
+
+
+def make_segments(infos, copy_eligible=True):
+    """每个视频取一个片段"""
+    return [{'id': i, 'video_path': info['path'], 'start_time': 2.0 * i, 'duration': 2.0,
+             'video_info': info, 'copy_eligible': copy_eligible} for i, info in enumerate(infos)]
+
+
+def test_stream_copy_check():
+    """测试流复制条件判断"""
+    print(u"=== 测试流复制条件 ===")
+    renderer = FFmpegRenderer()
+    renderer.stream_copy = True
+    infos = [make_info('a.mp4'), make_info('b.mp4')]
+    segments = make_segments(infos)
+
+    can_copy, reason = renderer.check_stream_copy(segments, infos[0])
+    print(u"同参数H.264素材: {} - {}".format(can_copy, reason))
+    assert can_copy
+    assert renderer.check_stream_copy(segments, infos[0], crf=18, preset='slow')[0]
+
+    cases = [
+        (make_segments(infos, copy_eligible=False), infos[0], {}),
+        (segments, infos[0], {'subtitle_path': 'a.srt'}),
+        (segments, infos[0], {'width': 1280, 'height': 720}),
+        (segments, infos[0], {'fps': 60}),
+        (make_segments([infos[0], make_info('c.mp4', width=1280, height=720)]), infos[0], {}),
+        (make_segments([make_info('d.mp4', codec='hevc')]), None, {'width': 1920, 'height': 1080, 'fps': 30}),
+        (make_segments([make_info('e.mp4', pix_fmt='yuv422p')]), None,
+         {'width': 1920, 'height': 1080, 'fps': 30}),
+    ]
+    for case_segments, first_info, kwargs in cases:
+        can_copy, reason = renderer.check_stream_copy(case_segments, first_info, **kwargs)
+        print(u"  不可流复制: {}".format(reason))
+        assert not can_copy
+
+    renderer.stream_copy = False
+    assert not renderer.check_stream_copy(segments, infos[0])[0]
+    print(u"✓ 只有编码参数、分辨率和帧率都一致时才流复制")
+
+
+def test_smart_render_split():
+    """测试智能渲染的重新编码/流复制切分"""
+    print(u"\n=== 测试智能渲染切分 ===")
+    keyframes = [0.0, 2.0, 4.0, 6.0]
+    assert split_at_keyframe(keyframes, 1.5, 5.0) == [(1.5, 2.0, 'encode'), (2.0, 5.0, 'copy')]
+    # 起点正好是关键帧时全部流复制
+    assert split_at_keyframe(keyframes, 2.0, 5.0) == [(2.0, 5.0, 'copy')]
+    # 片段内没有关键帧时只能整体重新编码
+    assert split_at_keyframe(keyframes, 4.5, 5.5) == [(4.5, 5.5, 'encode')]
+    assert split_at_keyframe(keyframes, 6.5, 9.0) == [(6.5, 9.0, 'encode')]
+
+    renderer = FFmpegRenderer()
+    renderer.stream_copy = True
+    infos = [make_info('a.mp4'), make_info('b.mp4')]
+    unaligned = make_segments(infos, copy_eligible=False)
+    assert not renderer.check_stream_copy(unaligned, infos[0])[0]
+    assert renderer.check_stream_copy(unaligned, infos[0], False)[0]
+    assert not renderer.check_stream_copy(unaligned, infos[0], False, width=1280, height=720)[0]
+
+    info = make_info('a.mp4')
+    info['streams'][0]['level'] = 40
+    args = source_encoder_args(info)
+    assert args == ['-pix_fmt', 'yuv420p', '-profile:v', 'high', '-level:v', '4.0', '-r', '30/1']
+    info['streams'][0].update({'refs': 4, 'has_b_frames': 0})
+    assert source_encoder_args(info)[6:10] == ['-refs', '4', '-bf', '0']
+    assert splice_mismatch(info['streams'][0], dict(info['streams'][0], level=31)) == ['level']
+    assert splice_mismatch(info['streams'][0], info['streams'][0]) == []
+    print(u"✓ 只有切点到下一个关键帧之间需要重新编码")
+
+
+def test_parallel_chunks():
+    """测试并行编码分块"""
+    print(u"\n=== 测试并行编码分块 ===")
+    renderer = FFmpegRenderer()
+    renderer.render_workers = 8
+    renderer.chunk_duration = 60.0
+    segments = [{'duration': 3.0 + (i % 5)} for i in range(200)]
+    total = sum(segment['duration'] for segment in segments)
+
+    chunks = renderer.split_chunks(segments)
+    durations = [sum(s['duration'] for s in segments[a:b]) for a, b in chunks]
+    print(u"总时长{:.0f}秒分为{}块: {}".format(total, len(chunks), [round(d) for d in durations]))
+    assert len(chunks) == int(total // 60.0)
+    # 分块连续覆盖全部片段，时长接近
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(segments)
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    # 每个切点与理想位置相差不超过半个片段，每块与平均时长相差不超过一个片段
+    assert all(abs(d - total / len(chunks)) <= 7.0 + 1e-9 for d in durations)
+
+    # 较短的计划至少分成进程数个块，太短的计划不分块
+    assert len(renderer.split_chunks(segments[:40])) == 8
+    assert renderer.split_chunks(segments[:10]) == [(0, 10)]
+    print(u"✓ 分块连续且时长均衡")
+
+
+def test_batched_render_layout():
+    """测试分批渲染的批次划分和滤镜脚本清理"""
+    print(u"\n=== 测试分批渲染 ===")
+    renderer = FFmpegRenderer()
+    renderer.max_inputs = 32
+    batches = renderer.split_batches(300)
+    sizes = [end - start for start, end in batches]
+    print(u"300个片段分为{}批: {}".format(len(batches), sizes))
+    assert len(batches) == 10 and max(sizes) <= 32 and max(sizes) - min(sizes) <= 1
+    assert batches[0][0] == 0 and batches[-1][1] == 300
+    assert all(a[1] == b[0] for a, b in zip(batches, batches[1:]))
+    assert renderer.split_batches(32) == [(0, 32)]
+
+    # ffmpeg无法启动时，分批渲染的中间目录和滤镜脚本都会被清理
+    temp_dir = tempfile.mkdtemp()
+    try:
+        renderer.temp_folder = temp_dir
+        renderer.ffmpeg_path = os.path.join(temp_dir, 'missing-ffmpeg')
+        renderer.max_inputs = 2
+        info = make_info('a.mp4')
+        segments = make_segments([info] * 5)
+        success, _ = renderer.encode_video(segments, os.path.join(temp_dir, 'out.mp4'), info)
+        assert not success
+        assert os.listdir(temp_dir) == []
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 每批输入数有上限，临时文件不残留")
+
+
+def test_shared_decode_runs():
+    """测试共享解码的读取分组"""
+    print(u"\n=== 测试共享解码分组 ===")
+    renderer = FFmpegRenderer()
+    renderer.shared_decode_gap = 30.0
+    renderer.max_outputs = 3
+    a, b = make_info('a.mp4'), make_info('b.mp4')
+    plan = [(a, 50.0), (b, 5.0), (a, 10.0), (a, 12.0), (b, 1.0), (a, 200.0), (a, 14.0), (a, 30.0)]
+    segments = [{'video_path': info['path'], 'start_time': start, 'duration': 2.0, 'video_info': info}
+                for info, start in plan]
+    runs = renderer.group_source_runs(segments)
+    print(u"读取分组: {}".format(runs))
+    # a.mp4: 10/12/14 一组（达到组内上限），30/50 一组，200 与前面相距过远单独一组
+    assert runs == [[2, 3, 6], [7, 0], [5], [4, 1]]
+    assert sorted(i for run in runs for i in run) == list(range(len(segments)))
+
+    # 一个进程的线程数由组内各路编码器平分
+    commands = []
+    renderer.execute = lambda cmd, *args: commands.append(cmd) or (True, '')
+    params = {'width': 1920, 'height': 1080, 'fps': 30, 'crf': 23, 'preset': 'fast'}
+    handle, script_path = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    try:
+        renderer.extract_run(segments, runs[0], ['clip_{}.mp4'.format(i) for i in range(len(segments))],
+                             params, script_path, threads=8)
+    finally:
+        os.remove(script_path)
+    cmd = commands[0]
+    assert cmd.count('libx264') == 3
+    assert [cmd[i + 1] for i, arg in enumerate(cmd) if arg == '-threads'] == ['2', '2', '2']
+    print(u"✓ 同一视频相邻片段合并读取，每个片段只属于一组")
+
+
+def test_concat_fallback_cleanup():
+    """测试备用渲染失败时不在公共临时文件夹中留下文件"""
+    print(u"\n=== 测试备用渲染临时文件 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        renderer = FFmpegRenderer()
+        renderer.temp_folder = temp_dir
+        renderer.ffmpeg_path = os.path.join(temp_dir, 'missing-ffmpeg')
+        renderer.render_workers = 2
+        info = make_info('a.mp4')
+        segments = make_segments([info, make_info('b.mp4'), info])
+        success, _ = renderer.render_with_concat(segments, os.path.join(temp_dir, 'out.mp4'), info)
+        assert not success
+        success, _ = renderer.render_pre_extracted(segments, os.path.join(temp_dir, 'out.mp4'), info)
+        assert not success
+        assert os.listdir(temp_dir) == []
+
+        # 拼接列表中的单引号需要转义
+        list_path = os.path.join(temp_dir, 'list.txt')
+        try:
+            renderer.concat_copy([os.path.join(temp_dir, "it's.mp4")], os.path.join(temp_dir, 'out.mp4'), list_path)
+        except OSError:
+            pass
+        with open(list_path) as f:
+            assert "it'\\''s.mp4'" in f.read()
+        os.remove(list_path)
+
+        # 备用渲染逐片段预编码（每个进程一个输入），最后只做流复制拼接
+        if os.name == 'posix':
+            script = os.path.join(temp_dir, 'ffmpeg')
+            with open(script, 'w') as f:
+                f.write(FAKE_FFMPEG.format(python=sys.executable))
+            os.chmod(script, 0o755)
+            renderer.ffmpeg_path = script
+            commands = []
+            execute = renderer.execute
+            renderer.execute = lambda cmd, *args: commands.append(cmd) or execute(cmd, *args)
+            success, _ = renderer.render_with_concat(segments, os.path.join(temp_dir, 'out.mp4'), info)
+            assert success
+            encodes, concat = commands[:-1], commands[-1]
+            assert len(encodes) == 3 and all(cmd.count('-i') == 1 and 'open-gop=0' in cmd for cmd in encodes)
+            assert 'concat' in concat and concat[concat.index('-c') + 1] == 'copy'
+            assert sorted(os.listdir(temp_dir)) == ['ffmpeg', 'out.mp4']
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 中间文件都在任务独立的目录中并被清理")
+
+
+def test_profile_outputs():
+    """测试多规格输出的滤镜和文件路径"""
+    print(u"\n=== 测试多规格输出 ===")
+    renderer = FFmpegRenderer()
+    profiles = [
+        {'name': 'landscape', 'width': 1920, 'height': 1080},
+        {'name': 'portrait', 'width': 1080, 'height': 1920, 'fit': 'crop'},
+        {'width': 1280, 'height': 720, 'fps': 25}
+    ]
+    paths = renderer.profile_output_paths(os.path.join('out', 'mix.mp4'), profiles)
+    assert paths == [os.path.join('out', 'mix.mp4'), os.path.join('out', 'mix_portrait.mp4'),
+                     os.path.join('out', 'mix_1280x720.mp4')]
+
+    parts, labels = renderer.create_profile_filter('[outv]', profiles, 30, 'subs.srt')
+    print(u"滤镜: {}".format(";".join(parts)))
+    # 只split一次，每个规格一路
+    assert parts[0] == '[outv]split=3[p0][p1][p2]'
+    assert labels == ['[out0]', '[out1]', '[out2]']
+    assert 'pad=1920:1080' in parts[1] and 'fps=30' in parts[1]
+    assert 'crop=1080:1920' in parts[2] and 'force_original_aspect_ratio=increase' in parts[2]
+    assert 'fps=25' in parts[3]
+    # 字幕在缩放之后烧录
+    assert all(part.index('subtitles=') > part.index('scale=') for part in parts[1:])
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        renderer.temp_folder = temp_dir
+        renderer.ffmpeg_path = os.path.join(temp_dir, 'missing-ffmpeg')
+        info = make_info('a.mp4')
+        success, _ = renderer.render_video(make_segments([info, info]), os.path.join(temp_dir, 'out.mp4'),
+                                           info, profiles=profiles)
+        assert not success
+        assert os.listdir(temp_dir) == []
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 一次解码split为各规格，输出路径按规格命名")
+
+
+def ffmpeg_available():
+    """检查系统中是否安装了ffmpeg和ffprobe"""
+    try:
+        for tool in ('ffmpeg', 'ffprobe'):
+            subprocess.check_output([tool, '-version'], stderr=subprocess.STDOUT)
+        return True
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+
+def test_smart_render_decodes():
+    """测试智能渲染的输出能完整解码（重新编码和流复制的部分在同一轨道中）"""
+    print(u"\n=== 测试智能渲染输出解码 ===")
+    if not ffmpeg_available():
+        print(u"跳过: 需要ffmpeg和ffprobe")
+        return
+    temp_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(temp_dir, 'source.mp4')
+        subprocess.check_output([
+            'ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=320x240:rate=30:duration=4',
+            '-c:v', 'libx264', '-profile:v', 'high', '-g', '30', '-keyint_min', '30', '-sc_threshold', '0',
+            '-pix_fmt', 'yuv420p', source], stderr=subprocess.STDOUT)
+
+        renderer = FFmpegRenderer()
+        renderer.temp_folder = temp_dir
+        renderer.ffmpeg_path = 'ffmpeg'
+        renderer.ffprobe_path = 'ffprobe'
+        stream = renderer.probe_video_stream(source)
+        info = {'path': source, 'duration': 4.0, 'width': 320, 'height': 240, 'fps': 30.0,
+                'streams': [dict(stream, codec_type='video')]}
+        segments = [{'video_path': source, 'start_time': 0.5, 'duration': 1.5, 'video_info': info},
+                    {'video_path': source, 'start_time': 2.3, 'duration': 1.2, 'video_info': info}]
+        output = os.path.join(temp_dir, 'out.mp4')
+        success, result = renderer.render_smart(segments, output, info, {source: [0.0, 1.0, 2.0, 3.0]})
+        assert success, result
+
+        process = subprocess.Popen(['ffmpeg', '-v', 'error', '-i', output, '-f', 'null', '-'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, errors = process.communicate()
+        print(u"解码错误输出: {!r}".format(errors))
+        assert process.returncode == 0 and not errors.strip()
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 智能渲染输出完整解码无错误")
+
+
+FAKE_FFMPEG = u"""#!{python}
+import sys
+args = sys.argv[1:]
+for index, arg in enumerate(args):
+    if arg.endswith('.mp4') and (index == 0 or args[index - 1] != '-i'):
+        with open(arg, 'w') as f:
+            f.write('clip')
+"""
+
+
+def test_segment_cache_fill():
+    """测试冷缓存在普通渲染中填充，下一次渲染命中"""
+    print(u"\n=== 测试片段缓存填充 ===")
+    if os.name != 'posix':
+        print(u"跳过: 需要可执行脚本")
+        return
+    temp_dir = tempfile.mkdtemp()
+    try:
+        script = os.path.join(temp_dir, 'ffmpeg')
+        with open(script, 'w') as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable))
+        os.chmod(script, 0o755)
+        renderer = FFmpegRenderer()
+        renderer.temp_folder = os.path.join(temp_dir, 'temp')
+        os.makedirs(renderer.temp_folder)
+        renderer.ffmpeg_path = script
+        renderer.render_workers = 1
+        renderer.segment_cache = SegmentCache(cache_dir=os.path.join(temp_dir, 'cache'), budget_mb=1)
+        infos = [make_info('a.mp4'), make_info('b.mp4'), make_info('c.mp4')]
+        segments = make_segments(infos, copy_eligible=False)
+
+        success, _ = renderer.render_video(segments, os.path.join(temp_dir, 'first.mp4'), infos[0])
+        assert success
+        assert renderer.segment_cache.stored == 3 and renderer.last_cache_hits == 0
+
+        success, _ = renderer.render_video(segments, os.path.join(temp_dir, 'second.mp4'), infos[0])
+        metrics = renderer.segment_cache.metrics()
+        print(u"第二次渲染: 命中 {hits} 个，未命中 {misses} 个".format(**metrics))
+        assert success and renderer.last_cache_hits == 3
+        assert metrics['hits'] == 3 and metrics['stored'] == 3
+        assert os.listdir(renderer.temp_folder) == []
+
+        # 多进程时仍分块并行编码，各块在内部复用缓存
+        calls = []
+        render_parallel = renderer.render_parallel
+        renderer.render_parallel = lambda *args, **kwargs: calls.append(1) or render_parallel(*args, **kwargs)
+        renderer.render_workers = 2
+        renderer.chunk_duration = 2.0
+        success, _ = renderer.render_video(segments, os.path.join(temp_dir, 'third.mp4'), infos[0])
+        assert success and calls == [1] and renderer.last_cache_hits == 3
+        assert os.listdir(renderer.temp_folder) == []
+
+        # 默认配置不开启片段缓存
+        assert FFmpegRenderer().segment_cache is None
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 第一次渲染写入的片段在下一次渲染中命中")
+
+
+def test_parallel_dispatch():
+    """测试较长的计划在多进程时走分块并行编码，即使片段重复使用同一视频"""
+    print(u"\n=== 测试并行编码分派 ===")
+    if os.name != 'posix':
+        print(u"跳过: 需要可执行脚本")
+        return
+    temp_dir = tempfile.mkdtemp()
+    try:
+        script = os.path.join(temp_dir, 'ffmpeg')
+        with open(script, 'w') as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable))
+        os.chmod(script, 0o755)
+        renderer = FFmpegRenderer()
+        renderer.temp_folder = temp_dir
+        renderer.ffmpeg_path = script
+        renderer.render_workers = 4
+        renderer.chunk_duration = 60.0
+        renderer.shared_decode = True
+        renderer.segment_cache = None
+        infos = [make_info('a.mp4'), make_info('b.mp4')]
+        segments = [{'video_path': infos[i % 2]['path'], 'start_time': 10.0 * i, 'duration': 20.0,
+                     'video_info': infos[i % 2]} for i in range(16)]
+
+        calls = []
+        render_parallel = renderer.render_parallel
+        def record(*args, **kwargs):
+            calls.append(len(args[0]))
+            return render_parallel(*args, **kwargs)
+        renderer.render_parallel = record
+        output = os.path.join(temp_dir, 'out.mp4')
+        success, _ = renderer.render_video(segments, output, infos[0])
+        assert success and calls == [16] and os.path.exists(output)
+        assert sorted(os.listdir(temp_dir)) == ['ffmpeg', 'out.mp4']
+
+        # 单进程时仍按共享解码截取
+        calls[:] = []
+        renderer.render_workers = 1
+        success, _ = renderer.render_video(segments, output, infos[0])
+        assert success and calls == []
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 多进程时分块并行编码，块内共享解码")
+
+
+if __name__ == "__main__":
+    test_stream_copy_check()
+    test_smart_render_split()
+    test_smart_render_decodes()
+    test_parallel_chunks()
+    test_batched_render_layout()
+    test_shared_decode_runs()
+    test_concat_fallback_cleanup()
+    test_profile_outputs()
+    test_segment_cache_fill()
+    test_parallel_dispatch()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+测试素材使用历史和新鲜度加权
+"""
+import sys
+import os
+import time
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from media_catalog import MediaCatalog, tokenize, parse_query
+from segment_planner import SegmentPlanner
+
+
+def test_usage_ledger():
+    """测试使用记录和新鲜度计算"""
+    print(u"=== 测试素材使用历史 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        catalog = MediaCatalog(db_path=os.path.join(temp_dir, 'catalog.db'))
+        catalog.half_life_days = 30
+        catalog.min_freshness = 0.05
+        now = time.time()
+        day = 86400.0
+
+        segments = [
+            {'video_path': 'a.mp4', 'start_time': 1.0, 'duration': 2.0},
+            {'video_path': 'a.mp4', 'start_time': 5.0, 'duration': 1.5},
+            {'video_path': 'b.mp4', 'start_time': 0.0, 'duration': 3.0},
+        ]
+        catalog.record_usage(segments[2:], 'old.mp4', used_at=now - 30 * day)
+        catalog.record_usage(segments[:2], 'new.mp4', used_at=now - 60)
+
+        intervals = catalog.get_used_intervals('a.mp4')
+        assert [(start, end) for start, end, _ in intervals] == [(1.0, 3.0), (5.0, 6.5)]
+        print(u"✓ 记录了源视频使用的时间范围")
+
+        weights = catalog.freshness_weights(['a.mp4', 'b.mp4', 'c.mp4'], now=now)
+        print(u"新鲜度: {}".format(weights))
+        assert weights['c.mp4'] == 1.0
+        assert weights['a.mp4'] < 0.06
+        assert abs(weights['b.mp4'] - (0.05 + 0.95 * 0.5)) < 1e-6
+        print(u"✓ 新鲜度按半衰期指数恢复")
+
+        # 一年的使用历史下批量查询仍然很快
+        rows = [{'video_path': 'lib/{}.mp4'.format(i), 'start_time': 0.0, 'duration': 1.0}
+                for i in range(2000)]
+        for day_index in range(365):
+            catalog.record_usage(rows[day_index * 5:day_index * 5 + 20], 'day.mp4',
+                                 used_at=now - day_index * day)
+        paths = ['lib/{}.mp4'.format(i) for i in range(2000)]
+        start_time = time.time()
+        weights = catalog.freshness_weights(paths, now=now)
+        elapsed = time.time() - start_time
+        print(u"2000个素材新鲜度查询耗时{:.3f}秒".format(elapsed))
+        assert len(weights) == 2000 and elapsed < 1.0
+        catalog.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_freshness_weighted_planning():
+    """测试规划时偏向较新鲜的素材"""
+    print(u"=== 测试新鲜度加权规划 ===")
+    video_infos = [{'path': 'fresh.mp4', 'duration': 10.0}, {'path': 'stale.mp4', 'duration': 10.0}]
+    planner = SegmentPlanner(seed=3, source_weights={'fresh.mp4': 1.0, 'stale.mp4': 0.05})
+    segments = planner.plan_random(video_infos, 400.0)
+    fresh = sum(s['duration'] for s in segments if s['video_path'] == 'fresh.mp4')
+    ratio = fresh / sum(s['duration'] for s in segments)
+    print(u"新鲜素材占比: {:.1%}".format(ratio))
+    assert ratio > 0.85
+    print(u"✓ 较久未用的素材被优先选择")
+
+
+def test_keyword_search():
+    """测试倒排索引和检索式"""
+    print(u"=== 测试关键词检索 ===")
+    assert tokenize(u'BeachSunset_2023') == [u'beach', u'sunset', u'2023']
+    assert tokenize(u'海边日落', for_query=True) == [u'海边', u'边日', u'日落']
+    clauses, excluded = parse_query(u'beach AND sunset -night 海边 OR 沙滩 NOT 夜景')
+    assert clauses == [[u'beach'], [u'sunset'], [u'海边', u'沙滩']]
+    assert excluded == [u'night', u'夜景']
+    print(u"✓ 分词和检索式解析正确")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        catalog = MediaCatalog(db_path=os.path.join(temp_dir, 'catalog.db'))
+        root = os.path.join(temp_dir, 'library')
+        paths = [
+            os.path.join(root, u'海边', u'beach_sunset_01.mp4'),
+            os.path.join(root, u'海边', u'beach_sunset_night.mp4'),
+            os.path.join(root, u'城市', u'CitySunset.mp4'),
+            os.path.join(root, u'沙滩日落', u'clip.mp4'),
+        ]
+        catalog.index_sources(paths, root)
+        catalog.set_tags(paths[2], [u'beach'])
+
+        assert catalog.search(u'beach AND sunset -night') == sorted([paths[0], paths[2]])
+        assert catalog.search(u'日落 沙滩') == [paths[3]]
+        assert catalog.search(u'海边 OR 城市', candidates=paths) == paths[:3]
+        assert catalog.search(u'-beach') == [paths[3]]
+        print(u"✓ 检索结果正确（含用户标签和中文）")
+
+        catalog.set_tags(paths[2], [])
+        assert catalog.search(u'beach sunset') == sorted(paths[:2])
+        print(u"✓ 修改标签后索引同步更新")
+
+        # 10万个素材的检索耗时
+        library = [os.path.join(root, u'topic{}'.format(i % 50), u'clip_{}_{}.mp4'.format(
+            [u'beach', u'city', u'forest', u'night'][i % 4], i)) for i in range(100000)]
+        catalog.index_sources(library, root)
+        start_time = time.time()
+        result = catalog.search(u'beach AND topic10 -night')
+        elapsed = time.time() - start_time
+        print(u"10万个素材中检索到{}个，耗时{:.1f}毫秒".format(len(result), elapsed * 1000))
+        assert len(result) == 1000
+        assert elapsed < 0.5
+        catalog.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    test_usage_ledger()
+    test_freshness_weighted_planning()
+    test_keyword_search()
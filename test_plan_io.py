@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+测试片段计划导入导出和增量渲染分组
+"""
+import sys
+import os
+import io
+import shutil
+import hashlib
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from plan_io import save_plan, load_plan, save_edl, format_timecode
+from ffmpeg_renderer import FFmpegRenderer
+from segment_planner import SegmentPlanner
+from segment_cache import SegmentCache
+
+
+def test_plan_round_trip():
+    """测试计划保存、读取和源视频变化检测"""
+    print(u"=== 测试计划导入导出 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        video_infos = []
+        for i in range(3):
+            path = os.path.join(temp_dir, u'素材{}.mp4'.format(i))
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1000 + i))
+            video_infos.append({'path': path, 'duration': 20.0})
+
+        planner = SegmentPlanner(seed=11)
+        segments = planner.plan_random(video_infos, 30.0)
+        settings = {'width': 1280, 'height': 720, 'fps': 25, 'crf': 20, 'preset': 'fast'}
+        plan_path = os.path.join(temp_dir, 'mix.plan.json')
+        save_plan(plan_path, segments, planner.seed, 'random', 30.0, settings)
+
+        loaded, meta = load_plan(plan_path)
+        assert meta['seed'] == 11 and meta['output_settings'] == settings
+        assert meta['changed_sources'] == []
+        assert len(loaded) == len(segments)
+        for original, item in zip(segments, loaded):
+            assert item['video_path'] == original['video_path']
+            assert abs(item['start_time'] - original['start_time']) < 1e-6
+            assert abs(item['duration'] - original['duration']) < 1e-6
+        print(u"✓ 计划读取后与原计划一致")
+
+        # 同一种子重新规划得到相同计划
+        replanned = SegmentPlanner(seed=meta['seed']).plan_random(video_infos, 30.0)
+        assert [s['start_time'] for s in replanned] == [s['start_time'] for s in segments]
+        print(u"✓ 使用保存的种子可以复现计划")
+
+        with open(segments[0]['video_path'], 'ab') as f:
+            f.write(b'changed')
+        _, meta = load_plan(plan_path)
+        assert meta['changed_sources'] == [segments[0]['video_path']]
+        print(u"✓ 检测到源视频已变化")
+
+        edl_path = os.path.join(temp_dir, 'mix.edl')
+        save_edl(edl_path, segments, 25)
+        with io.open(edl_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines[0] == u'TITLE: mix'
+        events = [line for line in lines if line[:3].isdigit()]
+        assert len(events) == len(segments)
+        assert events[0].split()[-2] == '00:00:00:00'
+        assert format_timecode(3661.48, 25) == '01:01:01:12'
+        print(u"✓ EDL导出正确")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_stretch_boundaries():
+    """测试修改一个片段只影响它所在的片段组"""
+    print(u"=== 测试增量渲染分组 ===")
+    renderer = FFmpegRenderer()
+    keys = [hashlib.sha1(str(i).encode('ascii')).hexdigest() for i in range(200)]
+    stretches = renderer.split_stretches(keys)
+    assert stretches[0][0] == 0 and stretches[-1][1] == len(keys)
+    assert all(end - start <= renderer.stretch_segments * 2 for start, end in stretches)
+
+    def groups(segment_keys):
+        return set(tuple(segment_keys[start:end]) for start, end in renderer.split_stretches(segment_keys))
+
+    original = groups(keys)
+    edited = list(keys)
+    edited[100] = hashlib.sha1(b'edited').hexdigest()
+    changed = groups(edited) - original
+    print(u"{}组中修改一个片段后需要重新编码{}组".format(len(original), len(changed)))
+    assert len(changed) <= 2
+
+    inserted = keys[:50] + [hashlib.sha1(b'new').hexdigest()] + keys[50:]
+    changed = groups(inserted) - original
+    assert len(changed) <= 2
+    print(u"✓ 修改或插入片段只影响相邻的片段组")
+
+
+def test_incremental_render_cleanup():
+    """测试增量渲染失败时不留下中间文件，片段组缓存只存放完整的组"""
+    print(u"=== 测试增量渲染临时文件 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(temp_dir, 'a.mp4')
+        with open(source, 'wb') as f:
+            f.write(b'\0' * 1000)
+        renderer = FFmpegRenderer()
+        renderer.temp_folder = os.path.join(temp_dir, 'temp')
+        os.makedirs(renderer.temp_folder)
+        renderer.ffmpeg_path = os.path.join(temp_dir, 'missing-ffmpeg')
+        renderer.segment_cache = None
+        renderer.stretch_cache = SegmentCache(cache_dir=os.path.join(temp_dir, 'stretches'), budget_mb=1)
+        info = {'path': source, 'width': 1280, 'height': 720, 'fps': 30.0, 'duration': 60.0}
+        segments = [{'video_path': source, 'start_time': 2.0 * i, 'duration': 2.0, 'video_info': info}
+                    for i in range(20)]
+        success, _ = renderer.render_incremental(segments, os.path.join(temp_dir, 'out.mp4'), info)
+        assert not success
+        assert os.listdir(renderer.temp_folder) == []
+        assert not os.path.exists(renderer.stretch_cache.cache_dir)
+        assert renderer.stretch_cache.misses > 0 and renderer.stretch_cache.hits == 0
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 中间文件在任务独立目录中并被清理")
+
+
+if __name__ == "__main__":
+    test_plan_round_trip()
+    test_stretch_boundaries()
+    test_incremental_render_cleanup()
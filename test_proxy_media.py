@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+测试代理文件和预览渲染
+"""
+import sys
+import os
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from proxy_media import ProxyManager
+from ffmpeg_renderer import FFmpegRenderer
+
+
+def write_file(path, content):
+    """写入测试文件"""
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_proxy_lookup():
+    """测试代理文件命名、查找和预览渲染的路径替换"""
+    print(u"=== 测试代理文件 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        a = write_file(os.path.join(temp_dir, 'a.mp4'), b'a' * 1000)
+        b = write_file(os.path.join(temp_dir, 'b.mp4'), b'b' * 1000)
+        proxies = ProxyManager(proxy_dir=os.path.join(temp_dir, 'proxies'))
+        assert proxies.proxy_path(a) != proxies.proxy_path(b)
+        assert proxies.proxy_path(a).endswith('_360p.mp4')
+        assert proxies.build_lookup([a, b]) == {}
+
+        # ffmpeg无法运行时不留下写了一半的代理文件
+        proxies.ffmpeg_path = os.path.join(temp_dir, 'missing-ffmpeg')
+        success, _ = proxies.create_proxy(a)
+        assert not success
+        assert os.listdir(os.path.join(temp_dir, 'proxies')) == []
+
+        write_file(proxies.proxy_path(a), b'proxy')
+        lookup = proxies.build_lookup([a, b])
+        assert lookup == {a: proxies.proxy_path(a)}
+        assert proxies.generate([a, a]) == lookup
+
+        # 预览渲染只替换片段副本中的路径，计划本身保持原始素材
+        renderer = FFmpegRenderer()
+        renderer.temp_folder = temp_dir
+        renderer.ffmpeg_path = proxies.ffmpeg_path
+        segments = [{'video_path': a, 'start_time': 1.0, 'duration': 2.0},
+                    {'video_path': b, 'start_time': 0.0, 'duration': 2.0}]
+        info = {'width': 1920, 'height': 1080, 'fps': 30}
+        success, _ = renderer.render_preview(segments, os.path.join(temp_dir, 'preview.mp4'), info, lookup)
+        assert not success
+        assert [segment['video_path'] for segment in segments] == [a, b]
+        print(u"✓ 代理文件按源视频指纹命名，预览不修改原计划")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    test_proxy_lookup()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+测试烧录字幕区域自动检测功能
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import shutil
+import tempfile
+import numpy as np
+from region_detector import SubtitleRegionDetector, WatermarkDetector, AdPlacementAnalyzer
+
+
+def make_frames(with_subtitle=True, count=24, seed=0):
+    """生成模拟采样帧：块状背景 + 底部变化的字幕笔画"""
+    rng = np.random.RandomState(seed)
+    height, width = 108, 192
+    frames = np.zeros((count, height, width), dtype=np.uint8)
+    for n in range(count):
+        base = rng.rand(height // 12 + 1, width // 12 + 1) * 200
+        frame = np.kron(base, np.ones((12, 12)))[:height, :width]
+        if with_subtitle and n % 5:
+            strokes = rng.rand(8, 90) > 0.5
+            band = frame[88:96, 50:140]
+            frame[88:96, 50:140] = np.where(strokes, 255, band * 0.2)
+        frames[n] = frame.astype(np.uint8)
+    return frames
+
+
+def test_subtitle_region_detection():
+    """测试字幕区域检测"""
+    print(u"=== 测试烧录字幕区域自动检测 ===")
+
+    detector = SubtitleRegionDetector()
+    video_info = {'width': 1920, 'height': 1080, 'duration': 60.0}
+
+    region = detector.detect(None, video_info, frames=make_frames(True))
+    print(u"检测结果: {}".format(region))
+    assert region is not None
+    # 模拟字幕位于采样帧第88-96行、第50-140列（原视频约880-960行、500-1400列）
+    assert region['y'] <= 880 and region['y'] + region['height'] >= 960
+    assert region['x'] <= 500 and region['x'] + region['width'] >= 1390
+    assert region['height'] < 300
+    print(u"✓ 字幕区域定位正确")
+
+    region = detector.detect(None, video_info, frames=make_frames(False, seed=1))
+    print(u"无字幕画面检测结果: {}".format(region))
+    assert region is None
+    print(u"✓ 无字幕画面不会误检")
+
+
+
+def make_keyframes(count=16, seed=0):
+    """生成模拟关键帧：每帧内容不同的块状画面 + 右上角固定台标"""
+    rng = np.random.RandomState(seed)
+    height, width = 108, 192
+    logo = rng.rand(10, 24) > 0.5
+    frames = np.zeros((count, height, width), dtype=np.uint8)
+    for n in range(count):
+        base = rng.rand(height // 6 + 1, width // 6 + 1) * 200
+        frame = np.kron(base, np.ones((6, 6)))[:height, :width]
+        frame = np.roll(frame, (n * 2, n * 3), axis=(0, 1))
+        frame[6:16, 160:184] = np.where(logo, 255, frame[6:16, 160:184])
+        frames[n] = frame.astype(np.uint8)
+    return frames
+
+
+def test_watermark_detection():
+    """测试静态水印检测与缓存"""
+    print(u"=== 测试静态水印自动检测 ===")
+
+    detector = WatermarkDetector()
+    cache_dir = tempfile.mkdtemp()
+    detector.cache_path = os.path.join(cache_dir, 'watermark_masks.json')
+    video_info = {'width': 1920, 'height': 1080, 'duration': 120.0}
+
+    try:
+        regions = detector.detect(None, video_info, frames=make_keyframes())
+        print(u"检测结果: {}".format(regions))
+        assert len(regions) == 1
+        region = regions[0]
+        # 模拟台标位于采样帧第6-16行、第160-184列（原视频约60-160行、1600-1840列）
+        assert region['x'] <= 1600 and region['x'] + region['width'] >= 1840
+        assert region['y'] <= 60 and region['y'] + region['height'] >= 160
+        print(u"✓ 台标区域定位正确")
+
+        video_filter = detector.build_filter(regions, video_info)
+        print(u"去水印滤镜: {}".format(video_filter))
+        assert video_filter.startswith('delogo=')
+
+        # 写入缓存后，同一文件夹的其他视频直接复用检测结果
+        first_video = os.path.join(cache_dir, 'channel', 'a.mp4')
+        second_video = os.path.join(cache_dir, 'channel', 'b.mp4')
+        cache = {detector.get_cache_key(first_video, video_info): {'regions': regions}}
+        detector.save_cache(cache)
+        cached_regions, from_cache = detector.detect_cached(second_video, video_info)
+        assert from_cache and cached_regions == regions
+        print(u"✓ 同一来源的视频复用缓存的水印区域")
+
+        # 没有水印的来源也缓存空结果，之后不再重复检测
+        samples = []
+        def sample_keyframes(video_path, video_info, count):
+            samples.append(video_path)
+            return make_frames(False, count=count, seed=2), []
+        detector.sampler.is_available = lambda: True
+        detector.sampler.sample_keyframes = sample_keyframes
+        clean_video = os.path.join(cache_dir, 'clean', 'a.mp4')
+        assert detector.detect_cached(clean_video, video_info) == ([], False)
+        assert detector.detect_cached(clean_video, video_info) == ([], True)
+        assert len(samples) == 1
+        print(u"✓ 未检测到水印的结果同样缓存")
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+
+def test_ad_placement_analysis():
+    """测试广告位置自动选择"""
+    print(u"=== 测试广告位置自动选择 ===")
+
+    # 右上角是固定台标，左半边画面持续运动，右下角画面平静
+    frames = make_keyframes(count=8)
+    frames[:, :, :96] = make_frames(False, count=8, seed=3)[:, :, :96]
+    frames[:, 54:, 96:] = 80
+
+    analyzer = AdPlacementAnalyzer()
+    video_info = {'width': 1920, 'height': 1080, 'duration': 60.0}
+    regions = {
+        'top-right': {'x': 1420, 'y': 20, 'width': 480, 'height': 270},
+        'top-left': {'x': 20, 'y': 20, 'width': 480, 'height': 270},
+        'bottom-right': {'x': 1420, 'y': 790, 'width': 480, 'height': 270},
+        'bottom-left': {'x': 20, 'y': 790, 'width': 480, 'height': 270},
+    }
+    best, scores = analyzer.choose_position(None, video_info, regions, 10.0, 5.0, frames=frames)
+    for name in sorted(scores):
+        print(u"  {}: {:.3f}".format(name, scores[name]['score']))
+    assert best == 'bottom-right'
+    assert scores['top-right']['text'] > scores['bottom-right']['text']
+
+    print(u"✓ 选择了干扰最小的右下角")
+
+    # 只启动一个ffmpeg进程，从广告窗口起点开始解码窗口内的画面
+    commands = []
+    def read_frames(cmd, width, height, channels=1):
+        commands.append(cmd)
+        return frames
+    analyzer.sampler._read_frames = read_frames
+    best, _ = analyzer.choose_position('a.mp4', video_info, regions, 10.0, 5.0)
+    assert best == 'bottom-right' and len(commands) == 1
+    cmd = commands[0]
+    assert cmd[cmd.index('-ss') + 1] == '10.000' and cmd[cmd.index('-t') + 1] == '5.000'
+    assert cmd.index('-ss') < cmd.index('-i')
+    print(u"✓ 广告窗口在单个ffmpeg进程中采样")
+
+
+if __name__ == "__main__":
+    test_subtitle_region_detection()
+    test_watermark_detection()
+    test_ad_placement_analysis()
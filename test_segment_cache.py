@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+测试已编码片段缓存
+"""
+import sys
+import os
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from segment_cache import SegmentCache
+
+
+def write_file(path, size):
+    """写入指定大小的文件"""
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return path
+
+
+def test_segment_cache():
+    """测试缓存键、存取、命中统计和最近最少使用淘汰"""
+    print(u"=== 测试片段缓存 ===")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        source = write_file(os.path.join(temp_dir, 'source.mp4'), 5000)
+        cache = SegmentCache(cache_dir=os.path.join(temp_dir, 'segments'), budget_mb=0.01)
+        params = {'width': 1280, 'height': 720, 'fps': 30, 'crf': 20, 'preset': 'fast'}
+        segment = {'video_path': source, 'start_time': 3.0, 'duration': 2.5}
+
+        key = cache.make_key(segment, params)
+        assert key == cache.make_key(dict(segment), dict(params))
+        assert key != cache.make_key(dict(segment, start_time=3.1), params)
+        assert key != cache.make_key(segment, dict(params, crf=21))
+        assert key != cache.make_key(segment, dict(params, preset='slow'))
+
+        assert cache.lookup(key) is None
+        clip = write_file(os.path.join(temp_dir, 'clip.mp4'), 4000)
+        cached_path = cache.store(key, clip)
+        assert not os.path.exists(clip) and os.path.exists(cached_path)
+        assert cache.lookup(key) == cached_path
+
+        # 同一个键重复写入时保留已有文件
+        assert cache.store(key, write_file(os.path.join(temp_dir, 'dup.mp4'), 4000)) == cached_path
+        assert not [name for name in os.listdir(os.path.dirname(cached_path)) if name.endswith('.part')]
+
+        # 容量约10KB：写入三个4KB片段后淘汰最久未使用的一个
+        keys = [key]
+        for i in range(2):
+            other = cache.make_key(dict(segment, start_time=10.0 + i), params)
+            cache.store(other, write_file(os.path.join(temp_dir, 'clip{}.mp4'.format(i)), 4000))
+            keys.append(other)
+        times = {keys[0]: 300, keys[1]: 100, keys[2]: 200}
+        for item, mtime in times.items():
+            os.utime(cache.path_for(item), (mtime, mtime))
+        assert cache.evict() == 1
+        assert cache.contains(keys[0]) and cache.contains(keys[2])
+        assert not cache.contains(keys[1])
+
+        # 正在使用的文件不会被淘汰
+        cache.budget_bytes = 0
+        assert cache.evict(keep=[cache.path_for(keys[0])]) == 1
+        assert cache.contains(keys[0])
+
+        metrics = cache.metrics()
+        print(u"统计: {}".format(metrics))
+        assert metrics['hits'] == 1 and metrics['misses'] == 1
+        assert metrics['hit_rate'] == 0.5
+        assert metrics['stored'] == 4 and metrics['evicted'] == 2
+        assert metrics['bytes'] == 4000
+        print(u"✓ 缓存存取、统计和淘汰正确")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    test_segment_cache()
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+测试片段规划策略
+"""
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from segment_planner import AliasSampler, IntervalSet, SegmentPlanner
+from config import Config
+from keyframe_index import snap_to_keyframes
+from highlight_index import HighlightIndex
+
+
+FAKE_FFMPEG = u"""#!{python}
+import sys
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+err = getattr(sys.stderr, 'buffer', sys.stderr)
+# 大量解码错误超过管道缓冲区，之后才输出画面
+err.write(b'decode error\\n' * 20000)
+err.flush()
+out.write(b'\\x00' * 64 * 36 * 4)
+out.flush()
+sys.exit({code})
+"""
+
+
+def make_video_infos(count, seed=1):
+    """生成模拟视频信息"""
+    rng = random.Random(seed)
+    return [{'path': 'video_{}.mp4'.format(i), 'duration': rng.uniform(3, 20)} for i in range(count)]
+
+
+def test_alias_sampler():
+    """测试别名采样的权重分布"""
+    print(u"=== 测试别名采样 ===")
+    sampler = AliasSampler([1.0, 3.0, 6.0], random.Random(0))
+    counts = [0, 0, 0]
+    for _ in range(60000):
+        counts[sampler.pick()] += 1
+    ratios = [c / 60000.0 for c in counts]
+    print(u"抽样比例: {}".format(ratios))
+    for ratio, expected in zip(ratios, [0.1, 0.3, 0.6]):
+        assert abs(ratio - expected) < 0.01
+    print(u"✓ 抽样比例与时长权重一致")
+
+
+def test_strategies_shape_and_speed():
+    """测试各策略输出结构、总时长和大规模规划耗时"""
+    print(u"=== 测试片段规划策略 ===")
+    video_infos = make_video_infos(100000)
+    planner = SegmentPlanner(seed=5)
+
+    for strategy in ['plan_random', 'plan_sequential', 'plan_balanced']:
+        start = time.time()
+        segments = getattr(planner, strategy)(video_infos, 150000)
+        elapsed = time.time() - start
+        total = sum(seg['duration'] for seg in segments)
+        print(u"{}: {} 个片段, 总时长 {:.2f}秒, 耗时 {:.3f}秒".format(strategy, len(segments), total, elapsed))
+
+        assert abs(total - 150000) < 1e-3
+        assert [seg['id'] for seg in segments[:3]] == [0, 1, 2]
+        for seg in segments[:100]:
+            assert sorted(seg.keys()) == ['duration', 'id', 'start_time', 'video_info', 'video_path']
+            assert seg['video_path'] == seg['video_info']['path']
+            assert 0 <= seg['start_time'] <= seg['video_info']['duration'] - seg['duration'] + 1e-9
+        assert elapsed < 1.0
+    print(u"✓ 10万个源视频的规划在1秒内完成，输出结构不变")
+
+
+def test_seed_reproducible():
+    """测试配置种子可复现"""
+    video_infos = make_video_infos(50)
+    first = SegmentPlanner(seed=42).plan_random(video_infos, 300)
+    second = SegmentPlanner(seed=42).plan_random(video_infos, 300)
+    assert [(s['video_path'], s['start_time']) for s in first] == \
+        [(s['video_path'], s['start_time']) for s in second]
+    print(u"✓ 相同种子生成相同计划")
+
+
+
+def test_interval_set():
+    """测试区间集合的重叠检查和空闲区间"""
+    intervals = IntervalSet()
+    intervals.add(10, 20)
+    intervals.add(40, 50)
+    assert intervals.overlaps(15, 25) and intervals.overlaps(5, 11) and intervals.overlaps(45, 46)
+    assert not intervals.overlaps(20, 40) and not intervals.overlaps(0, 10)
+    assert intervals.gaps(0, 60) == [(0, 10), (20, 40), (50, 60)]
+    assert intervals.gaps_near(45, 0, 60, 0) == [(50, 60)]
+    assert intervals.gaps_near(30, 0, 60, 1) == [(0, 10), (20, 40), (50, 60)]
+    print(u"✓ 区间集合重叠检查正确")
+
+
+def test_constrained_plan():
+    """测试约束策略：单视频片段上限、时间不重叠、片段时长范围、帧精确总时长"""
+    print(u"=== 测试约束混剪策略 ===")
+    config = Config()
+    config.set(3, 'processing', 'max_segments_per_video')
+    config.set(1.0, 'processing', 'min_segment_duration')
+    config.set(4.0, 'processing', 'max_segment_duration')
+    video_infos = make_video_infos(20)
+    fps = 25
+
+    segments = SegmentPlanner(config, seed=7).plan_constrained(video_infos, 123.45, fps)
+    frames = [seg['duration'] * fps for seg in segments]
+    total_frames = sum(int(round(f)) for f in frames)
+    print(u"片段数: {}, 总帧数: {}".format(len(segments), total_frames))
+    assert total_frames == int(round(123.45 * fps))
+    assert all(abs(f - round(f)) < 1e-6 for f in frames)
+    assert all(1.0 - 1e-9 <= seg['duration'] <= 4.0 + 1e-9 for seg in segments)
+
+    by_video = {}
+    for seg in segments:
+        by_video.setdefault(seg['video_path'], []).append((seg['start_time'], seg['start_time'] + seg['duration']))
+    for ranges in by_video.values():
+        assert len(ranges) <= 3
+        ranges.sort()
+        for (_, previous_end), (next_start, _) in zip(ranges, ranges[1:]):
+            assert next_start >= previous_end - 1e-9
+
+    # 输出帧率与默认帧率不同时按输出帧率对齐
+    # 测试不读写素材库数据库
+    from video_processor import VideoProcessor
+    config.set(False, 'catalog', 'freshness_weighting')
+    segments = VideoProcessor(config).plan_segments(video_infos, 50.0, 'constrained', 24)
+    frames = [seg['duration'] * 24 for seg in segments]
+    assert all(abs(f - round(f)) < 1e-6 for f in frames)
+    assert sum(int(round(f)) for f in frames) == 50 * 24
+    print(u"✓ 满足片段数上限、不重叠和帧精确时长约束")
+
+
+def test_keyframe_alignment():
+    """测试按关键帧对齐和流复制标记"""
+    print(u"=== 测试关键帧对齐 ===")
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0]
+    assert snap_to_keyframes(keyframes, 2.5, 3.5, 10.0) == (2.0, 4.0)
+    assert snap_to_keyframes(keyframes, 4.0, 6.0, 10.0) == (4.0, 6.0)
+    assert snap_to_keyframes(keyframes, 8.5, 9.5, 10.0) == (8.0, 10.0)
+
+    stream = {'codec_type': 'video', 'codec_name': 'h264', 'profile': 'High', 'width': 1920,
+              'height': 1080, 'pix_fmt': 'yuv420p', 'time_base': '1/15360', 'r_frame_rate': '30/1'}
+    video_infos = [{'path': 'video_{}.mp4'.format(i), 'duration': 10.0, 'streams': [stream]}
+                   for i in range(3)]
+    lookup = dict((info['path'], keyframes) for info in video_infos)
+
+    planner = SegmentPlanner(seed=2)
+    segments = planner.plan_random(video_infos, 20.0)
+    aligned, all_aligned = planner.align_to_keyframes(segments, lookup, 20.0)
+    total = sum(segment['duration'] for segment in aligned)
+    print(u"对齐后: {}个片段，总时长{:.2f}秒".format(len(aligned), total))
+    assert all_aligned
+    assert 20.0 <= total < 22.0 + 1e-9
+    for index, segment in enumerate(aligned):
+        assert segment['id'] == index
+        assert segment['start_time'] in keyframes
+        end = segment['start_time'] + segment['duration']
+        assert end in keyframes or abs(end - 10.0) < 1e-9
+    assert planner.mark_copy_eligible(aligned, all_aligned)
+    assert all(segment['copy_eligible'] for segment in aligned)
+    print(u"✓ 片段边界全部落在关键帧上，编码一致时标记为可流复制")
+
+    video_infos[1]['streams'] = [dict(stream, width=1280, height=720)]
+    segments = planner.build_segments(video_infos, [0, 1], [1.0, 3.0], [2.0, 2.0])
+    aligned, all_aligned = planner.align_to_keyframes(segments, lookup)
+    assert not planner.mark_copy_eligible(aligned, all_aligned)
+    segments = planner.build_segments(video_infos, [0, 2], [1.0, 3.0], [2.0, 2.0])
+    aligned, all_aligned = planner.align_to_keyframes(segments, {'video_0.mp4': keyframes})
+    assert not all_aligned
+    assert not planner.mark_copy_eligible(aligned, all_aligned)
+    print(u"✓ 编码参数不一致或有片段未对齐时不可流复制")
+
+
+def test_variant_plans():
+    """测试多版本低重叠计划"""
+    print(u"=== 测试多版本低重叠计划 ===")
+    intervals = IntervalSet()
+    intervals.merge(1.0, 2.0)
+    intervals.merge(4.0, 5.0)
+    intervals.merge(1.5, 4.5)
+    assert (intervals.starts, intervals.ends) == ([1.0], [5.0])
+    intervals.merge(7.0, 8.0)
+    assert intervals.overlap_length(0.0, 7.5) == 4.5
+    print(u"✓ 区间合并和重叠长度计算正确")
+
+    video_infos = make_video_infos(300)
+    library = sum(info['duration'] for info in video_infos)
+    planner = SegmentPlanner(seed=9)
+    count = 200
+    target = 30.0
+    start_time = time.time()
+    plans, overlaps = planner.plan_variants(video_infos, target, count, max_overlap=0.2)
+    elapsed = time.time() - start_time
+    print(u"素材总时长{:.0f}秒，生成{}个版本耗时{:.3f}秒".format(library, count, elapsed))
+    assert len(plans) == count
+    for plan in plans:
+        assert abs(sum(segment['duration'] for segment in plan) - target) < 1e-6
+    # 前若干版本素材充足，重叠控制在上限内
+    fresh = int(library * 0.5 // target)
+    print(u"前{}个版本最大重叠比例: {:.1%}".format(fresh, max(overlaps[:fresh])))
+    assert max(overlaps[:fresh]) <= 0.2 + 1e-9
+    assert elapsed < 10.0
+    print(u"✓ 多版本计划重叠受控且规划耗时随版本数线性增长")
+
+
+def test_subtitle_aligned_plan():
+    """测试按字幕切点规划"""
+    print(u"=== 测试字幕对齐规划 ===")
+    subtitles = [
+        {'start': 0.5, 'end': 3.0, 'text': u'第一句'},
+        {'start': 3.2, 'end': 15.0, 'text': u'很长的第二句'},
+        {'start': 15.5, 'end': 18.0, 'text': u'第三句'},
+    ]
+    planner = SegmentPlanner(seed=4)
+    slots = planner.subtitle_slots(subtitles)
+    assert [round(slot, 6) for slot in slots] == [3.2, 12.3, 2.5]
+
+    video_infos = make_video_infos(10)
+    segments = planner.plan_aligned(video_infos, slots)
+    cuts = set()
+    position = 0.0
+    for segment in segments:
+        position += segment['duration']
+        cuts.add(round(position, 6))
+        assert segment['start_time'] + segment['duration'] <= segment['video_info']['duration'] + 1e-9
+    boundaries = set([3.2, 15.5, 18.0])
+    print(u"{}个片段，切点: {}".format(len(segments), sorted(cuts)))
+    assert boundaries <= cuts
+    # 长句按最长片段时长拆分，拆分点之外没有多余的切点
+    max_duration = Config().get('processing', 'max_segment_duration')
+    assert all(segment['duration'] <= max_duration + 1e-9 for segment in segments)
+    assert len(segments) == 1 + int(-(-12.3 // max_duration)) + 1
+    print(u"✓ 画面切换落在字幕句子边界上")
+
+
+def test_highlight_plan():
+    """测试精彩集锦规划"""
+    print(u"=== 测试精彩集锦规划 ===")
+    rng = random.Random(6)
+    seconds = 7200
+    signals = {
+        'loudness': [-40 + rng.random() * 10 for _ in range(seconds)],
+        'motion': [rng.random() * 5 for _ in range(seconds)],
+        'scenes': [0] * seconds
+    }
+    # 人为制造两段高潮：响度、运动、镜头切换都明显更高
+    for peak in (1200, 5000):
+        for second in range(peak, peak + 8):
+            signals['loudness'][second] = -10.0
+            signals['motion'][second] = 40.0
+            signals['scenes'][second] = 2
+    video_infos = [{'path': 'long.mp4', 'duration': float(seconds)},
+                   {'path': 'missing.mp4', 'duration': 60.0}]
+    planner = SegmentPlanner(seed=6)
+
+    start = time.time()
+    segments = planner.plan_highlights(video_infos, 16.0, {'long.mp4': signals}, window=4.0)
+    elapsed = (time.time() - start) * 1000
+    print(u"2小时素材规划耗时: {:.1f}ms".format(elapsed))
+
+    starts = [segment['start_time'] for segment in segments]
+    print(u"选中片段起点: {}".format(starts))
+    assert starts == [1200.0, 1204.0, 5000.0, 5004.0]
+    assert all(segment['video_path'] == 'long.mp4' for segment in segments)
+    assert abs(sum(segment['duration'] for segment in segments) - 16.0) < 1e-9
+
+    # 素材不足时不重复使用画面
+    short = [{'path': 'short.mp4', 'duration': 6.0}]
+    segments = planner.plan_highlights(short, 20.0, {'short.mp4': {
+        'loudness': [-20.0] * 6, 'motion': [1.0] * 6, 'scenes': [0] * 6}}, window=4.0)
+    assert sum(segment['duration'] for segment in segments) <= 6.0 + 1e-9
+    assert planner.plan_highlights(short, 20.0, {}) == []
+
+    # 与画面共用一个ffmpeg进程时，响度由astats按每秒一帧写入文本文件
+    handle, stats_path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(handle, 'w') as f:
+        for frame, (level, samples) in enumerate([(-20.5, 8000), ('-inf', 8000), (-30.0, 1200)]):
+            f.write("frame:{}    pts:{}       pts_time:{}\n".format(frame, frame * 8000, frame))
+            f.write("lavfi.astats.Overall.RMS_level={}\n".format(level))
+            f.write("lavfi.astats.Overall.Number_of_samples={}\n".format(samples))
+    try:
+        assert HighlightIndex().read_loudness(stats_path) == [-20.5, -100.0]
+    finally:
+        os.remove(stats_path)
+    print(u"✓ 精彩集锦选中高潮窗口且互不重叠")
+
+
+def test_highlight_signal_errors():
+    """测试信号分析时错误输出不阻塞，ffmpeg失败时不缓存结果"""
+    print(u"\n=== 测试精彩片段信号分析失败处理 ===")
+    if os.name != 'posix':
+        print(u"跳过: 需要可执行脚本")
+        return
+    temp_dir = tempfile.mkdtemp()
+    try:
+        index = HighlightIndex()
+        index.cache_path = os.path.join(temp_dir, 'highlight_index.json')
+        video_info = {'width': 1920, 'height': 1080, 'duration': 2.0, 'has_audio': False}
+        for code in (0, 1):
+            script = os.path.join(temp_dir, 'ffmpeg{}'.format(code))
+            with open(script, 'w') as f:
+                f.write(FAKE_FFMPEG.format(python=sys.executable, code=code))
+            os.chmod(script, 0o755)
+            index.ffmpeg_path = script
+            signals = index.get_signals(script, video_info, save=False)
+            if code == 0:
+                assert signals['motion'] == [0.0, 0.0] and signals['loudness'] == []
+            else:
+                assert signals is None
+                assert index.get_cache_key(script) not in index.load_cache()
+    finally:
+        shutil.rmtree(temp_dir)
+    print(u"✓ 错误输出持续读取，失败的分析不写入缓存")
+
+
+if __name__ == "__main__":
+    test_alias_sampler()
+    test_strategies_shape_and_speed()
+    test_seed_reproducible()
+    test_interval_set()
+    test_constrained_plan()
+    test_keyframe_alignment()
+    test_variant_plans()
+    test_subtitle_aligned_plan()
+    test_highlight_plan()
+    test_highlight_signal_errors()
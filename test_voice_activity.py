@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+测试基于能量和过零率的语音活动检测
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import wave
+import shutil
+import tempfile
+import numpy as np
+from voice_activity import VoiceActivityDetector
+
+
+def write_test_wav(path, pattern, sample_rate=16000):
+    """按(类型, 时长)序列生成测试音频：'v'为带包络的浊音，'s'为底噪"""
+    rng = np.random.RandomState(0)
+    parts = []
+    for kind, duration in pattern:
+        count = int(duration * sample_rate)
+        samples = rng.randn(count) * 0.003
+        if kind == 'v':
+            t = np.arange(count) / float(sample_rate)
+            envelope = 0.6 + 0.4 * np.abs(np.sin(2 * np.pi * 4 * t))
+            samples += 0.3 * envelope * (np.sin(2 * np.pi * 220 * t) + 0.3 * np.sin(2 * np.pi * 660 * t))
+        parts.append(samples)
+    data = (np.concatenate(parts) * 32767).astype('<i2')
+    writer = wave.open(path, 'wb')
+    writer.setnchannels(1)
+    writer.setsampwidth(2)
+    writer.setframerate(sample_rate)
+    writer.writeframes(data.tobytes())
+    writer.close()
+
+
+def test_voice_activity_detection():
+    """测试语音区间检测和长片段切分"""
+    print(u"=== 测试语音活动检测 ===")
+
+    temp_dir = tempfile.mkdtemp()
+    wav_path = os.path.join(temp_dir, 'speech.wav')
+    try:
+        write_test_wav(wav_path, [('s', 1.0), ('v', 2.0), ('s', 1.5), ('v', 3.0),
+                                  ('s', 0.2), ('v', 1.0), ('s', 2.0), ('v', 12.0), ('s', 1.0)])
+        detector = VoiceActivityDetector()
+
+        segments = detector.speech_segments(wav_path)
+        print(u"语音区间: {}".format(segments))
+        assert len(segments) == 3
+        expected = [(1.0, 3.0), (4.5, 8.7), (10.7, 22.7)]
+        for (start, end), (exp_start, exp_end) in zip(segments, expected):
+            assert abs(start - exp_start) < 0.1 and abs(end - exp_end) < 0.1
+        print(u"✓ 语音边界检测正确，0.2秒的短停顿被合并")
+
+        chunks = detector.speech_segments(wav_path, max_duration=5.0)
+        print(u"切分后的识别分块: {}".format(chunks))
+        assert all(end - start <= 5.0 + 1e-6 for start, end in chunks)
+        assert abs(sum(end - start for start, end in chunks) -
+                   sum(end - start for start, end in segments)) < 1e-6
+        print(u"✓ 长语音段按最大时长切分，总时长不变")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    test_voice_activity_detection()
@@ -7,9 +7,13 @@
 import os
 import subprocess
 import json
-import random
 import tempfile
 from config import Config
+from segment_planner import SegmentPlanner
+from keyframe_index import KeyframeIndex
+from media_catalog import MediaCatalog
+from embedding_index import EmbeddingModel, EmbeddingIndex
+from highlight_index import HighlightIndex
 
 class VideoProcessor(object):
     """视频处理器"""
@@ -19,6 +23,7 @@ class VideoProcessor(object):
         self.ffmpeg_path = self.config.get('ffmpeg', 'path')
         self.ffprobe_path = self.config.get('ffmpeg', 'ffprobe_path')
         self.log_level = self.config.get('ffmpeg', 'log_level')
+        self.last_plan_seed = None
     
     def check_ffmpeg(self):
         """检查ffmpeg是否可用"""
@@ -165,14 +170,113 @@ class VideoProcessor(object):
                             print(u"无效视频: {} - {}".format(file, message))
                         break
         
+        self.index_videos(video_files, folder_path)
         return video_files, invalid_files
     
-    def create_segments_plan(self, video_files, target_duration, strategy='random'):
-        """创建视频片段计划"""
+    def create_segments_plan(self, video_files, target_duration, strategy='random', keyframe_aligned=None,
+                             query=None, fps=None):
+        """
+        创建视频片段计划
+
+        keyframe_aligned为None时使用配置processing.keyframe_aligned
+        query: 可选的关键词检索式（如 "beach AND sunset -night"），只使用匹配的素材；
+        video_files为空时在整个素材目录中检索
+        fps: 输出帧率，约束策略按它对齐到帧（为None时使用video.default_fps）
+        """
+        if query:
+            video_files = self.filter_by_query(video_files, query)
+        video_infos = self._collect_video_infos(video_files, target_duration)
+        if not video_infos:
+            return []
+        
+        segments = self.plan_segments(video_infos, target_duration, strategy, fps)
+        
+        if keyframe_aligned is None:
+            keyframe_aligned = self.config.get('processing', 'keyframe_aligned')
+        if keyframe_aligned and segments:
+            segments = self.align_segments_to_keyframes(segments, video_infos, target_duration)
+        
+        return segments
+    
+    def create_variant_plans(self, video_files, target_duration, count, max_overlap=None,
+                             keyframe_aligned=None, query=None):
+        """
+        批量创建多个互相低重叠的片段计划（多版本混剪）
+        
+        返回: 计划列表，每个计划是片段列表
+        """
+        if query:
+            video_files = self.filter_by_query(video_files, query)
+        video_infos = self._collect_video_infos(video_files, target_duration)
+        if not video_infos:
+            return []
+        
+        plans, overlap_ratios = self.create_planner(video_infos).plan_variants(
+            video_infos, target_duration, count, max_overlap
+        )
+        print(u"已生成 {} 个版本的片段计划，与之前版本的最大重叠比例: {:.1%}".format(
+            len(plans), max(overlap_ratios) if overlap_ratios else 0.0))
+        
+        if keyframe_aligned is None:
+            keyframe_aligned = self.config.get('processing', 'keyframe_aligned')
+        if keyframe_aligned:
+            plans = [self.align_segments_to_keyframes(plan, video_infos, target_duration)
+                     for plan in plans if plan]
+        return plans
+    
+    def create_subtitle_aligned_plan(self, video_files, subtitles, target_duration=None):
+        """
+        按字幕时间轴创建片段计划：每条字幕对应一个或多个片段，画面切换都落在句子边界上
+        
+        subtitles: [{'start', 'end', 'text'}, ...]（SubtitleGenerator输出或TTS片段时间）
+        """
+        if not subtitles:
+            return []
+        total = max(sub['end'] for sub in subtitles)
+        if target_duration:
+            total = max(total, target_duration)
+        video_infos = self._collect_video_infos(video_files, total)
+        if not video_infos:
+            return []
+        
+        planner = self.create_planner(video_infos)
+        slots = planner.subtitle_slots(subtitles, target_duration)
+        slot_matches = None
+        if self.config.get('embedding', 'enabled'):
+            ordered = sorted(subtitles, key=lambda sub: float(sub['start']))
+            matches = self.match_sentences(video_infos, [sub.get('text', u'') for sub in ordered])
+            # 开始时间重复的字幕会被合并成一个区间，此时无法一一对应，放弃语义匹配
+            if matches and len(matches) == len(slots):
+                slot_matches = matches
+        segments = planner.plan_aligned(video_infos, slots, slot_matches)
+        print(u"按 {} 条字幕切分为 {} 个片段".format(len(subtitles), len(segments)))
+        return segments
+    
+    def match_sentences(self, video_infos, texts):
+        """
+        用画面向量索引为每个句子检索匹配的关键帧，新增或变化的视频先计算向量
+
+        返回: 与texts等长的匹配列表，模型或依赖不可用时返回None
+        """
+        model = EmbeddingModel(self.config)
+        if not model.is_available(need_text=True):
+            print(u"画面语义检索不可用，随机选择画面")
+            return None
+        try:
+            index = EmbeddingIndex(self.config)
+            index.load()
+            index.update(model, video_infos)
+            top_k = self.config.get('embedding', 'top_k') or 5
+            return index.retrieve(model, texts, top_k, [info['path'] for info in video_infos])
+        except Exception as e:
+            print(u"画面语义检索失败，随机选择画面: {}".format(str(e)))
+            return None
+    
+    def _collect_video_infos(self, video_files, target_duration):
+        """获取所有有效视频的信息"""
         if not video_files:
             return []
         
-        # 获取所有视频信息
         video_infos = []
         total_duration = 0
         
@@ -191,161 +295,116 @@ class VideoProcessor(object):
         if total_duration < target_duration:
             print(u"警告：可用视频总时长小于目标时长，将循环使用视频")
         
-        # 根据策略生成片段
-        if strategy == 'random':
-            return self._create_random_segments(video_infos, target_duration)
-        elif strategy == 'sequential':
+        return video_infos
+    
+    def align_segments_to_keyframes(self, segments, video_infos, target_duration):
+        """把片段边界对齐到关键帧，并标记计划是否可直接流复制"""
+        print(u"读取关键帧索引...")
+        lookup = KeyframeIndex(self.config).build_lookup(video_infos)
+        planner = SegmentPlanner(self.config)
+        segments, all_aligned = planner.align_to_keyframes(segments, lookup, target_duration)
+        if not all_aligned:
+            print(u"警告：部分视频无法读取关键帧，这些片段未对齐")
+        
+        if planner.mark_copy_eligible(segments, all_aligned):
+            print(u"✓ 所有片段已按关键帧对齐且编码参数一致，可直接流复制拼接")
+        else:
+            print(u"片段已按关键帧对齐，但源视频编码参数不一致，仍需重新编码")
+        return segments
+    
+    def plan_segments(self, video_infos, target_duration, strategy='random', fps=None):
+        """根据已获取的视频信息生成片段计划（fps为约束策略使用的输出帧率）"""
+        if strategy == 'sequential':
             return self._create_sequential_segments(video_infos, target_duration)
         elif strategy == 'balanced':
             return self._create_balanced_segments(video_infos, target_duration)
+        elif strategy == 'constrained':
+            return self._create_constrained_segments(video_infos, target_duration, fps)
+        elif strategy == 'highlights':
+            return self._create_highlight_segments(video_infos, target_duration)
         else:
             return self._create_random_segments(video_infos, target_duration)
     
+    def index_videos(self, video_files, root=None):
+        """把扫描到的视频加入素材目录的关键词索引"""
+        if not video_files or not self.config.get('catalog', 'index_on_scan'):
+            return
+        try:
+            catalog = MediaCatalog(self.config)
+            catalog.index_sources(video_files, root)
+            catalog.close()
+        except Exception as e:
+            print(u"更新素材索引失败: {}".format(str(e)))
+    
+    def filter_by_query(self, video_files, query):
+        """按关键词检索式筛选素材，video_files为空时返回素材目录中所有匹配的视频"""
+        try:
+            catalog = MediaCatalog(self.config)
+            matched = catalog.search(query, video_files or None)
+            catalog.close()
+        except Exception as e:
+            print(u"关键词检索失败，使用全部素材: {}".format(str(e)))
+            return video_files
+        print(u"关键词 \"{}\" 匹配到 {} 个视频".format(query, len(matched)))
+        return matched
+    
+    def create_planner(self, video_infos):
+        """创建片段规划器，启用新鲜度加权时按素材使用历史调整抽取权重"""
+        weights = None
+        if self.config.get('catalog', 'freshness_weighting'):
+            weights = self._freshness_weights(video_infos)
+        planner = SegmentPlanner(self.config, source_weights=weights)
+        self.last_plan_seed = planner.seed
+        return planner
+    
+    def _freshness_weights(self, video_infos):
+        """从素材目录读取新鲜度权重"""
+        try:
+            catalog = MediaCatalog(self.config)
+            weights = catalog.freshness_weights([info['path'] for info in video_infos])
+            catalog.close()
+        except Exception as e:
+            print(u"读取素材使用历史失败，按时长抽取: {}".format(str(e)))
+            weights = None
+        return weights
+    
+    def record_usage(self, segments, output_path):
+        """把已发布视频使用的片段写入素材使用历史"""
+        if not self.config.get('catalog', 'record_usage'):
+            return
+        try:
+            catalog = MediaCatalog(self.config)
+            catalog.record_usage(segments, output_path)
+            catalog.close()
+        except Exception as e:
+            print(u"记录素材使用历史失败: {}".format(str(e)))
+    
     def _create_random_segments(self, video_infos, target_duration):
-        """随机策略创建片段"""
-        segments = []
-        remaining_duration = target_duration
-        min_segment_duration = self.config.get('processing', 'min_segment_duration')
-        
-        # 设置随机种子（如果配置了的话）
-        seed = self.config.get('processing', 'random_seed')
-        if seed is not None:
-            random.seed(seed)
-        
-        video_list = video_infos[:]
-        random.shuffle(video_list)
-        
-        segment_id = 0
-        while remaining_duration > 0:
-            if not video_list:
-                video_list = video_infos[:]
-                random.shuffle(video_list)
-            
-            video_info = video_list.pop(0)
-            video_duration = video_info['duration']
-            
-            # 计算片段时长
-            max_segment_duration = min(remaining_duration, video_duration)
-            if max_segment_duration < min_segment_duration:
-                segment_duration = max_segment_duration
-            else:
-                segment_duration = random.uniform(min_segment_duration, max_segment_duration)
-            
-            # 随机选择起始点
-            if video_duration > segment_duration:
-                max_start = video_duration - segment_duration
-                start_time = random.uniform(0, max_start)
-            else:
-                start_time = 0
-                segment_duration = video_duration
-            
-            segments.append({
-                'id': segment_id,
-                'video_path': video_info['path'],
-                'start_time': start_time,
-                'duration': segment_duration,
-                'video_info': video_info
-            })
-            
-            remaining_duration -= segment_duration
-            segment_id += 1
-        
-        return segments
+        """随机策略创建片段（按时长加权抽取源视频）"""
+        return self.create_planner(video_infos).plan_random(video_infos, target_duration)
     
     def _create_sequential_segments(self, video_infos, target_duration):
         """顺序策略创建片段"""
-        segments = []
-        remaining_duration = target_duration
-        min_segment_duration = self.config.get('processing', 'min_segment_duration')
-        
-        segment_id = 0
-        video_index = 0
-        current_start = 0
-        
-        while remaining_duration > 0:
-            if video_index >= len(video_infos):
-                video_index = 0
-                current_start = 0
-            
-            video_info = video_infos[video_index]
-            video_duration = video_info['duration']
-            
-            # 检查当前视频是否还有可用时长
-            available_duration = video_duration - current_start
-            if available_duration <= 0:
-                video_index += 1
-                current_start = 0
-                continue
-            
-            # 计算片段时长
-            segment_duration = min(remaining_duration, available_duration)
-            if segment_duration < min_segment_duration and remaining_duration > min_segment_duration:
-                video_index += 1
-                current_start = 0
-                continue
-            
-            segments.append({
-                'id': segment_id,
-                'video_path': video_info['path'],
-                'start_time': current_start,
-                'duration': segment_duration,
-                'video_info': video_info
-            })
-            
-            current_start += segment_duration
-            remaining_duration -= segment_duration
-            segment_id += 1
-            
-            # 如果当前视频用完了，移到下一个
-            if current_start >= video_duration:
-                video_index += 1
-                current_start = 0
-        
-        return segments
+        return self.create_planner(video_infos).plan_sequential(video_infos, target_duration)
     
     def _create_balanced_segments(self, video_infos, target_duration):
         """平衡策略创建片段"""
-        # 尝试让每个视频都贡献大致相同的时长
-        segments = []
-        num_videos = len(video_infos)
-        duration_per_video = target_duration / num_videos
-        min_segment_duration = self.config.get('processing', 'min_segment_duration')
-        
-        segment_id = 0
-        for video_info in video_infos:
-            video_duration = video_info['duration']
-            target_from_this_video = duration_per_video
-            
-            # 如果视频太短，就用全部
-            if video_duration <= target_from_this_video:
-                segments.append({
-                    'id': segment_id,
-                    'video_path': video_info['path'],
-                    'start_time': 0,
-                    'duration': video_duration,
-                    'video_info': video_info
-                })
-                segment_id += 1
-            else:
-                # 视频较长，随机选择片段
-                start_time = random.uniform(0, video_duration - target_from_this_video)
-                segments.append({
-                    'id': segment_id,
-                    'video_path': video_info['path'],
-                    'start_time': start_time,
-                    'duration': target_from_this_video,
-                    'video_info': video_info
-                })
-                segment_id += 1
-        
-        # 如果总时长不够，添加更多片段
-        current_total = sum(seg['duration'] for seg in segments)
-        if current_total < target_duration:
-            remaining = target_duration - current_total
-            additional_segments = self._create_random_segments(video_infos, remaining)
-            for seg in additional_segments:
-                seg['id'] = segment_id
-                segment_id += 1
-            segments.extend(additional_segments)
-        
+        return self.create_planner(video_infos).plan_balanced(video_infos, target_duration)
+    
+    def _create_highlight_segments(self, video_infos, target_duration):
+        """精彩集锦策略创建片段（按响度、运动和镜头切换选取得分最高的窗口）"""
+        lookup = HighlightIndex(self.config).build_lookup(video_infos)
+        segments = self.create_planner(video_infos).plan_highlights(video_infos, target_duration, lookup)
+        if not segments:
+            print(u"无法分析精彩片段，改用随机混剪")
+            return self._create_random_segments(video_infos, target_duration)
+        total = sum(segment['duration'] for segment in segments)
+        if total < target_duration - 1e-6:
+            print(u"警告：素材中不重复的精彩片段只有 {:.2f}秒".format(total))
         return segments
+    
+    def _create_constrained_segments(self, video_infos, target_duration, fps=None):
+        """约束策略创建片段（限制单视频片段数、不重复使用时间段、总时长按输出帧率帧精确）"""
+        return self.create_planner(video_infos).plan_constrained(
+            video_infos, target_duration, fps or self.config.get('video', 'default_fps')
+        )
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+语音活动检测模块
+基于帧能量和过零率的流式VAD，用于字幕分段和语音识别分块
+"""
+
+import wave
+from collections import deque
+from itertools import chain
+from config import Config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class VoiceActivityDetector(object):
+    """基于能量和过零率的语音活动检测器"""
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        vad_config = self.config.get('vad') or {}
+        self.frame_ms = vad_config.get('frame_ms', 20)
+        self.energy_margin_db = vad_config.get('energy_margin_db', 10.0)
+        self.hangover_ms = vad_config.get('hangover_ms', 300)
+        self.min_speech_ms = vad_config.get('min_speech_ms', 250)
+        self.min_silence_ms = vad_config.get('min_silence_ms', 300)
+        self.noise_window_ms = vad_config.get('noise_window_ms', 3000)
+        # 清辅音能量低但过零率高，单独放宽能量门限
+        self.unvoiced_margin_db = self.energy_margin_db / 2.0
+        self.unvoiced_zcr = 0.25
+        self.onset_frames = 3
+
+    def is_available(self):
+        """检查NumPy是否可用"""
+        if np is None:
+            print(u"未安装 numpy 库，无法进行语音活动检测")
+            print(u"请执行: pip install numpy")
+            return False
+        return True
+
+    def iter_frames(self, wav_path, block_seconds=1.0):
+        """
+        流式读取WAV文件，按帧输出(能量dB, 过零率)
+
+        每次只读取block_seconds的音频，内存占用与文件长度无关
+        """
+        reader = wave.open(wav_path, 'rb')
+        try:
+            sample_rate = reader.getframerate()
+            channels = reader.getnchannels()
+            sample_width = reader.getsampwidth()
+            if sample_width != 2:
+                raise ValueError(u"仅支持16位PCM音频")
+
+            frame_size = int(sample_rate * self.frame_ms / 1000)
+            block_frames = max(1, int(block_seconds * 1000 / self.frame_ms))
+            leftover = np.zeros(0, dtype=np.float32)
+
+            while True:
+                raw = reader.readframes(frame_size * block_frames)
+                if not raw:
+                    break
+                samples = np.frombuffer(raw, dtype='<i2').astype(np.float32)
+                if channels > 1:
+                    samples = samples.reshape(-1, channels).mean(axis=1)
+                samples = np.concatenate([leftover, samples])
+
+                count = len(samples) // frame_size
+                leftover = samples[count * frame_size:]
+                if count == 0:
+                    continue
+
+                frames = samples[:count * frame_size].reshape(count, frame_size) / 32768.0
+                energy = 10.0 * np.log10((frames ** 2).mean(axis=1) + 1e-10)
+                signs = np.signbit(frames)
+                zcr = (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+                for i in range(count):
+                    yield float(energy[i]), float(zcr[i])
+        finally:
+            reader.close()
+
+    def detect(self, wav_path):
+        """
+        检测语音区间
+
+        噪声底采用最小值统计：取最近noise_window_ms内非语音帧的最低能量，
+        开头一段的噪声底用第一秒帧能量的低分位数初始化
+
+        返回: (intervals, energies)
+        - intervals: [(start_time, end_time), ...]
+        - energies: 每帧能量（dB）数组，供按静音点切分长片段使用
+        """
+        if not self.is_available():
+            return [], None
+
+        frame_seconds = self.frame_ms / 1000.0
+        hangover_frames = int(self.hangover_ms / self.frame_ms)
+        window_frames = max(1, int(self.noise_window_ms / self.frame_ms))
+        warmup_frames = max(1, int(1000 / self.frame_ms))
+
+        frames = self.iter_frames(wav_path)
+        warmup = []
+        for item in frames:
+            warmup.append(item)
+            if len(warmup) >= warmup_frames:
+                break
+        if not warmup:
+            return [], np.zeros(0, dtype=np.float32)
+        initial_floor = float(np.percentile([energy for energy, zcr in warmup], 10))
+
+        energies = []
+        intervals = []
+        # 单调队列维护滑动窗口最小值，每帧均摊O(1)
+        window = deque([(window_frames - 1, initial_floor)])
+        in_speech = False
+        speech_start = 0
+        onset_count = 0
+        hangover = 0
+
+        noise_floor = initial_floor
+
+        for index, (energy, zcr) in enumerate(chain(warmup, frames)):
+            energies.append(energy)
+            # 只用非语音帧更新噪声底，避免长句中噪声底被语音抬高
+            if not in_speech:
+                while window and window[-1][1] >= energy:
+                    window.pop()
+                window.append((index, energy))
+            while window and window[0][0] <= index - window_frames:
+                window.popleft()
+            if window:
+                noise_floor = window[0][1]
+
+            is_voiced = energy > noise_floor + self.energy_margin_db
+            is_unvoiced = (energy > noise_floor + self.unvoiced_margin_db and
+                           zcr > self.unvoiced_zcr)
+            active = is_voiced or is_unvoiced
+
+            if in_speech:
+                if active:
+                    hangover = hangover_frames
+                elif hangover > 0:
+                    hangover -= 1
+                else:
+                    # 拖尾结束，语音段的终点回退到最后一个活动帧
+                    end = index - hangover_frames
+                    intervals.append((speech_start * frame_seconds, end * frame_seconds))
+                    in_speech = False
+                    onset_count = 0
+            else:
+                onset_count = onset_count + 1 if active else 0
+                if onset_count >= self.onset_frames:
+                    in_speech = True
+                    speech_start = index - self.onset_frames + 1
+                    hangover = hangover_frames
+                    # 起始几帧已经是语音，从噪声窗口中移除
+                    while window and window[-1][0] >= speech_start:
+                        window.pop()
+
+        if in_speech:
+            intervals.append((speech_start * frame_seconds, len(energies) * frame_seconds))
+
+        energies = np.array(energies, dtype=np.float32)
+        return self._postprocess(intervals), energies
+
+    def _postprocess(self, intervals):
+        """合并间隔过短的语音段，丢弃过短的片段"""
+        min_silence = self.min_silence_ms / 1000.0
+        min_speech = self.min_speech_ms / 1000.0
+
+        merged = []
+        for start, end in intervals:
+            if merged and start - merged[-1][1] < min_silence:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return [(start, end) for start, end in merged if end - start >= min_speech]
+
+    def split_long_segments(self, intervals, energies, max_duration):
+        """
+        把超过max_duration的语音段在能量最低的帧处切开
+
+        切点限制在片段后半段，避免产生过短的碎片
+        """
+        frame_seconds = self.frame_ms / 1000.0
+        result = []
+        pending = list(intervals)
+        while pending:
+            start, end = pending.pop(0)
+            if end - start <= max_duration or energies is None or len(energies) == 0:
+                result.append((start, end))
+                continue
+
+            search_start = int((start + max_duration * 0.5) / frame_seconds)
+            search_end = min(int((start + max_duration) / frame_seconds), len(energies))
+            if search_end <= search_start:
+                cut = start + max_duration
+            else:
+                quietest = search_start + int(np.argmin(energies[search_start:search_end]))
+                cut = quietest * frame_seconds
+            result.append((start, cut))
+            pending.insert(0, (cut, end))
+        return result
+
+    def speech_segments(self, wav_path, max_duration=None):
+        """
+        检测语音区间，可选按最大时长切分
+
+        返回: [(start_time, end_time), ...]，检测失败返回空列表
+        """
+        try:
+            intervals, energies = self.detect(wav_path)
+        except Exception as e:
+            print(u"语音活动检测失败: {}".format(str(e)))
+            return []
+        if max_duration:
+            intervals = self.split_long_segments(intervals, energies, max_duration)
+        return intervals